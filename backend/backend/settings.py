@@ -103,6 +103,41 @@ DATABASES = {
 }
 
 
+# Caches
+# Per-process by default: the catalog version every derived structure and
+# cache entry is keyed on lives in the database (books.signals), so workers
+# pick up each other's writes within CATALOG_VERSION_CHECK_INTERVAL seconds.
+# "recommendations" holds per-user ranked results; LocMemCache evicts in LRU
+# order once MAX_ENTRIES is reached and expires entries after TIMEOUT seconds.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendations',
+        'TIMEOUT': int(os.getenv('RECOMMENDATION_CACHE_TTL', 15 * 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RECOMMENDATION_CACHE_SIZE', 10000)),
+        },
+    },
+}
+
+# Seconds a worker trusts its copy of the catalog version before re-reading it
+CATALOG_VERSION_CHECK_INTERVAL = float(os.getenv('CATALOG_VERSION_CHECK_INTERVAL', 5))
+
+
+# Approximate nearest-neighbour index, built by `manage.py build_ann_index`
+# and memory-mapped at startup. RECOMMENDATION_ANN_CANDIDATES > 0 makes
+# recommendations use it for candidates instead of the exact full-scan fallback.
+
+ANN_INDEX_DIR = os.getenv('ANN_INDEX_DIR', str(BASE_DIR / 'ann_index'))
+ANN_QUERY_PROBES = int(os.getenv('ANN_QUERY_PROBES', 1))
+RECOMMENDATION_ANN_CANDIDATES = int(os.getenv('RECOMMENDATION_ANN_CANDIDATES', 0))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -0,0 +1,22 @@
+"""
+Settings for local benchmarks: the real settings with a SQLite database in
+place of MongoDB Atlas, so synthetic data never leaves the machine.
+
+    python manage.py migrate --run-syncdb --settings=backend.settings_bench
+    python manage.py generate_synthetic_data --books 100000 --settings=backend.settings_bench
+    python manage.py benchmark_recommendations --settings=backend.settings_bench
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('BENCH_DATABASE', str(BASE_DIR / 'bench.sqlite3')),
+    }
+}
+
+# The books migrations predate saved_book_ids; create tables from the models
+MIGRATION_MODULES = {'books': None}
+
+# Keep a production ANN index out of the measurements unless asked for
+ANN_INDEX_DIR = os.getenv('ANN_INDEX_DIR', str(BASE_DIR / 'bench_ann_index'))
@@ -0,0 +1,259 @@
+"""
+Approximate nearest-neighbour search over book feature vectors.
+
+Books are embedded as weighted, L2-normalized feature vectors (genre one-hot,
+hashed author, hashed language, normalized rating and liked percentage) and
+indexed with random-hyperplane LSH: each of ``tables`` hash tables maps a book
+to the sign pattern of ``bits`` random projections. A query gathers the books
+sharing its bucket in every table (plus, with ``probes=1``, the buckets one bit
+flip away), then reranks only those candidates by exact cosine. More tables
+or probes raise recall at the cost of latency; fewer bits make buckets larger.
+
+The index is built offline by the ``build_ann_index`` management command and
+saved as a directory of ``.npy`` files that are memory-mapped when the books
+app starts, so workers share the pages and startup does not touch the
+database. Books added after the build are not in the index until the next
+run; deleted books are filtered out by callers.
+"""
+import json
+import logging
+import os
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from . import recommender
+from .recommender import top_k
+
+logger = logging.getLogger('books')
+
+AUTHOR_BUCKETS = 32
+LANGUAGE_BUCKETS = 8
+
+# Query-time recall/latency knobs: tables probed (None = all) and whether to
+# also probe the buckets one bit flip away
+QUERY_TABLES = getattr(settings, 'ANN_QUERY_TABLES', None)
+QUERY_PROBES = getattr(settings, 'ANN_QUERY_PROBES', 1)
+
+# Approximate candidates added to a user's recommendation pool; 0 keeps the
+# exact inverted-index path with its full-scan fallback
+RECOMMENDATION_CANDIDATES = getattr(settings, 'RECOMMENDATION_ANN_CANDIDATES', 0)
+
+
+def _bucket(value, buckets):
+    # crc32 rather than hash(): stable across processes and restarts
+    return zlib.crc32(value.encode("utf-8")) % buckets
+
+
+class FeatureSpace:
+    """Maps catalog attributes to fixed-size feature vectors."""
+
+    def __init__(self, genres):
+        self.genres = list(genres)
+        self.genre_index = {g: i for i, g in enumerate(self.genres)}
+        self.dim = len(self.genres) + AUTHOR_BUCKETS + LANGUAGE_BUCKETS + 2
+        self._author_start = len(self.genres)
+        self._language_start = self._author_start + AUTHOR_BUCKETS
+        self._rating_col = self._language_start + LANGUAGE_BUCKETS
+
+    def _fill(self, out, genres, authors, language, rating_norm, liked_norm):
+        cols = [self.genre_index[g] for g in genres if g in self.genre_index]
+        if cols:
+            out[cols] = np.sqrt(recommender.W_FAVORITE_GENRES + recommender.W_SAVED_GENRES) / np.sqrt(len(cols))
+        for author in authors:
+            out[self._author_start + _bucket(author, AUTHOR_BUCKETS)] += np.sqrt(recommender.W_SAVED_AUTHORS)
+        if language:
+            out[self._language_start + _bucket(language, LANGUAGE_BUCKETS)] = np.sqrt(recommender.W_LANGUAGE)
+        out[self._rating_col] = np.sqrt(recommender.W_RATING) * rating_norm
+        out[self._rating_col + 1] = np.sqrt(recommender.W_LIKED) * liked_norm
+        norm = np.linalg.norm(out)
+        if norm:
+            out /= norm
+        return out
+
+    def catalog_vectors(self, catalog):
+        """Feature matrix (one row per catalog row) of a ``CatalogArrays`` snapshot."""
+        n = len(catalog)
+        features = np.zeros((n, self.dim), dtype=np.float32)
+        rows = np.arange(n)
+
+        # Genre columns follow the snapshot's genre_index order
+        cols = [self.genre_index[g] for g in catalog.genre_index]
+        counts = np.maximum(catalog.genre_counts, 1)[:, None]
+        features[:, cols] = catalog.genre_matrix * (
+            np.sqrt(recommender.W_FAVORITE_GENRES + recommender.W_SAVED_GENRES) / np.sqrt(counts)
+        )
+
+        for codes, index, buckets, start, weight in (
+            (catalog.author_codes, catalog.author_index, AUTHOR_BUCKETS, self._author_start,
+             recommender.W_SAVED_AUTHORS),
+            (catalog.language_codes, catalog.language_index, LANGUAGE_BUCKETS, self._language_start,
+             recommender.W_LANGUAGE),
+        ):
+            bucket_of = np.zeros(len(index), dtype=np.int64)
+            for value, code in index.items():
+                bucket_of[code] = _bucket(value, buckets)
+            has = codes >= 0
+            features[rows[has], start + bucket_of[codes[has]]] = np.sqrt(weight)
+
+        features[:, self._rating_col] = np.sqrt(recommender.W_RATING) * catalog.rating_norm
+        features[:, self._rating_col + 1] = np.sqrt(recommender.W_LIKED) * catalog.liked_norm
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        features /= np.where(norms > 0, norms, 1.0)
+        return features
+
+    def profile_vector(self, genres, authors, language):
+        """Query vector for a user: their genres and authors, favouring well-rated books."""
+        out = np.zeros(self.dim, dtype=np.float32)
+        return self._fill(out, set(genres), set(authors), (language or "").strip().lower(), 1.0, 1.0)
+
+
+class AnnIndex:
+    """Random-hyperplane LSH tables over a fixed feature matrix."""
+
+    def __init__(self, ids, features, planes, space):
+        self.ids = ids
+        self.features = features
+        self.planes = planes
+        self.space = space
+        self.tables, self.bits = planes.shape[0], planes.shape[1]
+        codes = self._codes(features)
+        self.order = np.argsort(codes, axis=1, kind="stable")
+        self.sorted_codes = np.take_along_axis(codes, self.order, axis=1)
+
+    @classmethod
+    def build(cls, catalog, tables=8, bits=12, seed=0):
+        space = FeatureSpace(catalog.genre_index)
+        rows = np.flatnonzero(catalog.alive)
+        features = space.catalog_vectors(catalog)[rows]
+        planes = np.random.default_rng(seed).standard_normal((tables, bits, space.dim)).astype(np.float32)
+        return cls(catalog.ids[rows].copy(), features, planes, space)
+
+    def _codes(self, vectors):
+        """(tables, n) integer bucket codes of the rows of ``vectors``."""
+        signs = np.einsum("tbd,nd->tnb", self.planes, vectors) > 0
+        weights = (1 << np.arange(self.bits, dtype=np.int64))
+        return (signs * weights).sum(axis=2)
+
+    def candidates(self, vector, tables=None, probes=0):
+        """Positions of the books sharing a (probed) bucket with ``vector``."""
+        tables = self.tables if tables is None else max(1, min(tables, self.tables))
+        codes = self._codes(vector[None, :])[:, 0]
+        parts = []
+        for t in range(tables):
+            probe_codes = [codes[t]]
+            if probes:
+                probe_codes += [codes[t] ^ (1 << b) for b in range(self.bits)]
+            for code in probe_codes:
+                lo = np.searchsorted(self.sorted_codes[t], code, side="left")
+                hi = np.searchsorted(self.sorted_codes[t], code, side="right")
+                parts.append(self.order[t, lo:hi])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    def query(self, vector, k, tables=None, probes=0, exclude_ids=()):
+        """``(book_id, cosine)`` pairs of the approximate ``k`` nearest books."""
+        positions = self.candidates(vector, tables, probes)
+        if len(exclude_ids):
+            positions = positions[~np.isin(self.ids[positions], list(exclude_ids))]
+        scores = self.features[positions] @ vector
+        picked = top_k(scores, scores, self.ids[positions], k)
+        return [(int(self.ids[positions[i]]), float(scores[i])) for i in picked]
+
+    def exact(self, vector, k, exclude_ids=()):
+        """Brute-force reference used by the benchmark."""
+        scores = self.features @ vector
+        positions = np.arange(len(self.ids))
+        if len(exclude_ids):
+            keep = ~np.isin(self.ids, list(exclude_ids))
+            positions, scores = positions[keep], scores[keep]
+        picked = top_k(scores, scores, self.ids[positions], k)
+        return [(int(self.ids[positions[i]]), float(scores[i])) for i in picked]
+
+    def vector_of(self, book_id):
+        # ids are in catalog order, which is ascending
+        pos = int(np.searchsorted(self.ids, book_id))
+        if pos < len(self.ids) and self.ids[pos] == book_id:
+            return np.asarray(self.features[pos])
+        return None
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        np.save(os.path.join(path, "features.npy"), self.features)
+        np.save(os.path.join(path, "planes.npy"), self.planes)
+        np.save(os.path.join(path, "order.npy"), self.order)
+        np.save(os.path.join(path, "sorted_codes.npy"), self.sorted_codes)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump({"genres": self.space.genres}, fh)
+
+    @classmethod
+    def load(cls, path):
+        def arr(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        index = cls.__new__(cls)
+        index.ids = np.asarray(arr("ids.npy"))
+        index.features = arr("features.npy")
+        index.planes = np.asarray(arr("planes.npy"))
+        index.order = arr("order.npy")
+        index.sorted_codes = arr("sorted_codes.npy")
+        index.space = FeatureSpace(meta["genres"])
+        index.tables, index.bits = index.planes.shape[0], index.planes.shape[1]
+        return index
+
+
+def index_path():
+    return str(getattr(settings, 'ANN_INDEX_DIR', os.path.join(settings.BASE_DIR, 'ann_index')))
+
+
+_index = None
+
+
+def load_index(path=None):
+    """Load the persisted index (called from BooksConfig.ready)."""
+    global _index
+    path = path or index_path()
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        logger.info("ANN index not found at %s; run build_ann_index to create it", path)
+        return None
+    try:
+        _index = AnnIndex.load(path)
+    except (OSError, ValueError, KeyError):
+        logger.exception("Failed to load ANN index from %s", path)
+        _index = None
+    return _index
+
+
+def get_index():
+    return _index
+
+
+def similar(book_id, k):
+    """``(book_id, cosine)`` pairs of the books nearest to ``book_id``; [] when not indexed."""
+    index = _index
+    vector = index.vector_of(book_id) if index is not None else None
+    if vector is None:
+        return []
+    return index.query(vector, k, QUERY_TABLES, QUERY_PROBES, exclude_ids={book_id})
+
+
+def recommendation_candidates(catalog, favorite_genres, saved_ids, preferred_language, n=None):
+    """Catalog rows of the books nearest to a user's profile, or None without an index."""
+    index = _index
+    n = RECOMMENDATION_CANDIDATES if n is None else n
+    if index is None or n <= 0:
+        return None
+    saved_rows = catalog.rows_of(saved_ids)
+    genre_names = list(catalog.genre_index)
+    genres = set(favorite_genres)
+    genres.update(genre_names[c] for c in np.flatnonzero(catalog.genre_matrix[saved_rows].any(axis=0)))
+    author_names = {code: name for name, code in catalog.author_index.items()}
+    authors = {author_names[int(c)] for c in catalog.author_codes[saved_rows] if c >= 0}
+    vector = index.space.profile_vector(genres, authors, preferred_language)
+    neighbours = index.query(vector, n, QUERY_TABLES, QUERY_PROBES, exclude_ids=set(saved_ids))
+    return catalog.rows_of([book_id for book_id, _ in neighbours])
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class BooksConfig(AppConfig):
     name = 'books'
+
+    def ready(self):
+        # Connect catalog_changed receivers of the in-memory indexes
+        from . import recommender, similarity, search, fulltext, fuzzy, facets  # noqa: F401
+
+        # Memory-map the prebuilt ANN index; no database access here
+        from . import ann
+        ann.load_index()
@@ -0,0 +1,263 @@
+"""
+Roaring-style compressed bitmaps of non-negative integers (row numbers).
+
+The 32-bit space is split on the high 16 bits into chunks; each non-empty
+chunk holds a container of its low 16 bits, either a sorted ``uint16`` array
+(at most ``ARRAY_MAX`` values, 2 bytes each) or a fixed 1024-word ``uint64``
+bitmap (8 KiB) for dense chunks. Set operations work chunk by chunk with
+NumPy on whichever representations meet, so sparse and dense sets both stay
+compact and intersections never materialize full row lists.
+"""
+import bisect
+
+import numpy as np
+
+ARRAY_MAX = 4096
+WORDS = 1024
+
+_ONE = np.uint64(1)
+
+
+def _is_bitmap(container):
+    return container.dtype == np.uint64
+
+
+def _lows_to_words(lows):
+    words = np.zeros(WORDS, dtype=np.uint64)
+    np.bitwise_or.at(words, lows >> 6, _ONE << (lows & 63).astype(np.uint64))
+    return words
+
+
+def _words_to_lows(words):
+    bits = np.unpackbits(words.view(np.uint8), bitorder="little")
+    return np.flatnonzero(bits).astype(np.uint16)
+
+
+def _pack(lows):
+    """Best container for the sorted low values ``lows``."""
+    return _lows_to_words(lows) if len(lows) > ARRAY_MAX else lows.astype(np.uint16, copy=False)
+
+
+def _words(container):
+    return container if _is_bitmap(container) else _lows_to_words(container)
+
+
+def _lows(container):
+    return _words_to_lows(container) if _is_bitmap(container) else container
+
+
+def _cardinality(container):
+    return int(np.bitwise_count(container).sum()) if _is_bitmap(container) else len(container)
+
+
+def _contains_lows(words, lows):
+    return ((words[lows >> 6] >> (lows & 63).astype(np.uint64)) & _ONE).astype(bool)
+
+
+def _and(a, b):
+    if _is_bitmap(a) and _is_bitmap(b):
+        words = a & b
+        return words if int(np.bitwise_count(words).sum()) > ARRAY_MAX else _words_to_lows(words)
+    if _is_bitmap(a):
+        return b[_contains_lows(a, b)]
+    if _is_bitmap(b):
+        return a[_contains_lows(b, a)]
+    return np.intersect1d(a, b, assume_unique=True)
+
+
+def _and_cardinality(a, b):
+    if _is_bitmap(a) and _is_bitmap(b):
+        return int(np.bitwise_count(a & b).sum())
+    if _is_bitmap(a):
+        return int(np.count_nonzero(_contains_lows(a, b)))
+    if _is_bitmap(b):
+        return int(np.count_nonzero(_contains_lows(b, a)))
+    return len(np.intersect1d(a, b, assume_unique=True))
+
+
+def _or(a, b):
+    if _is_bitmap(a) or _is_bitmap(b):
+        return _words(a) | _words(b)
+    return _pack(np.union1d(a, b))
+
+
+def _andnot(a, b):
+    if _is_bitmap(a):
+        words = a & ~_words(b)
+        return words if int(np.bitwise_count(words).sum()) > ARRAY_MAX else _words_to_lows(words)
+    if _is_bitmap(b):
+        return a[~_contains_lows(b, a)]
+    return np.setdiff1d(a, b, assume_unique=True)
+
+
+class Bitmap:
+    """Compressed set of row numbers with AND / OR / ANDNOT and in-place add / discard."""
+
+    __slots__ = ("keys", "containers")
+
+    def __init__(self, keys=None, containers=None):
+        self.keys = keys if keys is not None else []
+        self.containers = containers if containers is not None else []
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Bitmap of the (sorted, unique) integer ``rows``."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return cls()
+        keys, starts = np.unique(rows >> 16, return_index=True)
+        ends = np.append(starts[1:], len(rows))
+        containers = [_pack((rows[s:e] & 0xFFFF).astype(np.uint16)) for s, e in zip(starts, ends)]
+        return cls(keys.tolist(), containers)
+
+    @classmethod
+    def union_all(cls, bitmaps):
+        """Union of any number of bitmaps, merged chunk by chunk."""
+        chunks = {}
+        for bitmap in bitmaps:
+            for key, container in zip(bitmap.keys, bitmap.containers):
+                chunks.setdefault(key, []).append(container)
+        keys = sorted(chunks)
+        containers = []
+        for key in keys:
+            parts = chunks[key]
+            if len(parts) == 1:
+                containers.append(parts[0])
+            elif any(_is_bitmap(c) for c in parts) or sum(len(c) for c in parts) > ARRAY_MAX:
+                words = np.zeros(WORDS, dtype=np.uint64)
+                for c in parts:
+                    words |= _words(c)
+                containers.append(words if _cardinality(words) > ARRAY_MAX else _words_to_lows(words))
+            else:
+                containers.append(np.unique(np.concatenate(parts)))
+        return cls(keys, containers)
+
+    def __len__(self):
+        return sum(_cardinality(c) for c in self.containers)
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def __contains__(self, row):
+        i = bisect.bisect_left(self.keys, row >> 16)
+        if i == len(self.keys) or self.keys[i] != row >> 16:
+            return False
+        container, low = self.containers[i], row & 0xFFFF
+        if _is_bitmap(container):
+            return bool((int(container[low >> 6]) >> (low & 63)) & 1)
+        j = np.searchsorted(container, low)
+        return j < len(container) and container[j] == low
+
+    def _merge(self, other, op, keep_left, keep_right):
+        keys, containers = [], []
+        i = j = 0
+        while i < len(self.keys) or j < len(other.keys):
+            a = self.keys[i] if i < len(self.keys) else None
+            b = other.keys[j] if j < len(other.keys) else None
+            if b is None or (a is not None and a < b):
+                if keep_left:
+                    keys.append(a)
+                    containers.append(self.containers[i])
+                i += 1
+            elif a is None or b < a:
+                if keep_right:
+                    keys.append(b)
+                    containers.append(other.containers[j])
+                j += 1
+            else:
+                container = op(self.containers[i], other.containers[j])
+                if len(container) and (not _is_bitmap(container) or container.any()):
+                    keys.append(a)
+                    containers.append(container)
+                i += 1
+                j += 1
+        return Bitmap(keys, containers)
+
+    def __and__(self, other):
+        return self._merge(other, _and, False, False)
+
+    def __or__(self, other):
+        return self._merge(other, _or, True, True)
+
+    def __sub__(self, other):
+        return self._merge(other, _andnot, True, False)
+
+    def intersection_count(self, other):
+        """``len(self & other)`` without building the result."""
+        total = 0
+        for key, container in zip(self.keys, self.containers):
+            j = bisect.bisect_left(other.keys, key)
+            if j < len(other.keys) and other.keys[j] == key:
+                total += _and_cardinality(container, other.containers[j])
+        return total
+
+    def to_rows(self):
+        if not self.keys:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([
+            (key << 16) + _lows(c).astype(np.int64) for key, c in zip(self.keys, self.containers)
+        ])
+
+    def slice(self, start_row=0, skip=0, count=None):
+        """Up to ``count`` rows >= ``start_row`` after skipping ``skip`` of them, in order."""
+        parts, taken = [], 0
+        first = bisect.bisect_left(self.keys, start_row >> 16)
+        for key, container in zip(self.keys[first:], self.containers[first:]):
+            lows = _lows(container).astype(np.int64) + (key << 16)
+            if lows[0] < start_row:
+                lows = lows[np.searchsorted(lows, start_row):]
+            if skip >= len(lows):
+                skip -= len(lows)
+                continue
+            lows = lows[skip:]
+            skip = 0
+            if count is not None:
+                lows = lows[:count - taken]
+            parts.append(lows)
+            taken += len(lows)
+            if count is not None and taken >= count:
+                break
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def add(self, row):
+        key, low = row >> 16, np.uint16(row & 0xFFFF)
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            self.keys.insert(i, key)
+            self.containers.insert(i, np.array([low], dtype=np.uint16))
+            return
+        container = self.containers[i]
+        if _is_bitmap(container):
+            # Copy on write: containers may be shared with bitmaps derived from this one
+            container = container.copy()
+            container[low >> 6] |= _ONE << np.uint64(low & 63)
+            self.containers[i] = container
+            return
+        j = np.searchsorted(container, low)
+        if j < len(container) and container[j] == low:
+            return
+        self.containers[i] = _pack(np.insert(container, j, low))
+
+    def discard(self, row):
+        key, low = row >> 16, np.uint16(row & 0xFFFF)
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return
+        container = self.containers[i]
+        if _is_bitmap(container):
+            container = container.copy()
+            container[low >> 6] &= ~(_ONE << np.uint64(low & 63))
+            if _cardinality(container) <= ARRAY_MAX:
+                container = _words_to_lows(container)
+        else:
+            j = np.searchsorted(container, low)
+            if j < len(container) and container[j] == low:
+                container = np.delete(container, j)
+        if len(container):
+            self.containers[i] = container
+        else:
+            del self.keys[i]
+            del self.containers[i]
+
+    def nbytes(self):
+        return sum(c.nbytes for c in self.containers)
@@ -0,0 +1,151 @@
+"""
+Item-to-item "also saved" co-occurrence counts.
+
+For every book we keep a sparse row of ``{other_book_id: users who saved
+both}``. The matrix is built by streaming ``User.saved_book_ids`` in chunks and
+is updated incrementally by ``toggle_save_book``. Memory is bounded in two
+ways: only the most recent ``MAX_SAVES_PER_USER`` saves of a user form pairs,
+and each row is pruned back to its ``MAX_NEIGHBOURS`` strongest entries once
+it grows past twice that size.
+
+The structure lives in process memory and is rebuilt after ``MAX_AGE``
+seconds so that saves handled by other workers are eventually picked up.
+A rebuild reads the database outside ``_matrix_lock`` while the old matrix
+keeps serving and taking saves, and is swapped in when complete. Saves made
+during the build are not replayed into it: one written before the build read
+that user is already counted, and a later one waits for the next rebuild,
+so no pair is counted twice.
+"""
+import heapq
+import threading
+import time
+
+from .models import User
+
+MAX_SAVES_PER_USER = 200
+MAX_NEIGHBOURS = 200
+MAX_AGE = 6 * 60 * 60
+BUILD_CHUNK_SIZE = 2000
+
+
+class CoSaveMatrix:
+    """Sparse, bounded item x item co-save counts."""
+
+    def __init__(self):
+        self.rows = {}
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_db(cls):
+        matrix = cls()
+        saved_lists = User.objects.values_list('saved_book_ids', flat=True)
+        for saved in saved_lists.iterator(chunk_size=BUILD_CHUNK_SIZE):
+            ids = list(dict.fromkeys(saved or []))[-MAX_SAVES_PER_USER:]
+            for i, a in enumerate(ids):
+                for b in ids[i + 1:]:
+                    matrix._bump(a, b, 1)
+                    matrix._bump(b, a, 1)
+        return matrix
+
+    def _bump(self, a, b, delta):
+        row = self.rows.get(a)
+        if row is None:
+            if delta <= 0:
+                return
+            row = self.rows[a] = {}
+        count = row.get(b, 0) + delta
+        if count > 0:
+            row[b] = count
+        else:
+            row.pop(b, None)
+        if len(row) > 2 * MAX_NEIGHBOURS:
+            keep = heapq.nlargest(MAX_NEIGHBOURS, row.items(), key=lambda kv: kv[1])
+            self.rows[a] = dict(keep)
+
+    def record_save(self, saved_before, book_id):
+        """A user who had ``saved_before`` saved ``book_id``."""
+        for other in list(dict.fromkeys(saved_before))[-MAX_SAVES_PER_USER:]:
+            if other != book_id:
+                self._bump(book_id, other, 1)
+                self._bump(other, book_id, 1)
+
+    def record_unsave(self, saved_after, book_id):
+        """A user removed ``book_id`` and still has ``saved_after`` saved."""
+        for other in list(dict.fromkeys(saved_after))[-MAX_SAVES_PER_USER:]:
+            if other != book_id:
+                self._bump(book_id, other, -1)
+                self._bump(other, book_id, -1)
+
+    def neighbours(self, book_id, limit, exclude=()):
+        """``(other_id, count)`` pairs of the books most often co-saved with ``book_id``."""
+        row = self.rows.get(book_id, {})
+        items = ((b, c) for b, c in row.items() if b not in exclude)
+        return heapq.nsmallest(limit, items, key=lambda kv: (-kv[1], kv[0]))
+
+    def scores_for(self, saved_ids):
+        """Co-save strength of every book with a user's saved books, scaled to [0, 1]."""
+        totals = {}
+        for saved in saved_ids:
+            for other, count in self.rows.get(saved, {}).items():
+                totals[other] = totals.get(other, 0) + count
+        if not totals:
+            return {}
+        top = max(totals.values())
+        return {book_id: count / top for book_id, count in totals.items()}
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+# Held for the whole database read of a rebuild, so only one runs at a time
+_build_lock = threading.Lock()
+
+
+def _stale(matrix):
+    return matrix is None or time.monotonic() - matrix.built_at > MAX_AGE
+
+
+def get_matrix():
+    """Return the co-save matrix, building it on first use or when too old.
+
+    While an old matrix exists, other threads keep using it during a rebuild
+    instead of waiting for it.
+    """
+    global _matrix
+    matrix = _matrix
+    if not _stale(matrix):
+        return matrix
+    if not _build_lock.acquire(blocking=matrix is None):
+        return matrix
+    try:
+        if _stale(_matrix):
+            built = CoSaveMatrix.from_db()
+            with _matrix_lock:
+                _matrix = built
+        return _matrix
+    finally:
+        _build_lock.release()
+
+
+def record_save(saved_before, book_id):
+    # Nothing to update until the matrix is first built from the database
+    with _matrix_lock:
+        if _matrix is not None:
+            _matrix.record_save(saved_before, book_id)
+
+
+def record_unsave(saved_after, book_id):
+    with _matrix_lock:
+        if _matrix is not None:
+            _matrix.record_unsave(saved_after, book_id)
+
+
+def also_saved(book_id, limit, exclude=()):
+    matrix = get_matrix()
+    with _matrix_lock:
+        return matrix.neighbours(book_id, limit, exclude)
+
+
+def co_save_scores(saved_ids):
+    matrix = get_matrix()
+    with _matrix_lock:
+        return matrix.scores_for(saved_ids)
@@ -0,0 +1,104 @@
+"""
+Streaming catalog and user exports for admins.
+
+Rows are read by keyset (``id > last id ORDER BY id LIMIT CHUNK_SIZE``) as
+plain value tuples and encoded one chunk at a time, so an export holds a
+single chunk in memory however many rows it streams. Book CSV columns are
+the ``upload_books_csv_pandas`` import schema, so an export can be
+re-imported as is; NDJSON writes one JSON object per line with the same
+keys (genres as a list).
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Book, User
+
+CHUNK_SIZE = 2000
+FORMATS = ("csv", "ndjson")
+
+BOOK_COLUMNS = (
+    "isbn", "title", "author", "description", "cover_image", "publish_date", "rating", "liked_percentage",
+    "genres", "language", "page_count", "publisher", "download_url", "buy_now_url", "preview_url", "is_free",
+)
+USER_COLUMNS = (
+    "id", "email", "username", "first_name", "last_name", "is_active", "is_admin", "preferred_language",
+    "favorite_genres", "saved_book_ids", "created_at",
+)
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _chunks(queryset, fields):
+    """Rows of ``queryset`` as value tuples (``id`` first), CHUNK_SIZE at a time."""
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by("id").values_list("id", *fields)[:CHUNK_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+
+def _book_chunks():
+    for rows in _chunks(Book.objects.all(), BOOK_COLUMNS):
+        yield [dict(zip(BOOK_COLUMNS, row[1:])) for row in rows]
+
+
+def _user_chunks():
+    fields = tuple(c for c in USER_COLUMNS if c not in ("id", "favorite_genres"))
+    genre_links = User.favorite_genres.through.objects
+    saved_links = User.saved_books.through.objects
+    for rows in _chunks(User.objects.all(), fields):
+        # One query per chunk for the genres, one for legacy saved books
+        ids = [row[0] for row in rows]
+        genre_names, legacy_saved = {}, {}
+        for user_id, name in genre_links.filter(user_id__in=ids).values_list("user_id", "genre__name"):
+            genre_names.setdefault(user_id, []).append(name)
+        for user_id, book_id in saved_links.filter(user_id__in=ids).values_list("user_id", "book_id"):
+            legacy_saved.setdefault(user_id, []).append(book_id)
+        chunk = []
+        for row in rows:
+            user = dict(zip(fields, row[1:]), id=row[0])
+            user["favorite_genres"] = sorted(genre_names.get(row[0], []))
+            user["saved_book_ids"] = list(user["saved_book_ids"] or legacy_saved.get(row[0], []))
+            chunk.append({column: user[column] for column in USER_COLUMNS})
+        yield chunk
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v) for v in value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(columns, chunks):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for chunk in chunks:
+        yield "".join(writer.writerow([_csv_value(row[c]) for c in columns]) for row in chunk)
+
+
+def _encode_ndjson(chunks):
+    encoder = DjangoJSONEncoder()
+    for chunk in chunks:
+        yield "".join(encoder.encode(row) + "\n" for row in chunk)
+
+
+def stream(kind, fmt):
+    """Encoded chunks of the ``books`` or ``users`` export in ``fmt``."""
+    columns, chunks = (BOOK_COLUMNS, _book_chunks()) if kind == "books" else (USER_COLUMNS, _user_chunks())
+    if fmt == "ndjson":
+        return _encode_ndjson(chunks)
+    return _encode_csv(columns, chunks)
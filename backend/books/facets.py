@@ -0,0 +1,382 @@
+"""
+Bitmap-indexed faceted filtering for the book explorer.
+
+Books are numbered by row in id order and every distinct author, genre,
+language, publisher and publication year keeps a compressed ``Bitmap`` of
+its rows. A filter is the bitmap of one facet value (the year; genres, which
+are interned, see ``genres``, are keyed by Genre id and match the id of the
+requested name) or the union of the
+bitmaps of every value containing the needle, case-insensitively as
+``icontains`` did (authors, languages, publishers: only the distinct values
+are scanned, not the books). Filters on different facets are ANDed,
+excluded ids are subtracted, and the page is read straight off the result in
+id order, so keyset and offset paging and the total count come from the
+same bitmap without touching the database until the page's books are
+loaded. Per-facet value counts of each filter combination are computed once
+and cached until the next write. ``catalog_changed`` moves written books
+between bitmaps in place; large writes and ids that would break the row
+order drop the index so it is rebuilt on the next request.
+"""
+import bisect
+import threading
+from array import array
+
+import numpy as np
+from django.dispatch import receiver
+
+from . import genres as genre_names
+from .bitmap import Bitmap
+from .models import Book
+from .recommender import MAX_PATCH_SIZE
+from .signals import catalog_changed, catalog_version
+
+# Facets named after the explore_books query parameters
+SINGLE_FACETS = ("author", "language", "publisher", "published_year")
+FACETS = SINGLE_FACETS + ("genre",)
+
+# Values returned per facet in the facet counts
+FACET_LIMIT = 20
+
+MATCH_CACHE_SIZE = 512
+
+
+def _year(value):
+    return getattr(value, "year", None)
+
+
+def book_values(author, genre_ids, language, publisher, publish_date):
+    """Facet values of a book; empty strings and missing dates have none."""
+    values = {
+        "author": author or None,
+        "language": language or None,
+        "publisher": publisher or None,
+        "published_year": _year(publish_date),
+    }
+    values["genre"] = tuple(sorted({int(g) for g in genre_ids or []}))
+    return values
+
+
+class Facet:
+    """Distinct values of one facet with a row bitmap and a live row count each."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+        self.lowered = []
+        self.bitmaps = []
+        self.sizes = array("q")
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self.lowered.append(str(value).lower())
+            self.bitmaps.append(Bitmap())
+            self.sizes.append(0)
+        return code
+
+    def add(self, code, row):
+        self.bitmaps[code].add(row)
+        self.sizes[code] += 1
+
+    def discard(self, code, row):
+        self.bitmaps[code].discard(row)
+        self.sizes[code] -= 1
+
+    def containing(self, needle):
+        """Union of the bitmaps of the values containing ``needle`` (case-insensitive)."""
+        needle = needle.lower()
+        codes = [c for c, value in enumerate(self.lowered) if needle in value and self.sizes[c]]
+        return Bitmap.union_all(self.bitmaps[c] for c in codes)
+
+    def top(self, counts, limit):
+        """The ``limit`` values with the highest non-zero ``counts``, ties by first seen."""
+        if len(counts) > limit:
+            candidates = np.argpartition(-counts, limit - 1)[:limit]
+            # Values tied with the smallest count kept may have been cut arbitrarily
+            floor = counts[candidates].min()
+            candidates = np.union1d(candidates, np.flatnonzero(counts == floor)) if floor else candidates
+        else:
+            candidates = np.arange(len(counts))
+        candidates = candidates[counts[candidates] > 0]
+        best = candidates[np.lexsort((candidates, -counts[candidates]))][:limit]
+        return [{"value": self.values[c], "count": int(counts[c])} for c in best.tolist()]
+
+
+class FacetIndex:
+    """Per-value row bitmaps of the catalog with AND filtering, paging and counts."""
+
+    version = None
+
+    def __init__(self, rows):
+        # rows: (id, author, genre_ids, language, publisher, publish_date), ordered by id
+        self.ids = array("q")
+        self.row_of = {}
+        self.facets = {name: Facet() for name in FACETS}
+        # Row -> value code of the single-valued facets (-1: none), and genre codes
+        self.row_codes = {name: array("i") for name in SINGLE_FACETS}
+        self.row_genres = []
+        self._matches = {}
+        self._counts = {}
+
+        genre_codes, genre_rows = array("q"), array("q")
+        for book_id, *fields in rows:
+            row = self._append_row(book_id, book_values(*fields))
+            genre_codes.extend(self.row_genres[row])
+            genre_rows.extend([row] * len(self.row_genres[row]))
+        for name in SINGLE_FACETS:
+            codes = np.frombuffer(self.row_codes[name], dtype=np.int32)
+            rows = np.flatnonzero(codes >= 0)
+            self._fill(self.facets[name], codes[rows], rows)
+        self._fill(self.facets["genre"], np.frombuffer(genre_codes, dtype=np.int64),
+                   np.frombuffer(genre_rows, dtype=np.int64))
+        self.all = Bitmap.from_rows(np.arange(len(self.ids)))
+
+    @staticmethod
+    def _fill(facet, codes, rows):
+        """Build the bitmaps of ``facet`` from aligned (code, row) arrays."""
+        order = np.lexsort((rows, codes))
+        codes, rows = codes[order], rows[order]
+        present, starts = np.unique(codes, return_index=True)
+        ends = np.append(starts[1:], len(codes))
+        for code, start, end in zip(present.tolist(), starts, ends):
+            facet.bitmaps[code] = Bitmap.from_rows(rows[start:end])
+            facet.sizes[code] = int(end - start)
+
+    @classmethod
+    def from_db(cls):
+        rows = Book.objects.order_by("id").values_list(
+            "id", "author", "genres", "genre_ids", "language", "publisher", "publish_date"
+        )
+        by_name = {name.lower(): pk for pk, name in genre_names.names().items()}
+
+        def interned(rows):
+            # Books written before genre interning (see the intern_genres command) map by name
+            for book_id, author, names, ids, *rest in rows:
+                if not ids and names:
+                    ids = [by_name[n.lower()] for n in names if isinstance(n, str) and n.lower() in by_name]
+                yield (book_id, author, ids, *rest)
+
+        return cls(interned(rows.iterator(chunk_size=2000)))
+
+    def _append_row(self, book_id, values):
+        """Register a new last row and its value codes; bitmaps are left to the caller."""
+        row = len(self.ids)
+        self.ids.append(book_id)
+        self.row_of[book_id] = row
+        for name in SINGLE_FACETS:
+            value = values[name]
+            self.row_codes[name].append(-1 if value is None else self.facets[name].code(value))
+        self.row_genres.append(tuple(self.facets["genre"].code(g) for g in values["genre"]))
+        return row
+
+    def _unlink(self, row):
+        for name in SINGLE_FACETS:
+            code = self.row_codes[name][row]
+            if code >= 0:
+                self.facets[name].discard(code, row)
+        for code in self.row_genres[row]:
+            self.facets["genre"].discard(code, row)
+
+    def _link(self, row):
+        for name in SINGLE_FACETS:
+            code = self.row_codes[name][row]
+            if code >= 0:
+                self.facets[name].add(code, row)
+        for code in self.row_genres[row]:
+            self.facets["genre"].add(code, row)
+
+    def remove(self, book_id):
+        row = self.row_of.pop(book_id, None)
+        if row is None:
+            return
+        self._unlink(row)
+        for name in SINGLE_FACETS:
+            self.row_codes[name][row] = -1
+        self.row_genres[row] = ()
+        self.all.discard(row)
+        self._matches.clear()
+        self._counts.clear()
+
+    def upsert(self, book):
+        """Index a written book; False when its id would not keep the rows in id order."""
+        values = book_values(book.author, book.genre_ids, book.language, book.publisher, book.publish_date)
+        row = self.row_of.get(book.id)
+        if row is not None:
+            self._unlink(row)
+            for name in SINGLE_FACETS:
+                value = values[name]
+                self.row_codes[name][row] = -1 if value is None else self.facets[name].code(value)
+            self.row_genres[row] = tuple(self.facets["genre"].code(g) for g in values["genre"])
+        elif not self.ids or book.id > self.ids[-1]:
+            row = self._append_row(book.id, values)
+            self.all.add(row)
+        else:
+            return False
+        self._link(row)
+        self._matches.clear()
+        self._counts.clear()
+        return True
+
+    def match(self, name, needle):
+        """Rows whose ``name`` facet matches ``needle``."""
+        key = (name, needle)
+        rows = self._matches.get(key)
+        if rows is None:
+            facet = self.facets[name]
+            if name == "published_year":
+                try:
+                    code = facet.codes.get(int(needle))
+                except ValueError:
+                    code = None
+                rows = facet.bitmaps[code] if code is not None else Bitmap()
+            elif name == "genre":
+                code = facet.codes.get(genre_names.lookup(needle))
+                rows = facet.bitmaps[code] if code is not None else Bitmap()
+            else:
+                rows = facet.containing(needle)
+            if len(self._matches) >= MATCH_CACHE_SIZE:
+                self._matches.clear()
+            self._matches[key] = rows
+        return rows
+
+    def filter(self, filters, exclude_ids=(), only_ids=None):
+        """Rows matching every ``{facet: needle}`` filter, minus the ``exclude_ids`` books.
+
+        ``only_ids`` further restricts the result to those books.
+        """
+        result = self.all
+        for name, needle in filters.items():
+            result = result & self.match(name, needle)
+        if only_ids is not None:
+            result = result & Bitmap.from_rows(self.rows_of(only_ids))
+        if len(exclude_ids):
+            result = result - Bitmap.from_rows(self.rows_of(exclude_ids))
+        return result
+
+    def rows_of(self, book_ids):
+        """Sorted rows of the indexed ``book_ids`` (an id iterable or array)."""
+        if not isinstance(book_ids, np.ndarray):
+            book_ids = np.fromiter(book_ids, dtype=np.int64, count=len(book_ids))
+        ids = np.frombuffer(self.ids, dtype=np.int64)
+        book_ids = np.unique(book_ids)
+        rows = np.searchsorted(ids, book_ids)
+        found = rows < len(ids)
+        found[found] = ids[rows[found]] == book_ids[found]
+        return rows[found]
+
+    def page(self, result, limit, after=None, offset=0):
+        """Book ids of one page of ``result`` in id order, plus whether more follow."""
+        if after is not None:
+            rows = result.slice(start_row=bisect.bisect_right(self.ids, after), count=limit + 1)
+        else:
+            rows = result.slice(skip=offset, count=limit + 1)
+        ids = np.frombuffer(self.ids, dtype=np.int64)[rows[:limit]]
+        return ids.tolist(), len(rows) > limit
+
+    def value_counts(self, name, limit=None):
+        """``[{"value", "count"}]`` of the catalog's ``name`` values, most common first."""
+        facet = self.facets[name]
+        sizes = np.frombuffer(facet.sizes, dtype=np.int64)
+        top = facet.top(sizes, limit or max(len(facet.values), 1))
+        return _genre_labels(top) if name == "genre" else top
+
+    def facet_counts(self, filters, only_ids=None):
+        """Value counts of the books matching ``filters``, cached until the next write.
+
+        Excluded ids are left out: they are books the client already has,
+        not a narrower selection, so the counts stay put while scrolling.
+        ``only_ids`` (the ISBN matches) does narrow the selection; those
+        counts are computed per request and not cached.
+        """
+        if only_ids is not None:
+            return self.counts(self.filter(filters, only_ids=only_ids))
+        key = tuple(sorted(filters.items()))
+        counts = self._counts.get(key)
+        if counts is None:
+            if len(self._counts) >= MATCH_CACHE_SIZE:
+                self._counts.clear()
+            counts = self._counts[key] = self.counts(self.filter(filters), filtered=bool(filters))
+        return counts
+
+    def counts(self, result, filtered=True, limit=FACET_LIMIT):
+        """The ``limit`` most frequent values of every facet within ``result``."""
+        counts = {}
+        if not filtered:
+            for name in FACETS:
+                facet = self.facets[name]
+                counts[name] = facet.top(np.frombuffer(facet.sizes, dtype=np.int64), limit)
+            counts["genre"] = _genre_labels(counts["genre"])
+            return counts
+        rows = result.to_rows()
+        for name in SINGLE_FACETS:
+            facet = self.facets[name]
+            codes = np.frombuffer(self.row_codes[name], dtype=np.int32)[rows]
+            tally = np.bincount(codes[codes >= 0], minlength=len(facet.values))
+            counts[name] = facet.top(tally, limit)
+        genre = self.facets["genre"]
+        tally = np.array([
+            result.intersection_count(bitmap) if size else 0
+            for bitmap, size in zip(genre.bitmaps, genre.sizes)
+        ], dtype=np.int64)
+        counts["genre"] = _genre_labels(genre.top(tally, limit))
+        return counts
+
+
+def _genre_labels(top):
+    """Genre facet counts with the Genre ids replaced by their names."""
+    names = genre_names.names()
+    return [{"value": names.get(row["value"], str(row["value"])), "count": row["count"]} for row in top]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the facet index, building it when missing or stale."""
+    global _index
+    version = catalog_version()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = FacetIndex.from_db()
+                _index.version = version
+            index = _index
+    return index
+
+
+@receiver(catalog_changed)
+def update_index(sender=None, books=(), deleted_ids=(), rebuild=False, **kwargs):
+    """Move the written books between value bitmaps; rebuild after large or out-of-order writes."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            return
+        if rebuild or len(books) + len(deleted_ids) > MAX_PATCH_SIZE:
+            _index = None
+            return
+        for book_id in deleted_ids:
+            _index.remove(book_id)
+        for book in books:
+            if not _index.upsert(book):
+                _index = None
+                return
+        _index.version = catalog_version()
+
+
+def value_counts(name, limit=None):
+    index = get_index()
+    with _index_lock:
+        return index.value_counts(name, limit)
+
+
+def explore(filters, exclude_ids=(), limit=4, after=None, offset=0, only_ids=None):
+    """``(ids, has_more, total_count, facet_counts)`` of one filtered explorer page."""
+    index = get_index()
+    with _index_lock:
+        result = index.filter(filters, exclude_ids, only_ids)
+        ids, has_more = index.page(result, limit, after, offset)
+        return ids, has_more, len(result), index.facet_counts(filters, only_ids)
@@ -0,0 +1,72 @@
+"""
+Filter-options summary of the book explorer, served from memory.
+
+Value counts come from the facet index (see ``facets``), which is built once
+and kept up to date by ``catalog_changed``, and the Genre rows are read once
+per ``genres_version``. The summary is re-derived only when either version
+changes; its ETag is a digest of both, so clients revalidating with
+``If-None-Match`` get a 304 without any work.
+"""
+import hashlib
+import threading
+
+from .facets import value_counts
+from .models import Genre
+from .signals import catalog_version, genres_version
+
+# Authors and publishers listed (the most common ones, alphabetically)
+LIST_LIMIT = 50
+
+_summary = None
+_genres = None
+_lock = threading.Lock()
+
+
+def etag(versions):
+    return '"%s"' % hashlib.sha1(":".join(versions).encode("utf-8")).hexdigest()[:20]
+
+
+def current_etag():
+    return etag((catalog_version(), genres_version()))
+
+
+def _genre_rows(version):
+    global _genres
+    if _genres is None or _genres[0] != version:
+        _genres = (version, [{"id": g.id, "name": g.name} for g in Genre.objects.order_by("name")])
+    return _genres[1]
+
+
+def _build(genres):
+    counts = {name: value_counts(name) for name in ("author", "publisher", "language", "published_year")}
+    genre_counts = {row["value"]: row["count"] for row in value_counts("genre")}
+
+    def common(name):
+        return sorted(row["value"] for row in counts[name][:LIST_LIMIT])
+
+    return {
+        "authors": common("author"),
+        "publishers": common("publisher"),
+        "languages": sorted(row["value"] for row in counts["language"]),
+        "years": sorted((row["value"] for row in counts["published_year"]), reverse=True),
+        "genres": [dict(g, count=genre_counts.get(g["name"], 0)) for g in genres],
+        "counts": {
+            "authors": {row["value"]: row["count"] for row in counts["author"][:LIST_LIMIT]},
+            "publishers": {row["value"]: row["count"] for row in counts["publisher"][:LIST_LIMIT]},
+            "languages": {row["value"]: row["count"] for row in counts["language"]},
+            "years": {row["value"]: row["count"] for row in counts["published_year"]},
+        },
+    }
+
+
+def summary():
+    """``(payload, etag)`` of the current filter options."""
+    global _summary
+    versions = (catalog_version(), genres_version())
+    current = _summary
+    if current is None or current[0] != versions:
+        with _lock:
+            if _summary is None or _summary[0] != versions:
+                _summary = (versions, _build(_genre_rows(versions[1])), etag(versions))
+            current = _summary
+    return current[1], current[2]
@@ -0,0 +1,194 @@
+"""
+BM25 full-text search over title, author, description, genres and publisher.
+
+Each book is tokenized per field (see ``text.tokenize``: lowercase, accents
+stripped, no stemming) and its term frequencies are summed with a per-field
+boost, so a title hit counts more than a description hit (a simple form of
+BM25F). Postings are ``array``-backed (row, weighted tf) lists and every
+row's term ids are kept in CSR arrays so a book can be un-indexed. A query
+only reads the postings of its own terms: scores are accumulated with one
+``bincount`` over the concatenated postings and the best rows picked with
+``top_k``. ``catalog_changed`` re-indexes just the written books; dead
+postings are skipped via the alive mask until enough changes accumulate to
+warrant a rebuild.
+"""
+import math
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+from django.dispatch import receiver
+
+from .models import Book
+from .recommender import MAX_PATCH_SIZE, top_k
+from .signals import catalog_changed, catalog_version
+from .text import Postings, tokenize
+
+FIELD_BOOSTS = {
+    "title": 3.0,
+    "author": 2.0,
+    "genres": 2.0,
+    "publisher": 1.0,
+    "description": 1.0,
+}
+
+# BM25 term-frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+# Rebuild from scratch once this share of the corpus changed incrementally
+REBUILD_FRACTION = 0.1
+
+
+def book_fields(title, author, description, genres, publisher):
+    """Boosted term frequencies of a book's searchable fields."""
+    genre_text = " ".join(g for g in genres or [] if isinstance(g, str))
+    texts = {"title": title, "author": author, "description": description,
+             "genres": genre_text, "publisher": publisher}
+    counts = Counter()
+    for field, text in texts.items():
+        for term in tokenize(text):
+            counts[term] += FIELD_BOOSTS[field]
+    return counts
+
+
+class Bm25Index:
+    """Inverted index of the catalog with BM25 scoring and incremental updates."""
+
+    version = None
+
+    def __init__(self, docs):
+        # docs: iterable of (id, title, author, description, genres, publisher)
+        self.vocab = {}
+        self.df = array("q")
+        self.doc_count = 0
+        self.total_length = 0.0
+        self.changes = 0
+
+        self.row_ids = array("q")
+        self.lengths = array("f")
+        self.alive = bytearray()
+        self.row_of = {}
+        self.indptr = array("q", [0])
+        self.terms = array("q")
+        self.postings = Postings("f")
+
+        for doc in docs:
+            self.upsert_fields(doc[0], book_fields(*doc[1:]))
+        self.changes = 0
+
+    @classmethod
+    def from_db(cls):
+        docs = Book.objects.values_list("id", "title", "author", "description", "genres", "publisher")
+        return cls(docs.iterator(chunk_size=2000))
+
+    def remove(self, book_id):
+        row = self.row_of.pop(book_id, None)
+        if row is None:
+            return
+        self.alive[row] = 0
+        for term_id in self.terms[self.indptr[row]:self.indptr[row + 1]]:
+            self.df[term_id] -= 1
+        self.doc_count -= 1
+        self.total_length -= self.lengths[row]
+        self.changes += 1
+
+    def upsert_fields(self, book_id, counts):
+        self.remove(book_id)
+        row = len(self.row_ids)
+        for term, tf in counts.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                term_id = self.vocab[term] = len(self.vocab)
+                self.df.append(0)
+            self.df[term_id] += 1
+            self.terms.append(term_id)
+            self.postings.add(term_id, row, tf)
+        self.indptr.append(len(self.terms))
+        length = sum(counts.values())
+        self.lengths.append(length)
+        self.row_ids.append(book_id)
+        self.alive.append(1)
+        self.row_of[book_id] = row
+        self.doc_count += 1
+        self.total_length += length
+        self.changes += 1
+
+    def upsert(self, book):
+        self.upsert_fields(book.id, book_fields(book.title, book.author, book.description, book.genres, book.publisher))
+
+    def needs_rebuild(self):
+        return self.changes > max(100, REBUILD_FRACTION * self.doc_count)
+
+    def search(self, query, k):
+        """``(book_id, score)`` pairs of the ``k`` best BM25 matches of ``query``."""
+        if not self.doc_count:
+            return []
+        avg_length = self.total_length / self.doc_count
+        lengths = np.frombuffer(self.lengths, dtype=np.float32)
+        alive = np.frombuffer(self.alive, dtype=np.uint8)
+        rows_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None or not self.df[term_id]:
+                continue
+            rows, tf = self.postings.get(term_id)
+            keep = alive[rows] == 1
+            rows, tf = rows[keep], tf[keep]
+            df = self.df[term_id]
+            idf = math.log(1.0 + (self.doc_count - df + 0.5) / (df + 0.5))
+            norm = K1 * (1.0 - B + B * lengths[rows] / avg_length)
+            rows_parts.append(rows)
+            score_parts.append(idf * tf * (K1 + 1.0) / (tf + norm))
+        if not rows_parts:
+            return []
+        rows, inverse = np.unique(np.concatenate(rows_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        ids = np.frombuffer(self.row_ids, dtype=np.int64)[rows]
+        picked = top_k(scores, scores, ids, k)
+        return [(int(ids[i]), float(scores[i])) for i in picked]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the BM25 index, building it when missing or stale."""
+    global _index
+    version = catalog_version()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = Bm25Index.from_db()
+                _index.version = version
+            index = _index
+    return index
+
+
+@receiver(catalog_changed)
+def update_index(sender=None, books=(), deleted_ids=(), rebuild=False, **kwargs):
+    """Re-index the written books in place."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            return
+        if rebuild or len(books) + len(deleted_ids) > MAX_PATCH_SIZE:
+            _index = None
+            return
+        for book_id in deleted_ids:
+            _index.remove(book_id)
+        for book in books:
+            _index.upsert(book)
+        if _index.needs_rebuild():
+            _index = None
+        else:
+            _index.version = catalog_version()
+
+
+def search(query, k):
+    index = get_index()
+    with _index_lock:
+        return index.search(query, k)
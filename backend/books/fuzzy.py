@@ -0,0 +1,190 @@
+"""
+Typo-tolerant title / author matching with a trigram index.
+
+Every distinct normalized title and author is a "term" with its set of
+trigrams (each word padded as in pg_trgm: two spaces before, one after). A
+trigram -> term ids postings map lets a query count, for each term, how many
+of its own trigrams it shares, reading only the postings of the query's
+trigrams. Matches are ranked by the share of the query's trigrams found in
+the term (so a misspelled surname still matches the full author name) and
+then by trigram Jaccard similarity; ``did_you_mean`` suggests the closest
+whole term.
+"""
+import threading
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.dispatch import receiver
+
+from .models import Book
+from .recommender import MAX_PATCH_SIZE, top_k
+from .signals import catalog_changed, catalog_version
+from .text import TOKEN_RE, normalize
+
+THRESHOLD = getattr(settings, 'SEARCH_FUZZY_THRESHOLD', 0.4)
+# Lowest ``?threshold=`` accepted: below it almost every term sharing one
+# trigram with the query matches and has to be ranked
+MIN_THRESHOLD = 0.2
+
+# Rebuild from scratch once this share of the catalog changed incrementally
+REBUILD_FRACTION = 0.1
+
+
+def trigrams(text):
+    grams = set()
+    for word in TOKEN_RE.findall(normalize(text)):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Trigram postings over the distinct titles and authors of the catalog."""
+
+    version = None
+
+    def __init__(self, rows):
+        # rows: (id, title, author)
+        self.term_ids = {}
+        self.display = []
+        self.gram_counts = array("q")
+        self.term_books = []
+        # Books per term, mirrored in an array so matching can mask dead terms
+        self.term_live = array("q")
+        self.postings = {}
+        self.books = {}
+        self.changes = 0
+        for book_id, title, author in rows:
+            self._add(book_id, title, author)
+
+    @classmethod
+    def from_db(cls):
+        rows = Book.objects.values_list("id", "title", "author")
+        return cls(rows.iterator(chunk_size=2000))
+
+    def _term(self, text):
+        key = " ".join(TOKEN_RE.findall(normalize(text)))
+        if not key:
+            return None
+        term_id = self.term_ids.get(key)
+        if term_id is None:
+            term_id = self.term_ids[key] = len(self.display)
+            grams = trigrams(key)
+            self.display.append(text.strip())
+            self.gram_counts.append(len(grams))
+            self.term_books.append(set())
+            self.term_live.append(0)
+            for gram in grams:
+                self.postings.setdefault(gram, array("q")).append(term_id)
+        return term_id
+
+    def _add(self, book_id, title, author):
+        terms = {t for t in (self._term(title), self._term(author)) if t is not None}
+        for term_id in terms:
+            self.term_books[term_id].add(book_id)
+            self.term_live[term_id] = len(self.term_books[term_id])
+        self.books[book_id] = terms
+
+    def remove(self, book_id):
+        # Terms left without books stay in the postings and are skipped
+        for term_id in self.books.pop(book_id, ()):
+            self.term_books[term_id].discard(book_id)
+            self.term_live[term_id] = len(self.term_books[term_id])
+        self.changes += 1
+
+    def upsert(self, book):
+        self.remove(book.id)
+        self._add(book.id, book.title, book.author)
+
+    def needs_rebuild(self):
+        return self.changes > max(100, REBUILD_FRACTION * len(self.books))
+
+    def _matches(self, query, threshold):
+        """(term ids, coverage, jaccard) of live terms covering >= threshold of the query."""
+        query_grams = trigrams(query)
+        grams = [g for g in query_grams if g in self.postings]
+        total = len(query_grams)
+        if not grams or not total:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        # Only the hit terms are counted and checked, not the whole vocabulary
+        hits = np.concatenate([np.frombuffer(self.postings[g], dtype=np.int64) for g in grams])
+        terms, shared = np.unique(hits, return_counts=True)
+        keep = shared >= threshold * total
+        terms, shared = terms[keep], shared[keep]
+        keep = np.frombuffer(self.term_live, dtype=np.int64)[terms] > 0
+        terms, shared = terms[keep], shared[keep]
+        counts = np.frombuffer(self.gram_counts, dtype=np.int64)[terms]
+        return terms, shared / total, shared / (total + counts - shared)
+
+    def search(self, query, limit, threshold=THRESHOLD):
+        """Ids of the books whose title or author best matches ``query``."""
+        terms, coverage, jaccard = self._matches(query, threshold)
+        # Walk terms best first; a book's rank is that of its best term
+        result, seen = [], set()
+        for i in top_k(coverage, jaccard, terms, len(terms)):
+            for book_id in sorted(self.term_books[terms[i]]):
+                if book_id not in seen:
+                    seen.add(book_id)
+                    result.append(book_id)
+            if len(result) >= limit:
+                break
+        return result[:limit]
+
+    def suggest(self, query, threshold=THRESHOLD):
+        """The indexed title or author closest to ``query``, or None."""
+        terms, coverage, jaccard = self._matches(query, threshold)
+        if not len(terms):
+            return None
+        best = top_k(jaccard, coverage, terms, 1)[0]
+        return self.display[terms[best]]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the trigram index, building it when missing or stale."""
+    global _index
+    version = catalog_version()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = TrigramIndex.from_db()
+                _index.version = version
+            index = _index
+    return index
+
+
+@receiver(catalog_changed)
+def update_index(sender=None, books=(), deleted_ids=(), rebuild=False, **kwargs):
+    """Re-index the written books' titles and authors in place."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            return
+        if rebuild or len(books) + len(deleted_ids) > MAX_PATCH_SIZE:
+            _index = None
+            return
+        for book_id in deleted_ids:
+            _index.remove(book_id)
+        for book in books:
+            _index.upsert(book)
+        if _index.needs_rebuild():
+            _index = None
+        else:
+            _index.version = catalog_version()
+
+
+def fuzzy_search(query, limit, threshold=THRESHOLD):
+    index = get_index()
+    with _index_lock:
+        return index.search(query, limit, threshold)
+
+
+def did_you_mean(query, threshold=THRESHOLD):
+    index = get_index()
+    with _index_lock:
+        return index.suggest(query, threshold)
@@ -0,0 +1,92 @@
+"""
+Genre interning: book genre names are mapped to ``Genre`` rows on write.
+
+Every write path (add / edit book, CSV import, ``populate_db`` and the
+``intern_genres`` backfill) passes its genre names through ``intern_genres``,
+which matches them case-insensitively to existing genres, creates the
+missing ones, and returns the canonical names with their ids. Books then
+store both ``genres`` (canonical names) and ``genre_ids``; the explorer's
+genre facet is keyed by those ids, so a genre filter is the exact id of the
+requested name (``lookup``) instead of a substring scan. The name -> genre
+map is loaded once per ``genres_version``.
+"""
+import re
+import threading
+
+from .models import Genre
+from .signals import genres_version, notify_genres_changed
+
+_SPACES = re.compile(r"\s+")
+
+_genres = None
+_lock = threading.Lock()
+
+
+def clean(names):
+    """Trimmed, de-duplicated (case-insensitively) genre names, in order."""
+    seen, result = set(), []
+    for name in names or []:
+        if not isinstance(name, str):
+            continue
+        name = _SPACES.sub(" ", name).strip()[:Genre._meta.get_field("name").max_length]
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            result.append(name)
+    return result
+
+
+def _by_key():
+    """Lowercased name -> (id, name) of every Genre row."""
+    global _genres
+    version = genres_version()
+    if _genres is None or _genres[0] != version:
+        _genres = (version, {name.lower(): (pk, name) for pk, name in Genre.objects.values_list("id", "name")})
+    return _genres[1]
+
+
+def intern_many(name_lists, create=True):
+    """``(names, ids)`` for each list of genre names, creating missing genres.
+
+    With ``create=False`` nothing is written: missing genres keep their name
+    and get a None id.
+    """
+    global _genres
+    name_lists = [clean(names) for names in name_lists]
+    with _lock:
+        by_key = _by_key()
+        missing = {n.lower(): n for names in name_lists for n in names if n.lower() not in by_key}
+        if missing and not create:
+            by_key = {**by_key, **{key: (None, name) for key, name in missing.items()}}
+        elif missing:
+            for name in missing.values():
+                genre, _ = Genre.objects.get_or_create(name__iexact=name, defaults={"name": name})
+                by_key[name.lower()] = (genre.id, genre.name)
+            notify_genres_changed()
+            _genres = (genres_version(), by_key)
+    result = []
+    for names in name_lists:
+        pairs = [by_key[n.lower()] for n in names]
+        result.append(([name for _, name in pairs], [pk for pk, _ in pairs]))
+    return result
+
+
+def intern_genres(names):
+    """``{"genres": names, "genre_ids": ids}`` of one book's genre names, for saving."""
+    names, ids = intern_many([names])[0]
+    return {"genres": names, "genre_ids": ids}
+
+
+def names():
+    """Genre id -> name of every Genre row."""
+    with _lock:
+        return {pk: name for pk, name in _by_key().values()}
+
+
+def lookup(name):
+    """Id of the genre called ``name`` (case-insensitive), or None."""
+    names = clean([name])
+    if not names:
+        return None
+    with _lock:
+        found = _by_key().get(names[0].lower())
+    return found[0] if found else None
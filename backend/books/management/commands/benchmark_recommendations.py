@@ -0,0 +1,102 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from books import recommender
+from books.models import User
+from books.views import recommended_books
+import numpy as np
+import time
+import tracemalloc
+
+
+def _mb(size):
+    return size / (1024 * 1024)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark GET /books/recommended/: latency percentiles, peak memory and queries per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='',
+                            help='Comma-separated catalog sizes; each one flushes the database and '
+                                 'generates a synthetic catalog first (SQLite only). '
+                                 'Default: benchmark the current data')
+        parser.add_argument('--users', type=int, default=2000, help='Synthetic users per size')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per size')
+        parser.add_argument('--memory-requests', type=int, default=20,
+                            help='Requests replayed under tracemalloc for the per-request peak')
+        parser.add_argument('--limit', type=int, default=recommender.MAX_RECOMMENDATIONS)
+        parser.add_argument('--warm', action='store_true',
+                            help='Keep the per-user result cache between requests (default: cold)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        if sizes and connection.vendor != 'sqlite':
+            raise CommandError("--sizes flushes the database; run with --settings=backend.settings_bench")
+
+        self.stdout.write(
+            f"{'books':>9} {'build s':>8} {'build MB':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'req MB':>7} {'queries':>8}"
+        )
+        for size in sizes or [None]:
+            if size is not None:
+                call_command('flush', interactive=False, verbosity=0)
+                call_command('generate_synthetic_data', books=size, users=options['users'],
+                             seed=options['seed'], verbosity=0)
+            self._run(options)
+
+    def _run(self, options):
+        rng = np.random.default_rng(options['seed'])
+        user_ids = np.array(User.objects.values_list('id', flat=True))
+        if not len(user_ids):
+            raise CommandError("No users to benchmark; run generate_synthetic_data first")
+        picked = rng.choice(user_ids, size=options['requests'])
+        users = User.objects.in_bulk(set(picked.tolist()))
+        factory = APIRequestFactory()
+        cache = caches['recommendations']
+
+        def request(user_id):
+            if not options['warm']:
+                cache.clear()
+            req = factory.get('/api/books/recommended/', {'limit': options['limit']})
+            force_authenticate(req, user=users[user_id])
+            response = recommended_books(req)
+            if response.status_code != 200:
+                raise CommandError(f"Request for user {user_id} returned {response.status_code}")
+
+        # Catalog snapshot build, measured on its own (it is paid once per process)
+        recommender._catalog = None
+        cache.clear()
+        tracemalloc.start()
+        started = time.perf_counter()
+        catalog = recommender.get_catalog()
+        build_s = time.perf_counter() - started
+        build_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # Latency and query counts without tracemalloc overhead
+        timings, queries = [], []
+        for user_id in picked.tolist():
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                request(user_id)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+
+        request_peak = 0
+        tracemalloc.start()
+        for user_id in picked[:options['memory_requests']].tolist():
+            tracemalloc.reset_peak()
+            request(user_id)
+            request_peak = max(request_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+        self.stdout.write(
+            f"{len(catalog):>9} {build_s:>8.2f} {_mb(build_peak):>9.1f} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} "
+            f"{_mb(request_peak):>7.2f} {np.mean(queries):>8.1f}"
+        )
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from books import fuzzy, search
+from books.models import Book
+import numpy as np
+import time
+
+
+def _typo(text, rng):
+    """``text`` with one character dropped, doubled or swapped with its neighbour."""
+    if len(text) < 3:
+        return text
+    i = int(rng.integers(1, len(text) - 1))
+    kind = rng.integers(3)
+    if kind == 0:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i] + text[i] + text[i:]
+    return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+
+
+class Command(BaseCommand):
+    help = 'Compare latency of prefix search (database and in-memory index) with trigram fuzzy search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--threshold', type=float, default=fuzzy.THRESHOLD)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        sample = list(Book.objects.values_list('id', 'title', 'author').order_by('?')[:options['queries']])
+        if not sample:
+            raise CommandError("No books to search; run generate_synthetic_data first")
+        limit = options['limit']
+        # Typed prefixes as sent while typing, and misspelled full titles / authors
+        prefixes = [(book_id, (title if rng.random() < 0.5 else author)[:int(rng.integers(2, 8))])
+                    for book_id, title, author in sample]
+        typos = [(book_id, _typo(title if rng.random() < 0.5 else author, rng))
+                 for book_id, title, author in sample]
+
+        started = time.perf_counter()
+        search.get_index()
+        fuzzy.get_index()
+        self.stdout.write(f"Indexes built in {time.perf_counter() - started:.2f}s")
+
+        # Same ranking and limit as the index, so "found" compares like with like
+        def db_prefix(query):
+            books = Book.objects.filter(Q(title__istartswith=query) | Q(author__istartswith=query))
+            books = books.order_by('-rating', '-liked_percentage', 'id')[:limit]
+            return list(books.values_list('id', flat=True))
+
+        runs = [
+            ('prefix (database)', prefixes, db_prefix),
+            ('prefix (index)', prefixes, lambda q: search.prefix_search(q, limit)),
+            ('fuzzy, typed prefix', prefixes, lambda q: fuzzy.fuzzy_search(q, limit, options['threshold'])),
+            ('fuzzy, one typo', typos, lambda q: fuzzy.fuzzy_search(q, limit, options['threshold'])),
+            ('prefix (index), one typo', typos, lambda q: search.prefix_search(q, limit)),
+        ]
+        # found: share of queries whose sampled book is among the first ``limit`` results
+        self.stdout.write(f"{'mode':<26} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'found':>6}")
+        for name, queries, run in runs:
+            timings, found = [], 0
+            for book_id, query in queries:
+                started = time.perf_counter()
+                ids = run(query)
+                timings.append((time.perf_counter() - started) * 1000)
+                found += book_id in ids
+            p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+            self.stdout.write(f"{name:<26} {p50:>8.3f} {p95:>8.3f} {p99:>8.3f} {found / len(queries):>6.0%}")
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from books import ann, recommender
+import numpy as np
+import time
+
+
+class Command(BaseCommand):
+    help = 'Build the approximate nearest-neighbour index of book feature vectors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tables', type=int, default=8, help='Number of LSH hash tables')
+        parser.add_argument('--bits', type=int, default=12, help='Hyperplanes (hash bits) per table')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help='Index directory (default: ANN_INDEX_DIR)')
+        parser.add_argument('--evaluate', action='store_true',
+                            help='Report recall@k and latency against exact search')
+        parser.add_argument('--queries', type=int, default=200, help='Query books sampled by --evaluate')
+        parser.add_argument('-k', type=int, default=10)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        catalog = recommender.CatalogArrays.from_db()
+        self.stdout.write(f"Catalog: {len(catalog)} books in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        index = ann.AnnIndex.build(catalog, tables=options['tables'], bits=options['bits'], seed=options['seed'])
+        path = options['output'] or ann.index_path()
+        index.save(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index.ids)} books ({index.features.shape[1]} dims, {index.tables} tables x "
+            f"{index.bits} bits) in {time.perf_counter() - started:.2f}s -> {path}"
+        ))
+
+        if options['evaluate'] and len(index.ids):
+            self._evaluate(index, options['queries'], options['k'], options['seed'])
+
+    def _evaluate(self, index, queries, k, seed):
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(index.ids), size=min(queries, len(index.ids)), replace=False)
+        vectors = [(int(index.ids[i]), np.asarray(index.features[i])) for i in sample]
+
+        started = time.perf_counter()
+        truth = [{bid for bid, _ in index.exact(v, k, exclude_ids={book_id})} for book_id, v in vectors]
+        exact_ms = (time.perf_counter() - started) * 1000 / len(vectors)
+        self.stdout.write(f"exact: {exact_ms:.2f} ms/query")
+
+        self.stdout.write(f"{'tables':>6} {'probes':>6} {'recall@' + str(k):>10} {'candidates':>10} {'ms/query':>9}")
+        for tables in sorted({1, max(1, index.tables // 2), index.tables}):
+            for probes in (0, 1):
+                hits = candidates = 0
+                started = time.perf_counter()
+                for (book_id, vector), expected in zip(vectors, truth):
+                    found = index.query(vector, k, tables, probes, exclude_ids={book_id})
+                    hits += len(expected & {bid for bid, _ in found})
+                elapsed = time.perf_counter() - started
+                for book_id, vector in vectors:
+                    candidates += len(index.candidates(vector, tables, probes))
+                total = sum(len(t) for t in truth) or 1
+                self.stdout.write(
+                    f"{tables:>6} {probes:>6} {hits / total:>10.3f} {candidates / len(vectors):>10.0f} "
+                    f"{elapsed * 1000 / len(vectors):>9.2f}"
+                )
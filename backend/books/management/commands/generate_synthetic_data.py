@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from books import synthetic
+import numpy as np
+import time
+
+
+class Command(BaseCommand):
+    help = 'Insert a synthetic catalog and users for local benchmarks (SQLite only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--genres', type=int, default=30, help='Distinct genres in the catalog')
+        parser.add_argument('--genre-skew', type=float, default=1.0,
+                            help='Zipf exponent of genre popularity (0 = uniform)')
+        parser.add_argument('--popularity-skew', type=float, default=1.0,
+                            help='Zipf exponent of how often each book is saved (0 = uniform)')
+        parser.add_argument('--mean-saves', type=float, default=8, help='Mean saved books per user')
+        parser.add_argument('--max-saves', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Never write a million fake rows into the production database
+        if connection.vendor != 'sqlite':
+            raise CommandError("Refusing to generate synthetic data outside SQLite; "
+                               "use --settings=backend.settings_bench")
+
+        started = time.perf_counter()
+        synthetic.create_catalog(
+            options['books'], options['users'], np.random.default_rng(options['seed']),
+            genre_count=options['genres'], genre_skew=options['genre_skew'],
+            popularity_skew=options['popularity_skew'], mean_saves=options['mean_saves'],
+            max_saves=options['max_saves'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Generated {options['books']} books and {options['users']} users "
+                f"in {time.perf_counter() - started:.1f}s"
+            ))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from books.genres import intern_many
+from books.models import Book
+from books.signals import notify_catalog_changed
+from django.utils import timezone
+import time
+
+
+class Command(BaseCommand):
+    help = "Backfill Book.genre_ids: map every book's genre names to Genre rows, creating missing ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Books read and updated per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the books that would change and list the genres that would be '
+                                 'created, without writing')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        dry_run = options['dry_run']
+        started = time.perf_counter()
+        scanned = changed = 0
+        last_id = 0
+        new_genres = {}
+        while True:
+            # Keyset batches: id > last id, so each read costs the same however far in
+            books = list(Book.objects.filter(id__gt=last_id).order_by('id')
+                         .only('id', 'genres', 'genre_ids')[:batch_size])
+            if not books:
+                break
+            last_id = books[-1].id
+            scanned += len(books)
+            interned = intern_many((book.genres for book in books), create=not dry_run)
+            updates = []
+            now = timezone.now()
+            for book, (names, ids) in zip(books, interned):
+                new_genres.update((name.lower(), name) for name, pk in zip(names, ids) if pk is None)
+                if book.genres != names or book.genre_ids != ids:
+                    # bulk_update skips auto_now
+                    book.genres, book.genre_ids, book.updated_at = names, ids, now
+                    updates.append(book)
+            changed += len(updates)
+            if updates and not dry_run:
+                Book.objects.bulk_update(updates, ['genres', 'genre_ids', 'updated_at'])
+            self.stdout.write(f"{scanned} books scanned, {changed} {'to update' if dry_run else 'updated'}")
+
+        if dry_run and new_genres:
+            self.stdout.write(f"Genres that would be created: {', '.join(sorted(new_genres.values()))}")
+        if changed and not dry_run:
+            # Interning can rename genres (canonical casing), so rebuild every index
+            notify_catalog_changed(rebuild=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.perf_counter() - started:.1f}s: {changed} of {scanned} books "
+            f"{'would change' if dry_run else 'updated'}"
+        ))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 import pandas as pd
 from books.models import Book, Genre
+from books.genres import intern_genres
 import ast
 import os
 
@@ -64,7 +65,7 @@ class Command(BaseCommand):
                         "publish_date": publish_date,
                         "rating": row['rating'],
                         "liked_percentage": liked_percentage,
-                        "genres": genres,  # list of genre names
+                        **intern_genres(genres),  # canonical genre names and their ids
                         "language": row['language'],
                         "page_count": row['page_count'],
                         "publisher": row['publisher'],
@@ -0,0 +1,112 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from books import recommender, cooccurrence
+from books.models import User, PrecomputedRecommendation
+import multiprocessing
+import os
+import time
+
+# Set before the pool forks so workers inherit the catalog arrays copy-on-write
+_catalog = None
+_co_saves = None
+_top_n = recommender.MAX_RECOMMENDATIONS
+
+
+def _score_chunk(chunk):
+    """Rank books for a chunk of (user_id, fingerprint, favorite_genres, saved_ids, language)."""
+    results = []
+    for user_id, fingerprint, favorite_genres, saved_ids, language in chunk:
+        co_saved = _co_saves.scores_for(saved_ids) if _co_saves is not None and saved_ids else None
+        book_ids = recommender.recommend(_catalog, favorite_genres, saved_ids, language, _top_n, co_saved=co_saved)
+        results.append((user_id, fingerprint, book_ids))
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Precompute top-N recommendations for every user (nightly batch)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes (default: CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Users scored and written per task')
+        parser.add_argument('--top-n', type=int, default=recommender.MAX_RECOMMENDATIONS,
+                            help='Book ids stored per user')
+
+    def handle(self, *args, **options):
+        global _catalog, _co_saves, _top_n
+        workers = max(1, options['workers'])
+        chunk_size = max(1, options['chunk_size'])
+        _top_n = max(1, options['top_n'])
+
+        started = time.perf_counter()
+        self.stdout.write("Loading catalog...")
+        _catalog = recommender.CatalogArrays.from_db()
+        self.stdout.write(f"Catalog: {len(_catalog)} books in {time.perf_counter() - started:.2f}s")
+        if recommender.W_ALSO_SAVED:
+            self.stdout.write("Building co-save matrix...")
+            _co_saves = cooccurrence.CoSaveMatrix.from_db()
+
+        # Favorite genres for every user in a single query
+        favorites = {}
+        through = User.favorite_genres.through
+        for user_id, name in through.objects.values_list('user_id', 'genre__name'):
+            favorites.setdefault(user_id, set()).add(name)
+
+        users = User.objects.only('id', 'saved_book_ids', 'preferred_language', 'updated_at').order_by('id')
+        tasks = self._chunks(users, favorites, chunk_size)
+
+        # Workers only touch the catalog arrays, never the database
+        connections.close_all()
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            pool = multiprocessing.get_context('fork').Pool(workers)
+            results = pool.imap_unordered(_score_chunk, tasks)
+        else:
+            pool = None
+            results = map(_score_chunk, tasks)
+
+        scoring_started = time.perf_counter()
+        total = 0
+        try:
+            for chunk in results:
+                self._store(chunk)
+                total += len(chunk)
+                elapsed = time.perf_counter() - scoring_started
+                self.stdout.write(f"{total} users ({total / elapsed:.1f} users/s)")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        elapsed = time.perf_counter() - scoring_started
+        rate = total / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Precomputed recommendations for {total} users in {elapsed:.2f}s "
+            f"({rate:.1f} users/s, {workers} workers, chunk size {chunk_size})"
+        ))
+
+    def _chunks(self, users, favorites, chunk_size):
+        chunk = []
+        for user in users.iterator(chunk_size=chunk_size):
+            chunk.append((
+                user.id,
+                recommender.user_fingerprint(user),
+                favorites.get(user.id, set()),
+                set(user.saved_book_ids or []),
+                (user.preferred_language or '').strip().lower(),
+            ))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _store(self, chunk):
+        now = timezone.now()
+        user_ids = [user_id for user_id, _, _ in chunk]
+        PrecomputedRecommendation.objects.filter(user_id__in=user_ids).delete()
+        PrecomputedRecommendation.objects.bulk_create([
+            PrecomputedRecommendation(user_id=user_id, fingerprint=fingerprint, book_ids=book_ids, computed_at=now)
+            for user_id, fingerprint, book_ids in chunk
+        ])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from books import timeseries
+import time
+
+
+class Command(BaseCommand):
+    help = "Write the per-day growth buckets served by dashboard/timeseries/ (run hourly or nightly)"
+
+    def add_arguments(self, parser):
+        # Yesterday is included so a nightly run finalizes the hours after the last run that day
+        parser.add_argument('--days', type=int, default=2,
+                            help='Days rolled up, ending today (default: yesterday and today; '
+                                 'use a large value once to backfill)')
+
+    def handle(self, *args, **options):
+        days = max(1, options['days'])
+        started = time.perf_counter()
+        rows = timeseries.rollup(days)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {len(rows)} day(s) from {rows[0].day} in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:00
+
+import books.fields
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_passwordresetotp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(unique=True)),
+                ('book_ids', books.fields.DjongoJSONField(default=list)),
+                ('fingerprint', models.CharField(default='', max_length=40)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_precomputedrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchQueryCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=100)),
+                ('day', models.DateField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('query', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:00
+
+import books.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_searchquerycount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='genre_ids',
+            field=books.fields.DjongoJSONField(default=list),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_book_genre_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('books_added', models.IntegerField(default=0)),
+                ('users_registered', models.IntegerField(default=0)),
+                ('total_books', models.IntegerField(default=0)),
+                ('total_users', models.IntegerField(default=0)),
+                ('avg_rating', models.FloatField(default=0.0)),
+                ('total_saves', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -117,6 +117,9 @@ class Book(models.Model):
     rating = models.FloatField(default=0.0)
     liked_percentage = models.FloatField(default=0.0)
     genres = DjongoJSONField(default=list)    
+    # Genre row ids of ``genres``, kept in sync by books.genres.intern_genres;
+    # the explorer's genre facet is keyed by them (see books.facets)
+    genre_ids = DjongoJSONField(default=list)
     language = models.CharField(max_length=50, default="English")
     page_count = models.IntegerField(default=0)
     is_free = models.BooleanField(default=False)
@@ -130,3 +133,55 @@ class Book(models.Model):
 
     def __str__(self):
         return f"{self.title} by {self.author}"
+
+
+class PrecomputedRecommendation(models.Model):
+    """Top-N book ids for a user, written by the precompute_recommendations command."""
+    user_id = models.BigIntegerField(unique=True)
+    book_ids = DjongoJSONField(default=list)
+    # Hash of the user inputs the ranking was computed from (see recommender.user_fingerprint)
+    fingerprint = models.CharField(max_length=40, default="")
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Recommendations for user {self.user_id}"
+
+
+class SearchQueryCount(models.Model):
+    """Per-day search counts of the heavy-hitter queries, flushed periodically by books.trending."""
+    query = models.CharField(max_length=100)
+    day = models.DateField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = [("query", "day")]
+
+    def __str__(self):
+        return f"{self.query} on {self.day} ({self.count})"
+
+
+class DailyStats(models.Model):
+    """Per-day catalog and user growth bucket, written by the rollup_daily_stats command."""
+    day = models.DateField(unique=True)
+    books_added = models.IntegerField(default=0)
+    users_registered = models.IntegerField(default=0)
+    # Totals and average rating of the books / users created up to the end of the day
+    total_books = models.IntegerField(default=0)
+    total_users = models.IntegerField(default=0)
+    avg_rating = models.FloatField(default=0.0)
+    # Saved ids over all users when the day was last rolled up (None: not measured that day)
+    total_saves = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.day}"
+
+
+class VersionToken(models.Model):
+    """Shared version token of a derived structure (see books.signals), replaced on every write."""
+    key = models.CharField(max_length=50, unique=True)
+    token = models.CharField(max_length=32)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key}: {self.token}"
@@ -0,0 +1,84 @@
+"""
+Database-side paging for the book listings.
+
+Pages are read with ``LIMIT limit + 1`` (the extra row only tells whether
+another page exists), either by keyset (``after=<last id>``, ``id > after
+ORDER BY id``), which costs the same however deep the user scrolls, or by
+the legacy ``offset``. Counting the whole filtered set is a separate,
+optional path whose result is cached per filter combination until the next
+catalog write.
+"""
+import hashlib
+import logging
+
+from django.core.cache import cache
+from rest_framework.exceptions import ParseError
+
+from .signals import catalog_version
+
+logger = logging.getLogger('books')
+
+COUNT_TTL = 5 * 60
+
+
+def _int_param(request, name, default):
+    try:
+        return int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def params(request, default_limit, max_limit=100):
+    """``(limit, after, offset)`` of the request; ``after`` is None in offset mode.
+
+    A malformed ``after`` is a 400 (``ParseError``) rather than a silent
+    restart from the first page.
+    """
+    limit = max(1, min(_int_param(request, 'limit', default_limit), max_limit))
+    after = request.GET.get('after', '').strip()
+    if after:
+        try:
+            return limit, int(after), 0
+        except ValueError:
+            raise ParseError("after must be the next_after id of the previous page")
+    return limit, None, max(0, _int_param(request, 'offset', 0))
+
+
+def page(queryset, request, default_limit, max_limit=100):
+    """One page of ``queryset`` ordered by id.
+
+    Returns ``(books, has_more, meta)`` where ``meta`` holds ``next_after``
+    (keyset mode) or ``offset`` / ``limit`` (offset mode).
+    """
+    limit, after, offset = params(request, default_limit, max_limit)
+    queryset = queryset.order_by('id')
+    if after is not None:
+        rows = list(queryset.filter(id__gt=after)[:limit + 1])
+        meta = {}
+    else:
+        rows = list(queryset[offset:offset + limit + 1])
+        meta = {'offset': offset, 'limit': limit}
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    meta['next_after'] = rows[-1].id if has_more else None
+    return rows, has_more, meta
+
+
+def cached_count(queryset, key_parts):
+    """Size of ``queryset``, cached per ``key_parts`` until the next catalog write."""
+    digest = hashlib.sha1(repr(key_parts).encode('utf-8')).hexdigest()
+    key = f"books:count:{catalog_version()}:{digest}"
+    total = cache.get(key)
+    if total is None:
+        try:
+            total = queryset.count()
+        except Exception:
+            # Djongo can fail to translate count() on filtered querysets
+            logger.warning("count() failed, counting ids instead", exc_info=True)
+            total = sum(1 for _ in queryset.values_list('id', flat=True).iterator())
+        cache.set(key, total, COUNT_TTL)
+    return total
+
+
+def wants_total(request):
+    return request.GET.get('include_total') in ('1', 'true')
@@ -0,0 +1,471 @@
+"""
+Vectorized content-based scoring for ``recommended_books``.
+
+The catalog is loaded once into a column-oriented NumPy snapshot (book x genre
+incidence matrix, normalized rating / liked percentage, language and author
+codes) together with an inverted index from genre and author to rows and a
+precomputed top-rated list. A request only scores the books that share a
+genre or author with the user plus the top-rated list, with a handful of
+array operations. ``catalog_changed`` patches the snapshot in place; large
+changes drop it so it is rebuilt lazily on the next request.
+
+Rankings precomputed by the ``precompute_recommendations`` command are served
+when they still match the user's inputs. Ranked results are cached per user
+in the ``recommendations`` cache alias (LRU + TTL, see ``CACHES``). Entries
+are keyed by the catalog version, so any catalog write makes them
+unreachable, and ``invalidate_user`` drops a single user's entry when their
+saves or preferences change.
+
+Cursor paging ranks ``RANKING_DEPTH`` books once and hands out cursors that
+carry the rest of the ranked id list themselves, compressed and signed with
+``django.core.signing`` for the user. Later pages are a slice of the cursor
+instead of a re-score, any worker can serve them, and a cursor expires
+``RANKING_TTL`` seconds after it was issued.
+"""
+import copy
+import hashlib
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.dispatch import receiver
+
+from .models import Book, PrecomputedRecommendation
+from .signals import catalog_changed, catalog_version
+
+# Signal weights (see recommended_books docstring)
+W_FAVORITE_GENRES = 0.40
+W_SAVED_GENRES = 0.20
+W_SAVED_AUTHORS = 0.15
+W_RATING = 0.15
+W_LIKED = 0.05
+W_LANGUAGE = 0.05
+# Optional "also saved" co-occurrence signal (books.cooccurrence); off by default
+W_ALSO_SAVED = getattr(settings, 'RECOMMENDATION_ALSO_SAVED_WEIGHT', 0.0)
+
+# Largest page recommended_books serves; rankings are cached at this length
+MAX_RECOMMENDATIONS = 24
+
+# Books ranked up front for cursor paging, and how long a cursor stays valid
+RANKING_DEPTH = getattr(settings, 'RECOMMENDATION_RANKING_DEPTH', 240)
+RANKING_TTL = getattr(settings, 'RECOMMENDATION_RANKING_TTL', 10 * 60)
+_CURSOR_SALT = "books.recommender.ranking"
+
+# Books kept in the precomputed top-rated candidate list
+TOP_RATED_SIZE = 512
+
+# Catalog writes touching more books than this rebuild instead of patching
+MAX_PATCH_SIZE = 1000
+
+
+def _clean_genres(value):
+    try:
+        return [g for g in (value or []) if isinstance(g, str)]
+    except TypeError:
+        return []
+
+
+def _group_rows(codes):
+    """Map each non-negative code to the array of rows carrying it."""
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    start = np.searchsorted(sorted_codes, 0)
+    values, first = np.unique(sorted_codes[start:], return_index=True)
+    groups = np.split(order[start:], first[1:])
+    return {int(v): rows for v, rows in zip(values, groups)}
+
+
+def top_k(primary, secondary, tiebreak, k):
+    """Positions of the ``k`` largest (primary, secondary) keys, best first.
+
+    Uses ``argpartition`` so only the entries tied with or above the k-th
+    primary key are sorted; remaining ties go to the smallest ``tiebreak``.
+    """
+    n = len(primary)
+    if k <= 0 or not n:
+        return np.empty(0, dtype=np.int64)
+    positions = np.arange(n)
+    if n > k:
+        cut = np.argpartition(primary, n - k)[n - k]
+        positions = np.flatnonzero(primary >= primary[cut])
+    order = np.lexsort((tiebreak[positions], -secondary[positions], -primary[positions]))
+    return positions[order[:k]]
+
+
+class CatalogArrays:
+    """Column-oriented snapshot of the book catalog.
+
+    Row ``i`` of every array describes the book with id ``ids[i]``; rows are
+    ordered by id so ``rows_of`` can use a binary search. Deleted books keep
+    their row with ``alive`` cleared until the next rebuild.
+    """
+
+    version = None
+
+    def __init__(self, rows):
+        # rows: iterable of (id, author, rating, liked_percentage, language, genres)
+        rows = sorted(rows, key=lambda r: r[0])
+        n = len(rows)
+
+        self.ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        self.alive = np.ones(n, dtype=bool)
+        self.rating = np.fromiter((r[2] or 0.0 for r in rows), dtype=np.float64, count=n)
+        self.liked = np.fromiter((r[3] or 0.0 for r in rows), dtype=np.float64, count=n)
+
+        self.author_index = {}
+        self.language_index = {}
+        self.genre_index = {}
+        self.author_codes = np.full(n, -1, dtype=np.int32)
+        self.language_codes = np.full(n, -1, dtype=np.int32)
+        book_genres = []
+        for i, (_, author, _, _, language, genres) in enumerate(rows):
+            self.author_codes[i] = self._author_code(author)
+            self.language_codes[i] = self._language_code(language)
+            book_genres.append(self._genre_cols(genres))
+
+        # Book x genre incidence matrix and per-book genre set sizes
+        self.genre_matrix = np.zeros((n, len(self.genre_index)), dtype=bool)
+        for i, cols in enumerate(book_genres):
+            if cols:
+                self.genre_matrix[i, cols] = True
+        self._refresh_derived()
+
+        # Inverted index: genre column / author code -> rows
+        self.genre_postings = {
+            col: np.flatnonzero(self.genre_matrix[:, col]) for col in range(len(self.genre_index))
+        }
+        self.author_postings = _group_rows(self.author_codes)
+
+    @classmethod
+    def from_db(cls):
+        rows = Book.objects.values_list(
+            "id", "author", "rating", "liked_percentage", "language", "genres"
+        )
+        return cls(list(rows))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _author_code(self, author):
+        if not author:
+            return -1
+        return self.author_index.setdefault(author, len(self.author_index))
+
+    def _language_code(self, language):
+        lang = (language or "").strip().lower()
+        if not lang:
+            return -1
+        return self.language_index.setdefault(lang, len(self.language_index))
+
+    def _genre_cols(self, genres):
+        return sorted({self.genre_index.setdefault(g, len(self.genre_index)) for g in _clean_genres(genres)})
+
+    def _refresh_derived(self):
+        self.rating_norm = np.clip(self.rating / 5.0, 0.0, 1.0)
+        self.liked_norm = np.clip(self.liked / 100.0, 0.0, 1.0)
+        self.genre_counts = self.genre_matrix.sum(axis=1, dtype=np.int32)
+        rows = np.flatnonzero(self.alive)
+        self.alive_count = len(rows)
+        picked = top_k(self.rating[rows], self.liked[rows], self.ids[rows], TOP_RATED_SIZE)
+        self.top_rated = rows[picked]
+
+    def rows_of(self, book_ids):
+        """Rows of the given book ids; ids not in the snapshot are dropped."""
+        ids = np.fromiter((int(b) for b in book_ids), dtype=np.int64)
+        if not len(ids) or not len(self.ids):
+            return np.empty(0, dtype=np.int64)
+        pos = np.searchsorted(self.ids, ids)
+        pos = np.minimum(pos, len(self.ids) - 1)
+        pos = pos[self.ids[pos] == ids]
+        return pos[self.alive[pos]]
+
+    def genre_jaccard(self, genres, rows):
+        """Jaccard similarity of each of ``rows``' genre sets with ``genres``."""
+        genres = set(genres)
+        if not genres or not len(rows):
+            return np.zeros(len(rows))
+        cols = [self.genre_index[g] for g in genres if g in self.genre_index]
+        if cols:
+            inter = self.genre_matrix[np.ix_(rows, cols)].sum(axis=1, dtype=np.int32)
+        else:
+            inter = np.zeros(len(rows), dtype=np.int32)
+        union = len(genres) + self.genre_counts[rows] - inter
+        return inter / union
+
+    def postings(self, genres=(), author_codes=()):
+        """Rows sharing at least one of ``genres`` or ``author_codes``."""
+        parts = [self.genre_postings[self.genre_index[g]] for g in genres if g in self.genre_index]
+        parts += [self.author_postings[int(a)] for a in author_codes if int(a) in self.author_postings]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    def patched(self, books, deleted_ids):
+        """A copy of the snapshot with the given writes applied.
+
+        Returns None when a full rebuild is cheaper or required (large batch,
+        or a new id that would not keep ``ids`` sorted).
+        """
+        books = list(books)
+        if len(books) + len(deleted_ids) > MAX_PATCH_SIZE:
+            return None
+        new = copy.deepcopy(self)
+
+        for row in new.rows_of(deleted_ids):
+            new._unindex(row)
+            new.alive[row] = False
+
+        appended = []
+        for book in books:
+            rows = new.rows_of([book.id])
+            if len(rows):
+                new._unindex(rows[0])
+                new._set_row(rows[0], book)
+                new._index(rows[0])
+            else:
+                appended.append(book)
+        if appended:
+            appended.sort(key=lambda b: b.id)
+            if len(new.ids) and appended[0].id <= new.ids[-1]:
+                return None
+            new._append_rows(appended)
+
+        new._refresh_derived()
+        return new
+
+    def _append_rows(self, books):
+        n, m = len(self.ids), len(books)
+        self.ids = np.concatenate([self.ids, [b.id for b in books]])
+        self.alive = np.concatenate([self.alive, np.ones(m, dtype=bool)])
+        self.rating = np.concatenate([self.rating, np.zeros(m)])
+        self.liked = np.concatenate([self.liked, np.zeros(m)])
+        self.author_codes = np.concatenate([self.author_codes, np.full(m, -1, dtype=np.int32)])
+        self.language_codes = np.concatenate([self.language_codes, np.full(m, -1, dtype=np.int32)])
+        self.genre_matrix = np.vstack([self.genre_matrix, np.zeros((m, self.genre_matrix.shape[1]), dtype=bool)])
+        for row, book in enumerate(books, start=n):
+            self._set_row(row, book)
+            self._index(row)
+
+    def _set_row(self, row, book):
+        self.rating[row] = float(book.rating or 0.0)
+        self.liked[row] = float(book.liked_percentage or 0.0)
+        self.author_codes[row] = self._author_code(book.author)
+        self.language_codes[row] = self._language_code(book.language)
+        cols = self._genre_cols(book.genres)
+        missing = len(self.genre_index) - self.genre_matrix.shape[1]
+        if missing:
+            self.genre_matrix = np.hstack([
+                self.genre_matrix, np.zeros((len(self.ids), missing), dtype=bool)
+            ])
+        self.genre_matrix[row] = False
+        self.genre_matrix[row, cols] = True
+
+    def _index(self, row):
+        for col in np.flatnonzero(self.genre_matrix[row]):
+            self.genre_postings[int(col)] = np.union1d(self.genre_postings.get(int(col), []), [row]).astype(np.int64)
+        code = int(self.author_codes[row])
+        if code >= 0:
+            self.author_postings[code] = np.union1d(self.author_postings.get(code, []), [row]).astype(np.int64)
+
+    def _unindex(self, row):
+        for col in np.flatnonzero(self.genre_matrix[row]):
+            rows = self.genre_postings[int(col)]
+            self.genre_postings[int(col)] = rows[rows != row]
+        code = int(self.author_codes[row])
+        if code >= 0:
+            rows = self.author_postings[code]
+            self.author_postings[code] = rows[rows != row]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Return the current catalog snapshot, building it when missing or stale."""
+    global _catalog
+    version = catalog_version()
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        with _catalog_lock:
+            if _catalog is None or _catalog.version != version:
+                _catalog = CatalogArrays.from_db()
+                _catalog.version = version
+            catalog = _catalog
+    return catalog
+
+
+@receiver(catalog_changed)
+def update_catalog(sender=None, books=(), deleted_ids=(), rebuild=False, **kwargs):
+    """Patch the in-process snapshot and its inverted index after a write."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            return
+        _catalog = None if rebuild else _catalog.patched(books, deleted_ids)
+        if _catalog is not None:
+            _catalog.version = catalog_version()
+
+
+def _lookup(keys, values, ids):
+    """``values`` of ``ids`` found in the sorted ``keys`` array, 0 elsewhere."""
+    if not len(keys):
+        return np.zeros(len(ids))
+    pos = np.minimum(np.searchsorted(keys, ids), len(keys) - 1)
+    return np.where(keys[pos] == ids, values[pos], 0.0)
+
+
+def _score_rows(catalog, rows, favorite_genres, saved_genres, saved_authors, lang_code, co_saved):
+    author_match = np.isin(catalog.author_codes[rows], saved_authors) if len(saved_authors) else 0.0
+    scores = (
+        W_FAVORITE_GENRES * catalog.genre_jaccard(favorite_genres, rows) +
+        W_SAVED_GENRES * catalog.genre_jaccard(saved_genres, rows) +
+        W_SAVED_AUTHORS * author_match +
+        W_RATING * catalog.rating_norm[rows] +
+        W_LIKED * catalog.liked_norm[rows] +
+        W_LANGUAGE * (catalog.language_codes[rows] == lang_code)
+    )
+    if co_saved is not None:
+        scores = scores + W_ALSO_SAVED * _lookup(co_saved[0], co_saved[1], catalog.ids[rows])
+    return scores
+
+
+def recommend(catalog, favorite_genres, saved_ids, preferred_language, limit, co_saved=None, ann_rows=None):
+    """Ids of the ``limit`` best books for a user.
+
+    ``co_saved`` optionally maps book ids to their [0, 1] co-save strength
+    with the user's saved books; it is weighted by ``W_ALSO_SAVED``.
+    ``ann_rows`` optionally adds approximate nearest-neighbour candidates
+    (see ``ann.recommendation_candidates``) and replaces the full-scan
+    fallback, trading exactness for bounded latency on large catalogs.
+
+    Only books sharing a genre or author with the user, co-saved books and
+    the top-rated list are scored. Any other book scores at most the
+    rating/liked/language signals of a book rated no higher than the last
+    top-rated entry, so when the k-th candidate beats that bound the result
+    equals a full scan; when it does not, every unsaved book is scored. Users
+    with no signals at all get the top-rated books.
+    """
+    saved_rows = catalog.rows_of(saved_ids)
+    unsaved_count = catalog.alive_count - len(np.unique(saved_rows))
+
+    def all_unsaved_rows():
+        rows = np.flatnonzero(catalog.alive)
+        return rows[~np.isin(rows, saved_rows)]
+
+    if not favorite_genres and not saved_ids:
+        rows = catalog.top_rated
+        if len(rows) < min(limit, unsaved_count):
+            rows = all_unsaved_rows()
+        picked = top_k(catalog.rating[rows], catalog.liked[rows], catalog.ids[rows], limit)
+        return catalog.ids[rows[picked]].tolist()
+
+    saved_genres = set()
+    if len(saved_rows):
+        present = catalog.genre_matrix[saved_rows].any(axis=0)
+        names = np.array(list(catalog.genre_index), dtype=object)
+        saved_genres = set(names[present])
+    saved_authors = catalog.author_codes[saved_rows]
+    saved_authors = np.unique(saved_authors[saved_authors >= 0])
+    lang_code = catalog.language_index.get((preferred_language or "").strip().lower(), -2)
+
+    rows = np.union1d(catalog.postings(favorite_genres | saved_genres, saved_authors), catalog.top_rated)
+    if co_saved and W_ALSO_SAVED:
+        keys = np.fromiter(co_saved.keys(), dtype=np.int64, count=len(co_saved))
+        values = np.fromiter(co_saved.values(), dtype=np.float64, count=len(co_saved))
+        order = np.argsort(keys)
+        co_saved = (keys[order], values[order])
+        rows = np.union1d(rows, catalog.rows_of(keys))
+    else:
+        co_saved = None
+    if ann_rows is not None:
+        rows = np.union1d(rows, ann_rows)
+    rows = rows[catalog.alive[rows] & ~np.isin(rows, saved_rows)]
+    scores = _score_rows(catalog, rows, favorite_genres, saved_genres, saved_authors, lang_code, co_saved)
+    picked = top_k(scores, catalog.rating[rows], catalog.ids[rows], limit)
+
+    if len(rows) < unsaved_count and ann_rows is None:
+        if len(catalog.top_rated):
+            bound = W_RATING * catalog.rating_norm[catalog.top_rated[-1]] + W_LIKED + W_LANGUAGE
+        else:
+            bound = W_RATING + W_LIKED + W_LANGUAGE
+        if len(picked) < limit or scores[picked[-1]] <= bound:
+            rows = all_unsaved_rows()
+            scores = _score_rows(catalog, rows, favorite_genres, saved_genres, saved_authors, lang_code, co_saved)
+            picked = top_k(scores, catalog.rating[rows], catalog.ids[rows], limit)
+    return catalog.ids[rows[picked]].tolist()
+
+
+def _cache_key(user_id):
+    return f"recs:{catalog_version()}:{user_id}"
+
+
+def user_fingerprint(user):
+    """Hash of everything recommend() reads from the user row.
+
+    Favorite genres are covered by ``updated_at`` because
+    update_user_preferences saves the user after changing them.
+    """
+    key = repr((
+        sorted(set(user.saved_book_ids or [])),
+        (user.preferred_language or "").strip().lower(),
+        user.updated_at.isoformat() if user.updated_at else "",
+    ))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def get_cached_recommendations(user):
+    """Serialized ranked books for ``user`` or None on a miss."""
+    entry = caches["recommendations"].get(_cache_key(user.id))
+    if entry is None or entry["fingerprint"] != user_fingerprint(user):
+        return None
+    return entry["books"]
+
+
+def cache_recommendations(user, books):
+    caches["recommendations"].set(
+        _cache_key(user.id),
+        {"fingerprint": user_fingerprint(user), "books": list(books)},
+    )
+
+
+def get_precomputed_recommendations(user):
+    """Book ids stored by precompute_recommendations, if still valid for ``user``.
+
+    The stored ranking is only used while the user's saves, language and
+    preferences are unchanged since it was computed. Books added to the
+    catalog afterwards are picked up by the next batch run.
+    """
+    row = PrecomputedRecommendation.objects.filter(user_id=user.id).first()
+    if row is None or row.fingerprint != user_fingerprint(user):
+        return None
+    return list(row.book_ids or [])
+
+
+def invalidate_user(user_id):
+    """Drop a user's cached ranking after their saves or preferences change."""
+    caches["recommendations"].delete(_cache_key(user_id))
+
+
+def encode_cursor(user_id, book_ids):
+    """Signed cursor carrying the ids still to be served."""
+    return signing.dumps({"u": user_id, "ids": [int(i) for i in book_ids]}, salt=_CURSOR_SALT, compress=True)
+
+
+def ranking_page(user_id, cursor, limit):
+    """``(book_ids, next_cursor)`` of the page at ``cursor``.
+
+    Returns None when the cursor is malformed, expired or belongs to
+    another user; ``next_cursor`` is None on the last page.
+    """
+    try:
+        data = signing.loads(cursor, salt=_CURSOR_SALT, max_age=RANKING_TTL)
+        owner, ids = int(data["u"]), [int(i) for i in data["ids"]]
+    except (signing.BadSignature, ValueError, TypeError, KeyError):
+        return None
+    if owner != user_id:
+        return None
+    rest = ids[limit:]
+    return ids[:limit], (encode_cursor(user_id, rest) if rest else None)
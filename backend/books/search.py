@@ -0,0 +1,259 @@
+"""
+In-memory prefix search over book titles and authors for ``search_books``.
+
+Normalized titles and authors (see ``text.normalize``) are kept in two sorted
+key lists with parallel NumPy arrays of book id, rating and liked
+percentage. A query is two ``bisect`` calls per field giving the contiguous
+range of keys that start with it, followed by a vectorized top-N by rating
+over that range. Results for very broad prefixes ("t", "th") are memoized
+until the next catalog write. ``catalog_changed`` inserts and removes keys in
+place; large writes drop the index so it is rebuilt on the next search.
+
+Typing sends "h", "ha", "har"... in sequence, so the complete ranked match
+list of each narrow enough query is kept in a bounded LRU ``ResultCache``.
+A query whose longest cached prefix is found is answered by filtering that
+list (a title or author starting with "har" also starts with "ha"), which
+keeps the rating order. The cache is cleared by every catalog write.
+"""
+import bisect
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.dispatch import receiver
+
+from .models import Book
+from .recommender import MAX_PATCH_SIZE, top_k
+from .signals import catalog_changed, catalog_version
+from .text import normalize
+
+# Ranges at least this large have their top-N memoized
+MEMO_RANGE = 2000
+MEMO_SIZE = 1024
+
+# Complete result lists of queries matching at most CACHE_MAX_RESULTS books
+# are kept, for at most CACHE_SIZE queries
+CACHE_SIZE = 2048
+CACHE_MAX_RESULTS = 5000
+
+
+class SortedKeys:
+    """Sorted normalized keys of one field with aligned id / rating arrays."""
+
+    def __init__(self, entries):
+        # entries: (key, id, rating, liked)
+        entries = sorted(entries, key=lambda e: (e[0], e[1]))
+        self.keys = [e[0] for e in entries]
+        self.ids = np.array([e[1] for e in entries], dtype=np.int64)
+        self.rating = np.array([e[2] for e in entries], dtype=np.float64)
+        self.liked = np.array([e[3] for e in entries], dtype=np.float64)
+
+    def range(self, prefix):
+        lo = bisect.bisect_left(self.keys, prefix)
+        # Every key starting with the prefix sorts before prefix + U+10FFFF
+        hi = bisect.bisect_left(self.keys, prefix + "\U0010ffff", lo)
+        return lo, hi
+
+    def insert(self, key, book_id, rating, liked):
+        pos = bisect.bisect_left(self.keys, key)
+        while pos < len(self.keys) and self.keys[pos] == key and self.ids[pos] < book_id:
+            pos += 1
+        self.keys.insert(pos, key)
+        self.ids = np.insert(self.ids, pos, book_id)
+        self.rating = np.insert(self.rating, pos, rating)
+        self.liked = np.insert(self.liked, pos, liked)
+
+    def remove(self, key, book_id):
+        lo, hi = bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key)
+        hits = np.flatnonzero(self.ids[lo:hi] == book_id)
+        if not len(hits):
+            return
+        pos = lo + int(hits[0])
+        del self.keys[pos]
+        self.ids = np.delete(self.ids, pos)
+        self.rating = np.delete(self.rating, pos)
+        self.liked = np.delete(self.liked, pos)
+
+
+class PrefixIndex:
+    """Title and author prefix index of the catalog."""
+
+    version = None
+
+    def __init__(self, rows):
+        # rows: (id, title, author, rating, liked_percentage)
+        self.books = {}
+        titles, authors = [], []
+        for book_id, title, author, rating, liked in rows:
+            entry = (normalize(title), normalize(author), rating or 0.0, liked or 0.0)
+            self.books[book_id] = entry
+            titles.append((entry[0], book_id, entry[2], entry[3]))
+            authors.append((entry[1], book_id, entry[2], entry[3]))
+        self.fields = (SortedKeys(titles), SortedKeys(authors))
+        self._memo = {}
+
+    @classmethod
+    def from_db(cls):
+        rows = Book.objects.values_list("id", "title", "author", "rating", "liked_percentage")
+        return cls(rows.iterator(chunk_size=2000))
+
+    def remove(self, book_id):
+        entry = self.books.pop(book_id, None)
+        if entry is not None:
+            for field, key in zip(self.fields, entry[:2]):
+                field.remove(key, book_id)
+        self._memo.clear()
+
+    def upsert(self, book):
+        self.remove(book.id)
+        entry = (normalize(book.title), normalize(book.author), book.rating or 0.0, book.liked_percentage or 0.0)
+        self.books[book.id] = entry
+        for field, key in zip(self.fields, entry[:2]):
+            field.insert(key, book.id, entry[2], entry[3])
+
+    def search(self, query, limit=None):
+        """Ids of books whose title or author starts with ``query``, best rated first."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        memo_key = (prefix, limit)
+        if memo_key in self._memo:
+            return self._memo[memo_key]
+
+        ids, rating, liked, size = self._range(prefix)
+        picked = top_k(rating, liked, ids, limit if limit is not None else len(ids))
+        result = ids[picked].tolist()
+
+        if size >= MEMO_RANGE:
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[memo_key] = result
+        return result
+
+    def _range(self, prefix):
+        """Deduplicated ids, ratings and liked of the books matching ``prefix``, and the range size."""
+        parts, size = [], 0
+        for field in self.fields:
+            lo, hi = field.range(prefix)
+            parts.append((field.ids[lo:hi], field.rating[lo:hi], field.liked[lo:hi]))
+            size += hi - lo
+        ids = np.concatenate([p[0] for p in parts])
+        ids, first = np.unique(ids, return_index=True)
+        rating = np.concatenate([p[1] for p in parts])[first]
+        liked = np.concatenate([p[2] for p in parts])[first]
+        return ids, rating, liked, size
+
+    def all_matches(self, prefix):
+        """Every match of ``prefix`` best rated first, or None when there are too many."""
+        ids, rating, liked, size = self._range(prefix)
+        if size > CACHE_MAX_RESULTS:
+            return None
+        return ids[top_k(rating, liked, ids, len(ids))].tolist()
+
+    def refine(self, ids, prefix):
+        """The ids (in order) whose title or author starts with ``prefix``."""
+        books = self.books
+        return [i for i in ids if books[i][0].startswith(prefix) or books[i][1].startswith(prefix)]
+
+
+class ResultCache:
+    """Bounded LRU of normalized query -> complete ranked id list, with hit counters."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = self.prefix_hits = self.misses = 0
+
+    def get(self, prefix, index):
+        ids = self.entries.get(prefix)
+        if ids is not None:
+            self.entries.move_to_end(prefix)
+            self.hits += 1
+            return ids
+        for end in range(len(prefix) - 1, 0, -1):
+            base = self.entries.get(prefix[:end])
+            if base is not None:
+                self.entries.move_to_end(prefix[:end])
+                self.prefix_hits += 1
+                ids = index.refine(base, prefix)
+                self.put(prefix, ids)
+                return ids
+        self.misses += 1
+        return None
+
+    def put(self, prefix, ids):
+        self.entries[prefix] = ids
+        self.entries.move_to_end(prefix)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.prefix_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "prefix_hits": self.prefix_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.prefix_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+_cache = ResultCache()
+
+
+def get_index():
+    """Return the prefix index, building it when missing or stale."""
+    global _index
+    version = catalog_version()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = PrefixIndex.from_db()
+                _index.version = version
+                _cache.clear()
+            index = _index
+    return index
+
+
+@receiver(catalog_changed)
+def update_index(sender=None, books=(), deleted_ids=(), rebuild=False, **kwargs):
+    """Move the written books' keys in place; rebuild after large writes."""
+    global _index
+    with _index_lock:
+        _cache.clear()
+        if _index is None:
+            return
+        if rebuild or len(books) + len(deleted_ids) > MAX_PATCH_SIZE:
+            _index = None
+            return
+        for book_id in deleted_ids:
+            _index.remove(book_id)
+        for book in books:
+            _index.upsert(book)
+        _index.version = catalog_version()
+
+
+def prefix_search(query, limit=None):
+    prefix = normalize(query)
+    if not prefix:
+        return []
+    index = get_index()
+    with _index_lock:
+        ids = _cache.get(prefix, index)
+        if ids is None:
+            ids = index.all_matches(prefix)
+            if ids is None:
+                return index.search(prefix, limit)
+            _cache.put(prefix, ids)
+        return ids[:limit] if limit is not None else list(ids)
+
+
+def cache_stats():
+    with _index_lock:
+        return _cache.stats()
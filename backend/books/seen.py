@@ -0,0 +1,69 @@
+"""
+"Already shown" sets for infinite scrolling in the explorer.
+
+Instead of sending every id it already shows in ``exclude_ids``, a client
+keeps an opaque token, bound to the user and signed with
+``django.core.signing``, so any worker can read it. It expires ``SEEN_TTL``
+seconds after it was issued. The explorer pages in ascending id order, so
+the token carries a keyset mark (the largest id served so far; the next
+page starts after it) plus the shown ids above that mark, i.e. those the
+client had before scrolling (sorted, delta-encoded and zlib-compressed,
+well under a byte per id). Ids at or below the mark are never served again
+and are dropped, so the set shrinks as the user scrolls. To bound the
+token's length in the URL at most ``MAX_SEEN`` ids are kept, the lowest
+(served soonest) first; a dropped higher id is shown at most once more.
+"""
+import base64
+import binascii
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.core import signing
+
+SEEN_TTL = getattr(settings, 'EXPLORE_SEEN_TTL', 30 * 60)
+MAX_SEEN = getattr(settings, 'EXPLORE_SEEN_MAX', 5000)
+
+_signer = signing.TimestampSigner(salt="books.seen")
+
+
+def encode(ids):
+    """Compressed bytes of the sorted unique ``ids``: a dtype byte, then zlib'd deltas."""
+    deltas = np.diff(ids, prepend=0)
+    dtype = b"I" if not len(deltas) or deltas.max() < 2 ** 32 else b"q"
+    return dtype + zlib.compress(deltas.astype(np.dtype(dtype.decode())).tobytes(), 1)
+
+
+def decode(data):
+    deltas = np.frombuffer(zlib.decompress(data[1:]), dtype=np.dtype(data[:1].decode()))
+    return np.cumsum(deltas, dtype=np.int64)
+
+
+def merge(*parts):
+    """Sorted unique union of id iterables."""
+    arrays = [np.asarray(list(p) if not isinstance(p, np.ndarray) else p, dtype=np.int64) for p in parts]
+    return np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+
+
+def lookup(user_id, token):
+    """``(after, ids)`` of ``token``, or None when it is invalid, expired or another user's.
+
+    ``after`` is None until the first page has been served.
+    """
+    try:
+        owner, after, data = _signer.unsign(token, max_age=SEEN_TTL).split(":", 2)
+        if int(owner) != user_id:
+            return None
+        ids = decode(base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)))
+        return (int(after) if after else None), ids
+    except (signing.BadSignature, binascii.Error, zlib.error, ValueError, TypeError):
+        return None
+
+
+def store(user_id, after, ids):
+    """Signed token of the mark ``after`` and the sorted unique ``ids`` above it for ``user_id``."""
+    ids = np.asarray(ids, dtype=np.int64)
+    if after is not None:
+        ids = ids[ids > after]
+    data = base64.urlsafe_b64encode(encode(ids[:MAX_SEEN])).decode("ascii").rstrip("=")
+    return _signer.sign(f"{user_id}:{'' if after is None else after}:{data}")
@@ -7,6 +7,7 @@ class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = "__all__"
+        read_only_fields = ("genre_ids",)
 
 class GenreSerializer(serializers.ModelSerializer):
     class Meta:
@@ -47,6 +48,19 @@ class UserDetailSerializer(serializers.ModelSerializer):
         except Exception:
             return []
 
+class AdminUserSerializer(UserDetailSerializer):
+    """Read-only listing form of UserDetailSerializer.
+
+    Expects ``favorite_genres`` and ``saved_books`` prefetched (as
+    ``get_all_users`` does); the legacy saved books are read from the
+    prefetch and never written back.
+    """
+
+    def get_saved_books(self, obj):
+        if obj.saved_book_ids:
+            return list(obj.saved_book_ids)
+        return [book.id for book in obj.saved_books.all()]
+
 class UserGenrePreferenceSerializer(serializers.Serializer):
     genres = serializers.ListField(
         child=serializers.CharField(),  # expecting a list of genre names or IDs
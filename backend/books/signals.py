@@ -0,0 +1,85 @@
+"""
+Catalog change notifications.
+
+The in-memory structures built from the catalog (recommendation arrays and
+friends) subscribe to ``catalog_changed`` instead of being called directly by
+every view that writes books. Views send it explicitly rather than relying on
+``post_save`` so that bulk writes (CSV import) are covered as well.
+
+Every change also replaces the catalog version token, a ``VersionToken`` row
+in the database. Structures compare it with the token they were built from.
+The signal only reaches the process that made the write; the others re-read
+the token at most every ``VERSION_CHECK_INTERVAL`` seconds, so a write seen
+by one gunicorn worker makes the others rebuild within that interval. The
+caches can stay per-process.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.dispatch import Signal
+
+VERSION_CHECK_INTERVAL = getattr(settings, 'CATALOG_VERSION_CHECK_INTERVAL', 5)
+
+# Sent with ``books`` (saved Book instances), ``deleted_ids`` (list of ints)
+# and ``rebuild``: True when books were written without listing them (bulk
+# jobs), so every receiver drops its structure instead of patching it.
+catalog_changed = Signal()
+
+
+class _SharedVersion:
+    """A version token stored in the database, re-read every VERSION_CHECK_INTERVAL seconds."""
+
+    def __init__(self, key):
+        self.key = key
+        self.token = None
+        self.read_at = 0.0
+
+    def get(self):
+        if self.token is None or time.monotonic() - self.read_at >= VERSION_CHECK_INTERVAL:
+            from .models import VersionToken
+
+            row, _ = VersionToken.objects.get_or_create(key=self.key, defaults={'token': uuid.uuid4().hex})
+            self.token, self.read_at = row.token, time.monotonic()
+        return self.token
+
+    def bump(self):
+        from .models import VersionToken
+
+        token = uuid.uuid4().hex
+        VersionToken.objects.update_or_create(key=self.key, defaults={'token': token})
+        self.token, self.read_at = token, time.monotonic()
+
+
+_catalog_version = _SharedVersion("catalog")
+_genres_version = _SharedVersion("genres")
+
+
+def catalog_version():
+    """Opaque token that changes whenever the catalog is written."""
+    return _catalog_version.get()
+
+
+def genres_version():
+    """Opaque token that changes whenever Genre rows are created."""
+    return _genres_version.get()
+
+
+def notify_genres_changed():
+    _genres_version.bump()
+
+
+def notify_catalog_changed(books=(), deleted_ids=(), rebuild=False):
+    """Tell every catalog-derived structure that books were written or removed.
+
+    Pass ``rebuild=True`` instead of the books when they are too many to list.
+    """
+    from .models import Book
+
+    _catalog_version.bump()
+    catalog_changed.send(
+        sender=Book,
+        books=list(books),
+        deleted_ids=[int(i) for i in deleted_ids],
+        rebuild=rebuild,
+    )
@@ -0,0 +1,195 @@
+"""
+"More like this" over TF-IDF vectors of title, description, genres and author.
+
+Every book is stored once as an L2-normalized sparse vector (CSR arrays) and
+in a term -> (rows, weights) inverted index, which together form the sparse
+book x term matrix. ``similar`` is a single sparse mat-vec: the query book's
+vector is multiplied against the postings of its own terms only, followed by
+a top-k. ``catalog_changed`` re-vectorizes just the written books; other
+vectors keep the IDF they were built with until enough incremental changes
+have accumulated to warrant a full rebuild.
+"""
+import math
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+from django.dispatch import receiver
+
+from .models import Book
+from .recommender import MAX_PATCH_SIZE, top_k
+from .signals import catalog_changed, catalog_version
+from .text import Postings, normalize, tokenize
+
+TITLE_BOOST = 2
+
+# Rebuild from scratch once this share of the corpus changed incrementally
+REBUILD_FRACTION = 0.1
+
+
+def book_terms(title, description, genres, author):
+    """Term counts of a book; genres and author become single field terms."""
+    counts = Counter(tokenize(description))
+    for term in tokenize(title):
+        counts[term] += TITLE_BOOST
+    for genre in genres or []:
+        if isinstance(genre, str) and genre.strip():
+            counts["genre:" + normalize(genre).strip()] += 1
+    if author and author.strip():
+        counts["author:" + normalize(author).strip()] += 1
+    return counts
+
+
+class TfidfIndex:
+    """Sparse TF-IDF matrix of the catalog with incremental updates."""
+
+    version = None
+
+    def __init__(self, docs):
+        # docs: iterable of (id, title, description, genres, author)
+        self.vocab = {}
+        self.df = array("q")
+        self.doc_count = 0
+        self.changes = 0
+
+        self.row_ids = array("q")
+        self.alive = bytearray()
+        self.row_of = {}
+        self.indptr = array("q", [0])
+        self.terms = array("q")
+        self.weights = array("f")
+        self.postings = Postings("f")
+
+        counted = [(doc[0], self._term_ids(book_terms(*doc[1:]))) for doc in docs]
+        for _, counts in counted:
+            for term in counts:
+                self.df[term] += 1
+        self.doc_count = len(counted)
+        for book_id, counts in counted:
+            self._append(book_id, counts)
+
+    @classmethod
+    def from_db(cls):
+        docs = Book.objects.values_list("id", "title", "description", "genres", "author")
+        return cls(docs.iterator(chunk_size=2000))
+
+    def _term_ids(self, counts):
+        ids = {}
+        for term, count in counts.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                term_id = self.vocab[term] = len(self.vocab)
+                self.df.append(0)
+            ids[term_id] = count
+        return ids
+
+    def _idf(self, term_id):
+        return math.log((1 + self.doc_count) / (1 + self.df[term_id])) + 1.0
+
+    def _append(self, book_id, counts):
+        row = len(self.row_ids)
+        weighted = {t: (1.0 + math.log(c)) * self._idf(t) for t, c in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weighted.values())) or 1.0
+        for term_id, weight in sorted(weighted.items()):
+            self.terms.append(term_id)
+            self.weights.append(weight / norm)
+            self.postings.add(term_id, row, weight / norm)
+        self.indptr.append(len(self.terms))
+        self.row_ids.append(book_id)
+        self.alive.append(1)
+        self.row_of[book_id] = row
+
+    def _vector(self, row):
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.terms[start:end], self.weights[start:end]
+
+    def remove(self, book_id):
+        row = self.row_of.pop(book_id, None)
+        if row is None:
+            return
+        self.alive[row] = 0
+        for term_id in self._vector(row)[0]:
+            self.df[term_id] -= 1
+        self.doc_count -= 1
+        self.changes += 1
+
+    def upsert(self, book):
+        self.remove(book.id)
+        counts = self._term_ids(book_terms(book.title, book.description, book.genres, book.author))
+        for term_id in counts:
+            self.df[term_id] += 1
+        self.doc_count += 1
+        self.changes += 1
+        self._append(book.id, counts)
+
+    def needs_rebuild(self):
+        return self.changes > max(100, REBUILD_FRACTION * self.doc_count)
+
+    def similar(self, book_id, k):
+        """``(book_id, cosine)`` pairs of the ``k`` books closest to ``book_id``."""
+        row = self.row_of.get(book_id)
+        if row is None:
+            return []
+        terms, weights = self._vector(row)
+        rows_parts, value_parts = [], []
+        for term_id, weight in zip(terms, weights):
+            rows, values = self.postings.get(term_id)
+            rows_parts.append(rows)
+            value_parts.append(values * weight)
+        if not rows_parts:
+            return []
+        rows, inverse = np.unique(np.concatenate(rows_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(value_parts))
+
+        # Views are only used under the index lock, while no row is appended
+        alive = np.frombuffer(self.alive, dtype=np.uint8)
+        keep = (alive[rows] == 1) & (rows != row)
+        rows, scores = rows[keep], scores[keep]
+        ids = np.frombuffer(self.row_ids, dtype=np.int64)[rows]
+        picked = top_k(scores, scores, ids, k)
+        return [(int(ids[i]), float(scores[i])) for i in picked]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the TF-IDF index, building it when missing or stale."""
+    global _index
+    version = catalog_version()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = TfidfIndex.from_db()
+                _index.version = version
+            index = _index
+    return index
+
+
+@receiver(catalog_changed)
+def update_index(sender=None, books=(), deleted_ids=(), rebuild=False, **kwargs):
+    """Re-vectorize the written books in place."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            return
+        if rebuild or len(books) + len(deleted_ids) > MAX_PATCH_SIZE:
+            _index = None
+            return
+        for book_id in deleted_ids:
+            _index.remove(book_id)
+        for book in books:
+            _index.upsert(book)
+        if _index.needs_rebuild():
+            _index = None
+        else:
+            _index.version = catalog_version()
+
+
+def similar(book_id, k):
+    index = get_index()
+    with _index_lock:
+        return index.similar(book_id, k)
@@ -0,0 +1,80 @@
+"""
+Admin dashboard statistics without scanning the catalog on every load.
+
+Catalog totals (book count, average rating, books added today) are database
+aggregates computed once per catalog version and day and kept in the default
+cache, so every load until the next catalog write is a cache hit and nothing
+per book is held in memory. The user count is kept in the same cache:
+registrations and deletions adjust it and it is recounted every
+``USER_COUNT_TTL`` seconds, which also picks up users created outside the
+API. Genre popularity comes from the facet index's per-genre counts, and the
+recent top-rated books are two bounded, database-sorted queries.
+"""
+import datetime
+import logging
+
+from django.core.cache import cache
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from .models import Book, User
+from .signals import catalog_version
+
+logger = logging.getLogger('books')
+
+USER_COUNT_KEY = "books:stats:users"
+USER_COUNT_TTL = 60 * 60
+TOTALS_TTL = 24 * 60 * 60
+
+
+def _start_of(day):
+    return datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+
+def _compute_totals(today):
+    try:
+        totals = Book.objects.aggregate(count=Count('id'), avg=Avg('rating'))
+        total, avg = totals['count'] or 0, totals['avg'] or 0
+    except Exception:
+        # Djongo can fail to translate aggregates
+        logger.warning("aggregate() failed, averaging ratings instead", exc_info=True)
+        total, ratings = 0, 0.0
+        for rating in Book.objects.values_list('rating', flat=True).iterator():
+            total += 1
+            ratings += rating or 0.0
+        avg = ratings / total if total else 0
+    return {
+        "total_books": total,
+        "books_added_today": Book.objects.filter(created_at__gte=_start_of(today)).count(),
+        "avg_rating": round(avg, 1) if total else 0,
+    }
+
+
+def catalog_totals():
+    """Book count, books added today and average rating, cached until the next catalog write."""
+    today = timezone.now().date()
+    key = f"books:stats:catalog:{catalog_version()}:{today.isoformat()}"
+    return cache.get_or_set(key, lambda: _compute_totals(today), TOTALS_TTL)
+
+
+def user_count():
+    return cache.get_or_set(USER_COUNT_KEY, User.objects.count, USER_COUNT_TTL)
+
+
+def users_changed(delta):
+    """Adjust the cached user count after users were created or deleted."""
+    try:
+        cache.incr(USER_COUNT_KEY, delta)
+    except ValueError:
+        # Not cached: the next read counts
+        pass
+
+
+def top_rated_recent(limit=4, days=30):
+    """Best rated books updated in the last ``days`` days, topped up with the newest books."""
+    since = _start_of(timezone.now().date() - datetime.timedelta(days=days))
+    books = list(Book.objects.filter(updated_at__gte=since).order_by("-rating", "-created_at")[:limit])
+    if len(books) < limit:
+        seen = [b.id for b in books]
+        books += list(Book.objects.exclude(id__in=seen).order_by("-created_at")[:limit - len(books)])
+    return books
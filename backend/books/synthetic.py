@@ -0,0 +1,159 @@
+"""
+Synthetic books and users following the ``Book`` / ``User`` schema.
+
+Used by the ``generate_synthetic_data`` and ``benchmark_recommendations``
+commands to measure the recommendation path at catalog sizes the sample CSV
+cannot reach. Genre, author and save popularity follow Zipf-like
+distributions (``skew`` 0 is uniform), save-list lengths are log-normal, and
+everything is driven by one seeded generator so runs are reproducible.
+"""
+import numpy as np
+from django.contrib.auth.hashers import make_password
+
+from .models import Book, Genre, User
+
+ISBN_PREFIX = "SYN"
+EMAIL_DOMAIN = "synthetic.invalid"
+
+BASE_GENRES = [
+    "Fiction", "Fantasy", "Romance", "Mystery", "Thriller", "Science Fiction", "Historical Fiction",
+    "Young Adult", "Classics", "Nonfiction", "Horror", "Adventure", "Contemporary", "Biography",
+    "Dystopian", "Poetry", "Humor", "Crime", "Philosophy", "Self Help", "Memoir", "History",
+    "Paranormal", "Graphic Novels", "Childrens", "Science", "Travel", "Religion", "Psychology", "Drama",
+]
+LANGUAGES = ["English", "Spanish", "French", "German", "Italian", "Portuguese", "Japanese", "Russian"]
+LANGUAGE_WEIGHTS = [0.80, 0.06, 0.04, 0.03, 0.02, 0.02, 0.02, 0.01]
+PUBLISHERS = ["Penguin", "HarperCollins", "Macmillan", "Hachette", "Scholastic", "Vintage", "Tor", "Orbit"]
+WORDS = """
+shadow light river crown storm garden city night empire silver winter secret house queen king
+dragon ocean forest star fire glass stone sky iron heart memory war song journey island moon
+""".split()
+
+MAX_GENRES_PER_BOOK = 4
+
+
+def zipf_weights(n, skew):
+    """Probabilities of ranks 1..n proportional to ``1 / rank ** skew``."""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def genre_names(count):
+    names = BASE_GENRES[:count]
+    names += [f"Genre {i}" for i in range(len(names), count)]
+    return names
+
+
+def ensure_genres(count):
+    names = genre_names(count)
+    existing = set(Genre.objects.filter(name__in=names).values_list("name", flat=True))
+    Genre.objects.bulk_create([Genre(name=n) for n in names if n not in existing])
+    return names
+
+
+def _phrase(rng, words, size):
+    return " ".join(words[i] for i in rng.integers(0, len(words), size))
+
+
+def generate_books(count, genres, rng, genre_skew=1.0, start=0, batch_size=5000, genre_ids=None):
+    """Yield lists of unsaved ``Book`` objects, ``batch_size`` at a time.
+
+    ``genre_ids`` (aligned with ``genres``) fills the books' interned genre ids.
+    """
+    genre_p = zipf_weights(len(genres), genre_skew)
+    author_count = max(1, count // 8)
+    for offset in range(0, count, batch_size):
+        n = min(batch_size, count - offset)
+        draws = rng.choice(len(genres), size=(n, MAX_GENRES_PER_BOOK), p=genre_p)
+        genre_counts = rng.integers(1, MAX_GENRES_PER_BOOK + 1, n)
+        authors = rng.zipf(1.5, n) % author_count
+        languages = rng.choice(len(LANGUAGES), size=n, p=LANGUAGE_WEIGHTS)
+        ratings = np.clip(rng.normal(3.9, 0.45, n), 0.0, 5.0).round(2)
+        liked = np.clip(rng.normal(88.0, 8.0, n), 0.0, 100.0).round(1)
+        pages = rng.integers(80, 900, n)
+        batch = []
+        for i in range(n):
+            number = start + offset + i
+            picked = list(dict.fromkeys(draws[i, :genre_counts[i]].tolist()))
+            batch.append(Book(
+                title=f"The {_phrase(rng, WORDS, 2).title()} {number}",
+                author=f"Author {authors[i]}",
+                isbn=f"{ISBN_PREFIX}{number:010d}",
+                description=_phrase(rng, WORDS, 30),
+                rating=float(ratings[i]),
+                liked_percentage=float(liked[i]),
+                genres=[genres[g] for g in picked],
+                genre_ids=[genre_ids[g] for g in picked] if genre_ids else [],
+                language=LANGUAGES[languages[i]],
+                page_count=int(pages[i]),
+                publisher=PUBLISHERS[number % len(PUBLISHERS)],
+            ))
+        yield batch
+
+
+def generate_users(count, book_ids, genres, rng, mean_saves=8, max_saves=50, popularity_skew=1.0,
+                   genre_skew=1.0, start=0, batch_size=2000):
+    """Yield ``(users, favorite_genre_names)`` batches of unsaved ``User`` objects."""
+    book_ids = np.asarray(book_ids, dtype=np.int64)
+    # Popular books are a random subset, not simply the lowest ids
+    by_popularity = rng.permutation(book_ids)
+    # Sample saves by inverting the CDF once instead of rng.choice(p=...) per user
+    save_cdf = np.cumsum(zipf_weights(len(by_popularity), popularity_skew)) if len(by_popularity) else None
+    genre_p = zipf_weights(len(genres), genre_skew)
+    password = make_password(None)
+    sigma = 1.0
+    mu = np.log(max(mean_saves, 1)) - sigma ** 2 / 2
+    for offset in range(0, count, batch_size):
+        n = min(batch_size, count - offset)
+        lengths = np.minimum(rng.lognormal(mu, sigma, n).astype(np.int64), max_saves)
+        if save_cdf is None:
+            lengths[:] = 0
+        picks = np.empty(0, dtype=np.int64)
+        if lengths.sum():
+            picks = np.searchsorted(save_cdf, rng.random(lengths.sum()) * save_cdf[-1])
+            picks = by_popularity[np.minimum(picks, len(by_popularity) - 1)]
+        bounds = np.concatenate([[0], np.cumsum(lengths)])
+        favorite_draws = rng.choice(len(genres), size=(n, 3), p=genre_p)
+        favorite_counts = rng.integers(0, 4, n)
+        languages = rng.choice(len(LANGUAGES), size=n, p=LANGUAGE_WEIGHTS)
+        users, favorites = [], []
+        for i in range(n):
+            number = start + offset + i
+            users.append(User(
+                email=f"user{number}@{EMAIL_DOMAIN}",
+                username=f"user{number}",
+                password=password,
+                saved_book_ids=list(dict.fromkeys(picks[bounds[i]:bounds[i + 1]].tolist())),
+                preferred_language=LANGUAGES[languages[i]],
+            ))
+            favorites.append({genres[g] for g in favorite_draws[i, :favorite_counts[i]]})
+        yield users, favorites
+
+
+def create_catalog(books, users, rng, genre_count=30, genre_skew=1.0, popularity_skew=1.0,
+                   mean_saves=8, max_saves=50, log=None):
+    """Insert ``books`` books and ``users`` users; returns the inserted book ids."""
+    genres = ensure_genres(genre_count)
+    genre_ids = dict(Genre.objects.filter(name__in=genres).values_list("name", "id"))
+    start = Book.objects.filter(isbn__startswith=ISBN_PREFIX).count()
+    for batch in generate_books(books, genres, rng, genre_skew, start=start,
+                                genre_ids=[genre_ids[g] for g in genres]):
+        Book.objects.bulk_create(batch)
+        if log:
+            log(f"books: {batch[-1].isbn}")
+    book_ids = list(Book.objects.values_list("id", flat=True))
+
+    through = User.favorite_genres.through
+    start = User.objects.filter(email__endswith="@" + EMAIL_DOMAIN).count()
+    for batch, favorites in generate_users(users, book_ids, genres, rng, mean_saves, max_saves,
+                                           popularity_skew, genre_skew, start=start):
+        User.objects.bulk_create(batch)
+        # bulk_create only sets primary keys on some backends; look them up by email
+        ids = dict(User.objects.filter(email__in=[u.email for u in batch]).values_list("email", "id"))
+        through.objects.bulk_create([
+            through(user_id=ids[user.email], genre_id=genre_ids[name])
+            for user, names in zip(batch, favorites) for name in names
+        ])
+        if log:
+            log(f"users: {batch[-1].email}")
+    return book_ids
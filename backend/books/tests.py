@@ -0,0 +1,828 @@
+import datetime
+import io
+import json
+import random
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import ann, cooccurrence, export, facets, fuzzy, recommender, search, seen, stats, timeseries, trending
+from .models import Book, DailyStats, Genre, PrecomputedRecommendation, SearchQueryCount, User, VersionToken
+from .recommender import MAX_PATCH_SIZE
+from .signals import VERSION_CHECK_INTERVAL, notify_catalog_changed, notify_genres_changed
+
+CSV_HEADER = "isbn,title,author,genres,rating\n"
+
+
+class CsvImportTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user("admin@example.com", "pw", username="admin", is_admin=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        Book.objects.bulk_create([
+            Book(title=f"Existing {i}", author="Old Author", isbn=f"E{i}", genres=["Drama"], rating=3.0)
+            for i in range(20)
+        ])
+        # Start from structures built from this test's catalog
+        notify_catalog_changed(rebuild=True)
+
+    def upload(self, text):
+        response = self.client.post(
+            "/api/admin/books/import-csv/",
+            {"file": SimpleUploadedFile("books.csv", text.encode("utf-8"))},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def export(self, fmt):
+        response = self.client.get("/api/admin/books/export/", {"fmt": fmt})
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_export_reimports_unchanged(self):
+        Book.objects.create(
+            isbn="X1", title='Commas, "Quotes"', author="Émile Zola", description="Line one\nline two",
+            genres=["Drama", "Classics"], rating=4.25, liked_percentage=91.0, language="French",
+            page_count=320, publisher="Charpentier", is_free=True,
+        )
+        exported = list(Book.objects.order_by("isbn").values_list(*export.BOOK_COLUMNS))
+        text = self.export("csv")
+
+        Book.objects.all().delete()
+        notify_catalog_changed(rebuild=True)
+        self.assertEqual(self.upload(text)["created"], len(exported))
+        self.assertEqual(list(Book.objects.order_by("isbn").values_list(*export.BOOK_COLUMNS)), exported)
+
+    def test_ndjson_export_has_one_object_per_book(self):
+        rows = [json.loads(line) for line in self.export("ndjson").splitlines()]
+        self.assertEqual([row["isbn"] for row in rows], [f"E{i}" for i in range(20)])
+        self.assertEqual(rows[0]["genres"], ["Drama"])
+        self.assertEqual(self.client.get("/api/admin/books/export/", {"fmt": "xml"}).status_code, 400)
+
+    def test_large_import_rebuilds_catalog_structures(self):
+        # Build every structure before the import so a stale one would show
+        recommender.get_catalog()
+        search.get_index()
+        facets.get_index()
+        stats.catalog_totals()
+
+        count = MAX_PATCH_SIZE + 100
+        rows = "".join(f"N{i},Zephyr Tale {i},Zephyr Writer,Fantasy,4\n" for i in range(count))
+        result = self.upload(CSV_HEADER + rows)
+        self.assertEqual(result["created"], count)
+
+        titles = [book["title"] for book in self.client.get("/api/books/search/", {"q": "zephyr tale 1050"}).json()]
+        self.assertEqual(titles, ["Zephyr Tale 1050"])
+        explore = self.client.get("/api/books/explore/", {"author": "Zephyr Writer"}).json()
+        self.assertEqual(explore["total_count"], count)
+        self.assertEqual(self.client.get("/api/dashboard/").json()["total_books"], count + 20)
+        self.assertEqual(len(recommender.get_catalog().ids), count + 20)
+
+    def test_small_import_patches_catalog_structures(self):
+        search.get_index()
+        self.upload(CSV_HEADER + "N1,Quokka Days,Someone,,4\n")
+        titles = [book["title"] for book in self.client.get("/api/books/search/", {"q": "quokka"}).json()]
+        self.assertEqual(titles, ["Quokka Days"])
+
+    def test_repeated_isbn_keeps_last_row(self):
+        result = self.upload(CSV_HEADER + "N1,First,A,,1\nN1,Second,B,Horror,2\nE0,Renamed,C,,5\nE0,Renamed again,C,,5\n")
+        self.assertEqual((result["created"], result["updated"]), (1, 3))
+        book = Book.objects.get(isbn="N1")
+        self.assertEqual((book.title, book.author, book.genres, book.rating), ("Second", "B", ["Horror"], 2.0))
+        self.assertEqual(Book.objects.get(isbn="E0").title, "Renamed again")
+        self.assertEqual(Book.objects.filter(isbn__in=["N1", "E0"]).count(), 2)
+
+    def test_rows_without_isbn_are_reported(self):
+        result = self.upload(CSV_HEADER + "N1,Fine,A,,1\n,No isbn,B,,2\nN2,Also fine,C,,3\n")
+        self.assertEqual(result["created"], 2)
+        self.assertEqual(result["errors"], [{"row": 3, "error": "Missing ISBN"}])
+
+    def test_rejected_batch_reports_only_failing_rows(self):
+        original_save = Book.save
+
+        def save(book, *args, **kwargs):
+            if book.isbn == "BAD":
+                raise ValueError("rejected")
+            return original_save(book, *args, **kwargs)
+
+        def bulk_create(*args, **kwargs):
+            raise ValueError("batch rejected")
+
+        with mock.patch.object(Book, "save", save), \
+                mock.patch.object(type(Book.objects), "bulk_create", bulk_create):
+            result = self.upload(CSV_HEADER + "N1,Good,A,,1\nBAD,Bad,B,,2\nE1,Updated,C,,3\n")
+
+        self.assertEqual(result["errors"], [{"row": 3, "error": "rejected", "isbn": "BAD"}])
+        self.assertEqual((result["created"], result["updated"]), (1, 1))
+        self.assertTrue(Book.objects.filter(isbn="N1").exists())
+        self.assertFalse(Book.objects.filter(isbn="BAD").exists())
+        self.assertEqual(Book.objects.get(isbn="E1").title, "Updated")
+
+
+class CatalogVersionTests(TestCase):
+
+    def test_write_from_another_worker_is_picked_up(self):
+        Book.objects.create(title="Before", author="A", isbn="V1")
+        notify_catalog_changed(rebuild=True)
+        search.get_index()
+        self.assertEqual(search.prefix_search("walrus"), [])
+
+        # Another worker writes a book: its signal never reaches this process,
+        # only the version row in the database changes
+        book = Book.objects.create(title="Walrus Song", author="B", isbn="V2")
+        VersionToken.objects.filter(key="catalog").update(token="written-elsewhere")
+        self.assertEqual(search.prefix_search("walrus"), [])
+
+        with mock.patch("books.signals.time.monotonic", return_value=time.monotonic() + VERSION_CHECK_INTERVAL):
+            self.assertEqual(search.prefix_search("walrus"), [book.id])
+
+
+class SeenTokenTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("reader@example.com", "pw", username="reader")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Book.objects.bulk_create([
+            Book(title=f"Book {i}", author="Author", isbn=f"S{i}", genres=["Drama"], rating=3.0)
+            for i in range(10)
+        ])
+        self.books = list(Book.objects.order_by("id"))
+        notify_catalog_changed(rebuild=True)
+
+    def test_token_carries_the_mark_and_the_seen_ids_above_it(self):
+        token = seen.store(self.user.id, 4, [3, 5, 900])
+        after, ids = seen.lookup(self.user.id, token)
+        self.assertEqual((after, ids.tolist()), (4, [5, 900]))
+        self.assertIsNone(seen.lookup(self.user.id + 1, token))
+        self.assertIsNone(seen.lookup(self.user.id, token[:-1] + ("A" if token[-1] != "A" else "B")))
+        self.assertIsNone(seen.lookup(self.user.id, "garbage"))
+
+    def scroll(self, **first):
+        response = self.client.get("/api/books/explore/", {"limit": 4, "seen": "", **first}).json()
+        shown = [book["id"] for book in response["books"]]
+        for _ in range(20):
+            if not response["books"]:
+                return shown
+            response = self.client.get("/api/books/explore/", {"limit": 4, "seen": response["seen"]}).json()
+            shown += [book["id"] for book in response["books"]]
+        self.fail("explorer kept serving pages")
+
+    def test_paging_never_repeats_a_book(self):
+        excluded = [self.books[1].id, self.books[6].id]
+        shown = self.scroll(exclude_ids=",".join(map(str, excluded)))
+        self.assertEqual(shown, [book.id for book in self.books if book.id not in excluded])
+
+    def test_paging_past_the_cap_never_repeats_a_book(self):
+        with mock.patch.object(seen, "MAX_SEEN", 2):
+            shown = self.scroll()
+        self.assertEqual(shown, [book.id for book in self.books])
+
+    def test_expired_token_is_rejected(self):
+        token = seen.store(self.user.id, None, [1])
+        with mock.patch("django.core.signing.time.time", return_value=time.time() + seen.SEEN_TTL + 1):
+            response = self.client.get("/api/books/explore/", {"seen": token})
+        self.assertEqual(response.status_code, 400)
+
+
+class RankingCursorTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("ranked@example.com", "pw", username="ranked")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Book.objects.bulk_create([
+            Book(title=f"Book {i}", author=f"Author {i}", isbn=f"R{i}", genres=["Drama"], rating=i % 5)
+            for i in range(30)
+        ])
+        notify_catalog_changed(rebuild=True)
+
+    def test_cursor_pages_do_not_need_the_cache(self):
+        response = self.client.get("/api/books/recommended/", {"cursor": "", "limit": 8}).json()
+        shown = [book["id"] for book in response["results"]]
+        while response["next_cursor"]:
+            # Next page served by a worker that never saw the ranking
+            caches["recommendations"].clear()
+            response = self.client.get("/api/books/recommended/", {"cursor": response["next_cursor"], "limit": 8}).json()
+            shown += [book["id"] for book in response["results"]]
+        self.assertEqual(len(shown), 30)
+        self.assertEqual(len(set(shown)), 30)
+
+    def test_cursor_of_another_user_is_rejected(self):
+        cursor = recommender.encode_cursor(self.user.id + 1, [1, 2, 3])
+        response = self.client.get("/api/books/recommended/", {"cursor": cursor})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExploreFacetTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("facets@example.com", "pw", username="facets"))
+        Book.objects.bulk_create(
+            [Book(title=f"Old {i}", author="Old Author", isbn=f"111-{i}", language="en") for i in range(5)]
+            + [Book(title=f"New {i}", author="New Author", isbn=f"222-{i}", language="fr") for i in range(3)]
+        )
+        notify_catalog_changed(rebuild=True)
+
+    def test_isbn_filter_narrows_facet_counts(self):
+        response = self.client.get("/api/books/explore/", {"isbn": "222-"}).json()
+        self.assertEqual(response["total_count"], 3)
+        self.assertEqual(response["facets"]["author"], [{"value": "New Author", "count": 3}])
+        self.assertEqual(response["facets"]["language"], [{"value": "fr", "count": 3}])
+
+
+class CoSaveMatrixTests(TestCase):
+
+    def tearDown(self):
+        cooccurrence._matrix = None
+
+    def test_saves_during_a_rebuild_are_neither_blocked_nor_counted_twice(self):
+        User.objects.create_user("cosave@example.com", "pw", username="cosave", saved_book_ids=[1, 2])
+        old = cooccurrence.CoSaveMatrix()
+        old.built_at -= cooccurrence.MAX_AGE + 1
+        cooccurrence._matrix = old
+        from_db = cooccurrence.CoSaveMatrix.from_db
+
+        def build():
+            # A save handled while the rebuild reads the database
+            cooccurrence.record_save([1], 2)
+            return from_db()
+
+        with mock.patch.object(cooccurrence.CoSaveMatrix, "from_db", build):
+            self.assertEqual(cooccurrence.also_saved(1, 5), [(2, 1)])
+        self.assertEqual(old.neighbours(1, 5), [(2, 1)])
+
+
+class TrendingSearchTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("trends@example.com", "pw", username="trends"))
+        trending._tracker = trending.Tracker()
+
+    def test_only_submitted_queries_are_recorded(self):
+        for prefix in ("ha", "har", "harr", "harry"):
+            self.client.get("/api/books/search/", {"q": prefix})
+        self.client.get("/api/books/search/", {"q": "harry", "record": "1"})
+        self.assertEqual(trending.trending(5), ["harry"])
+
+    def test_trending_counts_only_the_last_seven_days(self):
+        today = timezone.now().date()
+        SearchQueryCount.objects.bulk_create([
+            SearchQueryCount(query="old favourite", day=today - datetime.timedelta(days=10), count=1000),
+            SearchQueryCount(query="old favourite", day=today - datetime.timedelta(days=1), count=1),
+            SearchQueryCount(query="this week", day=today - datetime.timedelta(days=6), count=2),
+            SearchQueryCount(query="this week", day=today - datetime.timedelta(days=2), count=2),
+        ])
+        self.assertEqual(trending.trending(5), ["this week", "old favourite"])
+
+        # A flush adds to today's bucket and drops the buckets out of the window
+        trending._store({"this week": 3, "new": 1})
+        self.assertEqual(trending.trending(5), ["this week", "old favourite", "new"])
+        self.assertEqual(SearchQueryCount.objects.get(query="this week", day=today).count, 3)
+        self.assertFalse(SearchQueryCount.objects.filter(day__lt=today - datetime.timedelta(days=6)).exists())
+
+
+class DashboardStatsTests(TestCase):
+
+    def setUp(self):
+        caches["default"].clear()
+        self.admin = User.objects.create_user("stats@example.com", "pw", username="stats", is_admin=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def dashboard(self):
+        return self.client.get("/api/dashboard/").json()
+
+    def test_totals_follow_catalog_writes(self):
+        Book.objects.create(title="A", author="X", isbn="D1", rating=4.0)
+        old = Book.objects.create(title="B", author="X", isbn="D2", rating=2.0)
+        Book.objects.filter(pk=old.pk).update(created_at=timezone.now() - datetime.timedelta(days=3))
+        notify_catalog_changed(rebuild=True)
+        data = self.dashboard()
+        self.assertEqual((data["total_books"], data["books_added_today"], data["avg_rating"]), (2, 1, 3.0))
+
+        # A write made by another worker only changes the version row
+        Book.objects.create(title="C", author="X", isbn="D3", rating=5.0)
+        VersionToken.objects.filter(key="catalog").update(token="written-elsewhere")
+        with mock.patch("books.signals.time.monotonic", return_value=time.monotonic() + VERSION_CHECK_INTERVAL):
+            data = self.dashboard()
+        self.assertEqual((data["total_books"], data["books_added_today"], data["avg_rating"]), (3, 2, 3.7))
+
+    def test_user_count_follows_registrations_and_deletions(self):
+        self.assertEqual(self.dashboard()["total_users"], 1)
+        stats.users_changed(2)
+        self.assertEqual(self.dashboard()["total_users"], 3)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("search@example.com", "pw", username="search"))
+        for isbn, title, author, rating in [
+            ("Q1", "Harry Potter", "J. K. Rowling", 4.5),
+            ("Q2", "Harriet the Spy", "Louise Fitzhugh", 4.0),
+            ("Q3", "Dune", "Frank Herbert", 4.8),
+            ("Q4", "Hard Times", "Charles Dickens", 3.5),
+        ]:
+            Book.objects.create(isbn=isbn, title=title, author=author, rating=rating)
+        notify_catalog_changed(rebuild=True)
+
+    def titles(self, **params):
+        response = self.client.get("/api/books/search/", params).json()
+        results = response["results"] if isinstance(response, dict) else response
+        return [book["title"] for book in results]
+
+    def test_prefix_matches_titles_and_authors_best_rated_first(self):
+        self.assertEqual(self.titles(q="HAR"), ["Harry Potter", "Harriet the Spy", "Hard Times"])
+        self.assertEqual(self.titles(q="har", limit="2"), ["Harry Potter", "Harriet the Spy"])
+        self.assertEqual(self.titles(q="frank"), ["Dune"])
+        self.assertEqual(self.titles(q="potter"), [])
+
+    def test_prefix_index_follows_catalog_writes(self):
+        self.titles(q="e")
+        added = Book.objects.create(isbn="Q5", title="Émile", author="Jean-Jacques Rousseau", rating=3.0)
+        notify_catalog_changed([added])
+        self.assertEqual(self.titles(q="emi"), ["Émile"])
+        dune = Book.objects.get(isbn="Q3")
+        dune_id = dune.id
+        dune.delete()
+        notify_catalog_changed(deleted_ids=[dune_id])
+        self.assertEqual(self.titles(q="du"), [])
+
+    def test_fulltext_ranks_by_bm25_over_all_fields(self):
+        Book.objects.filter(isbn="Q3").update(description="A desert planet and its giant sandworms.")
+        Book.objects.filter(isbn="Q4").update(description="A novel of the industrial north.", genres=["Classics"])
+        Book.objects.create(isbn="Q5", title="Desert Solitaire", author="Edward Abbey", rating=4.1)
+        notify_catalog_changed(rebuild=True)
+        # The title hit outweighs the description hit
+        self.assertEqual(self.titles(q="desert", mode="fulltext"), ["Desert Solitaire", "Dune"])
+        self.assertEqual(self.titles(q="Sandworms planet", mode="fulltext"), ["Dune"])
+        self.assertEqual(self.titles(q="classics", mode="fulltext"), ["Hard Times"])
+        self.assertEqual(self.titles(q="herbert", mode="fulltext"), ["Dune"])
+
+    def test_fulltext_index_follows_edits(self):
+        self.assertEqual(self.titles(q="wizard", mode="fulltext"), [])
+        book = Book.objects.get(isbn="Q1")
+        book.description = "A boy learns he is a wizard."
+        book.save()
+        notify_catalog_changed([book])
+        self.assertEqual(self.titles(q="wizard", mode="fulltext"), ["Harry Potter"])
+
+    def test_typed_prefixes_are_served_from_the_result_cache(self):
+        search._cache = search.ResultCache()
+        self.addCleanup(setattr, search, "_cache", search.ResultCache())
+        typed = [self.titles(q="harr"[:end]) for end in range(1, 5)]
+        self.assertEqual(typed[-1], ["Harry Potter", "Harriet the Spy"])
+        self.assertEqual(self.titles(q="harr"), typed[-1])
+        stats = search.cache_stats()
+        self.assertEqual((stats["misses"], stats["prefix_hits"], stats["hits"]), (1, 3, 1))
+
+        # Writes clear the cache, so refinements never serve a stale list
+        added = Book.objects.create(isbn="Q5", title="Harrow Road", author="Someone", rating=5.0)
+        notify_catalog_changed([added])
+        self.assertEqual(search.cache_stats()["entries"], 0)
+        self.assertEqual(self.titles(q="harr"), ["Harrow Road", "Harry Potter", "Harriet the Spy"])
+
+    def test_fuzzy_matches_a_misspelled_title(self):
+        self.assertEqual(self.titles(q="hary poter", mode="fuzzy")[0], "Harry Potter")
+        response = self.client.get("/api/books/search/", {"q": "frank hebert", "mode": "prefix", "suggest": "1"}).json()
+        self.assertEqual((response["results"], response["did_you_mean"]), ([], "Frank Herbert"))
+
+    def test_fuzzy_threshold_is_clamped(self):
+        # "Frank Herbert" shares a single trigram ("  h") with the query
+        lowest = self.titles(q="harry potter", mode="fuzzy", threshold="0")
+        self.assertNotIn("Dune", lowest)
+        self.assertEqual(lowest, self.titles(q="harry potter", mode="fuzzy", threshold=str(fuzzy.MIN_THRESHOLD)))
+
+
+class FilterOptionsTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("filters@example.com", "pw", username="filters"))
+        Genre.objects.create(name="Fantasy")
+        Genre.objects.create(name="Mystery")
+        for isbn, author, genres in [("F1", "Ann", ["Fantasy"]), ("F2", "Ann", ["Fantasy", "Mystery"]),
+                                     ("F3", "Bob", [])]:
+            Book.objects.create(isbn=isbn, title=isbn, author=author, genres=genres, language="English")
+        notify_catalog_changed(rebuild=True)
+        notify_genres_changed()
+
+    def test_summary_counts_values(self):
+        data = self.client.get("/api/books/filter-options/").json()
+        self.assertEqual(data["authors"], ["Ann", "Bob"])
+        self.assertEqual(data["counts"]["authors"], {"Ann": 2, "Bob": 1})
+        self.assertEqual([(g["name"], g["count"]) for g in data["genres"]], [("Fantasy", 2), ("Mystery", 1)])
+
+    def test_etag_revalidation(self):
+        etag = self.client.get("/api/books/filter-options/")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/books/filter-options/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        added = Book.objects.create(isbn="F4", title="F4", author="Cy", genres=["Mystery"])
+        notify_catalog_changed([added])
+        response = self.client.get("/api/books/filter-options/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["counts"]["authors"]["Cy"], 1)
+
+        etag = response["ETag"]
+        Genre.objects.create(name="Poetry")
+        notify_genres_changed()
+        response = self.client.get("/api/books/filter-options/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Poetry", [g["name"] for g in response.json()["genres"]])
+
+
+class DailyRollupTests(TestCase):
+
+    def test_nightly_run_finalizes_yesterday(self):
+        today = timezone.now().date()
+        yesterday = today - datetime.timedelta(days=1)
+        late = timezone.now() - datetime.timedelta(days=1)
+        first = Book.objects.create(title="Early", author="A", isbn="T1", rating=4.0)
+        Book.objects.filter(pk=first.pk).update(created_at=late)
+        User.objects.create_user("early@example.com", "pw", username="early", saved_book_ids=[first.id])
+        timeseries.rollup(1, today=yesterday)
+
+        # Created after yesterday's last run, rolled up by the next nightly run
+        second = Book.objects.create(title="Late", author="A", isbn="T2", rating=2.0)
+        Book.objects.filter(pk=second.pk).update(created_at=late)
+        Book.objects.create(title="Today", author="A", isbn="T3", rating=3.0)
+        call_command("rollup_daily_stats", stdout=io.StringIO())
+
+        rows = {row.day: row for row in DailyStats.objects.all()}
+        self.assertEqual((rows[yesterday].books_added, rows[yesterday].total_books), (2, 2))
+        self.assertEqual(rows[yesterday].avg_rating, 3.0)
+        self.assertEqual((rows[today].books_added, rows[today].total_books), (1, 3))
+        self.assertEqual((rows[today].total_users, rows[today].total_saves), (1, 1))
+        point = timeseries.series(2, today=today)[-1]
+        self.assertEqual((point["books_added"], point["users_registered"], point["saves"]), (1, 1, 0))
+
+
+class InternGenresTests(TestCase):
+
+    def setUp(self):
+        Genre.objects.create(name="Drama")
+        # Genres created by other tests were rolled back; reload the name map
+        notify_genres_changed()
+        Book.objects.create(title="A", author="X", isbn="G1", genres=["drama", "Space Opera"])
+
+    def test_dry_run_writes_nothing(self):
+        version = VersionToken.objects.filter(key="genres").values_list("token", flat=True).first()
+        out = io.StringIO()
+        call_command("intern_genres", "--dry-run", stdout=out)
+        self.assertIn("Genres that would be created: Space Opera", out.getvalue())
+        self.assertIn("1 of 1 books would change", out.getvalue())
+        self.assertEqual(list(Genre.objects.values_list("name", flat=True)), ["Drama"])
+        self.assertEqual(VersionToken.objects.filter(key="genres").values_list("token", flat=True).first(), version)
+        self.assertEqual(Book.objects.get(isbn="G1").genres, ["drama", "Space Opera"])
+
+    def test_backfill_creates_genres_and_ids(self):
+        call_command("intern_genres", stdout=io.StringIO())
+        book = Book.objects.get(isbn="G1")
+        self.assertEqual(book.genres, ["Drama", "Space Opera"])
+        self.assertEqual(book.genre_ids, [Genre.objects.get(name=name).id for name in book.genres])
+
+
+class PaginationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("pages@example.com", "pw", username="pages", is_admin=True))
+        Book.objects.bulk_create([Book(title=f"Book {i}", author="A", isbn=f"P{i}") for i in range(7)])
+        notify_catalog_changed(rebuild=True)
+
+    def test_keyset_pages_cover_the_catalog_once(self):
+        ids, after = [], None
+        while True:
+            params = {"limit": 3, **({"after": after} if after is not None else {})}
+            response = self.client.get("/api/admin/books/", params).json()
+            ids += [book["id"] for book in response["books"]]
+            after = response["next_after"]
+            if after is None:
+                break
+        self.assertEqual(ids, list(Book.objects.order_by("id").values_list("id", flat=True)))
+
+    def test_malformed_after_is_rejected(self):
+        for url in ("/api/admin/books/", "/api/admin/users/", "/api/books/explore/"):
+            response = self.client.get(url, {"after": "abc"})
+            self.assertEqual(response.status_code, 400, url)
+
+
+class AdminUserListTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("admin@example.com", "pw", username="admin", is_admin=True))
+        genre = Genre.objects.create(name="Fantasy")
+        book = Book.objects.create(title="Saved", author="A", isbn="U0")
+        for i in range(12):
+            user = User.objects.create_user(f"reader{i}@example.com", "pw", username=f"reader{i}")
+            user.favorite_genres.add(genre)
+            user.saved_books.add(book)
+
+    def queries(self, **params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get("/api/admin/users/", params)
+        self.assertEqual(response.status_code, 200)
+        return len(captured), response.json()
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        small, data = self.queries(limit=2)
+        large, _ = self.queries(limit=12)
+        legacy, everyone = self.queries()
+        self.assertEqual(small, large)
+        self.assertEqual(small, legacy)
+        self.assertEqual(len(data["users"]), 2)
+        self.assertEqual(len(everyone), 13)
+        self.assertEqual(everyone[1]["saved_books"], [Book.objects.get().id])
+
+    def test_pages_and_search(self):
+        _, first = self.queries(limit=5, include_total=1)
+        _, second = self.queries(limit=5, after=first["next_after"])
+        self.assertEqual(first["total_count"], 13)
+        self.assertTrue(second["has_more"])
+        self.assertFalse({u["id"] for u in first["users"]} & {u["id"] for u in second["users"]})
+        _, found = self.queries(q="READER1", include_total=1)
+        self.assertEqual(sorted(u["username"] for u in found["users"]), ["reader1", "reader10", "reader11"])
+        self.assertEqual(found["total_count"], 3)
+
+
+def full_scan_ranking(rows, favorite_genres, saved_ids, language, limit):
+    """Reference ranking: every unsaved book scored one by one with the recommended_books weights."""
+    books = {r[0]: r for r in rows}
+    saved = [books[i] for i in saved_ids if i in books]
+    saved_genres = {g for r in saved for g in r[5]}
+    saved_authors = {r[1] for r in saved if r[1]}
+    language = language.strip().lower()
+
+    def jaccard(genres, book_genres):
+        if not genres:
+            return 0.0
+        inter = len(genres & set(book_genres))
+        return inter / (len(genres) + len(set(book_genres)) - inter)
+
+    scored = []
+    for book_id, author, rating, liked, book_language, genres in rows:
+        if book_id in saved_ids:
+            continue
+        if not favorite_genres and not saved_ids:
+            scored.append((-rating, -liked, book_id))
+            continue
+        book_language = book_language.strip().lower()
+        score = (
+            recommender.W_FAVORITE_GENRES * jaccard(favorite_genres, genres) +
+            recommender.W_SAVED_GENRES * jaccard(saved_genres, genres) +
+            recommender.W_SAVED_AUTHORS * (author in saved_authors) +
+            recommender.W_RATING * min(rating / 5.0, 1.0) +
+            recommender.W_LIKED * min(liked / 100.0, 1.0) +
+            recommender.W_LANGUAGE * bool(book_language and book_language == language)
+        )
+        scored.append((-score, -rating, book_id))
+    return [key[2] for key in sorted(scored)[:limit]]
+
+
+class RecommenderTests(TestCase):
+
+    GENRES = ["Fantasy", "Mystery", "Sci-Fi", "Romance", "Horror", "Drama", "Poetry"]
+
+    def catalog_rows(self, n=400, seed=0):
+        rng = random.Random(seed)
+        return [
+            (i, rng.choice([f"Author {a}" for a in range(40)] + [""]), round(rng.uniform(0, 5), 1),
+             round(rng.uniform(0, 100)), rng.choice(["English", "french ", ""]),
+             rng.sample(self.GENRES, rng.randint(0, 3)))
+            for i in range(1, n + 1)
+        ]
+
+    def test_vectorized_ranking_equals_a_full_scan(self):
+        rows = self.catalog_rows()
+        # A short top-rated list keeps most books out of the candidates
+        with mock.patch.object(recommender, "TOP_RATED_SIZE", 20):
+            catalog = recommender.CatalogArrays(rows)
+        rng = random.Random(1)
+        for _ in range(50):
+            favorite_genres = set(rng.sample(self.GENRES, rng.randint(0, 2)))
+            saved_ids = set(rng.sample(range(1, len(rows) + 1), rng.randint(0, 6)))
+            language = rng.choice(["english", "French", ""])
+            limit = rng.choice([1, 4, 24])
+            self.assertEqual(
+                recommender.recommend(catalog, favorite_genres, saved_ids, language, limit),
+                full_scan_ranking(rows, favorite_genres, saved_ids, language, limit),
+                (favorite_genres, saved_ids, language, limit),
+            )
+
+    def test_top_k_orders_ties_like_a_full_sort(self):
+        rng = np.random.default_rng(0)
+        primary = rng.integers(0, 5, 300).astype(float)
+        secondary = rng.integers(0, 3, 300).astype(float)
+        ids = rng.permutation(300)
+        expected = sorted(range(300), key=lambda i: (-primary[i], -secondary[i], ids[i]))
+        for k in (0, 1, 7, 299, 300, 500):
+            self.assertEqual(recommender.top_k(primary, secondary, ids, k).tolist(), expected[:k])
+
+    def test_users_without_signals_get_the_top_rated_books(self):
+        rows = self.catalog_rows()
+        with mock.patch.object(recommender, "TOP_RATED_SIZE", 5):
+            catalog = recommender.CatalogArrays(rows)
+        # Beyond the precomputed top-rated list every book is ranked
+        for limit in (3, 12):
+            self.assertEqual(
+                recommender.recommend(catalog, set(), set(), "", limit),
+                full_scan_ranking(rows, set(), set(), "", limit),
+            )
+
+    def test_weak_candidates_fall_back_to_a_full_scan(self):
+        rows = self.catalog_rows()
+        # One book has the user's genre; the other candidates are the short top-rated list
+        rows.append((len(rows) + 1, "Lone Poet", 0.5, 0, "", ["Haiku"]))
+        with mock.patch.object(recommender, "TOP_RATED_SIZE", 2):
+            catalog = recommender.CatalogArrays(rows)
+        with mock.patch.object(recommender, "_score_rows", wraps=recommender._score_rows) as score:
+            ranked = recommender.recommend(catalog, {"Haiku"}, set(), "english", 10)
+        self.assertEqual(score.call_count, 2)
+        self.assertEqual(ranked, full_scan_ranking(rows, {"Haiku"}, set(), "english", 10))
+        self.assertEqual(ranked[0], len(rows))
+
+    def test_strong_candidates_skip_the_full_scan(self):
+        rows = self.catalog_rows()
+        with mock.patch.object(recommender, "TOP_RATED_SIZE", 20):
+            catalog = recommender.CatalogArrays(rows)
+        saved_ids = {rows[0][0], rows[1][0]}
+        with mock.patch.object(recommender, "_score_rows", wraps=recommender._score_rows) as score:
+            ranked = recommender.recommend(catalog, {"Fantasy", "Mystery"}, saved_ids, "english", 4)
+        self.assertEqual(score.call_count, 1)
+        self.assertEqual(ranked, full_scan_ranking(rows, {"Fantasy", "Mystery"}, saved_ids, "english", 4))
+
+    def test_postings_follow_catalog_patches(self):
+        rows = self.catalog_rows(50)
+        catalog = recommender.CatalogArrays(rows)
+        book = Book(id=51, title="New", author="Author 1", rating=5.0, genres=["Poetry"], language="English")
+        patched = catalog.patched([book], [rows[0][0]])
+        rebuilt = recommender.CatalogArrays(
+            rows[1:] + [(51, "Author 1", 5.0, 0.0, "English", ["Poetry"])]
+        )
+
+        def genre_rows(catalog):
+            return catalog.ids[catalog.postings({"Poetry"})].tolist()
+
+        def author_rows(catalog):
+            return catalog.ids[catalog.postings(author_codes=[catalog.author_index["Author 1"]])].tolist()
+
+        self.assertEqual(genre_rows(patched), genre_rows(rebuilt))
+        self.assertEqual(author_rows(patched), author_rows(rebuilt))
+        self.assertIn(51, genre_rows(patched))
+
+
+class PrecomputeRecommendationsTests(TestCase):
+
+    def setUp(self):
+        caches["recommendations"].clear()
+        Book.objects.bulk_create([
+            Book(title=f"Book {i}", author=f"Author {i % 4}", isbn=f"PR{i}", genres=[["Fantasy"], ["Horror"]][i % 2],
+                 rating=i % 5, language="English")
+            for i in range(30)
+        ])
+        notify_catalog_changed(rebuild=True)
+        self.user = User.objects.create_user("batch@example.com", "pw", username="batch", preferred_language="English")
+        self.user.favorite_genres.add(Genre.objects.create(name="Fantasy"))
+        self.user.saved_book_ids = list(Book.objects.order_by("id").values_list("id", flat=True)[:2])
+        self.user.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_ranking_is_served_until_the_user_changes(self):
+        call_command("precompute_recommendations", "--workers", "1", stdout=io.StringIO())
+        row = PrecomputedRecommendation.objects.get(user_id=self.user.id)
+        expected = recommender.recommend(
+            recommender.CatalogArrays.from_db(), {"Fantasy"}, set(self.user.saved_book_ids), "english",
+            recommender.MAX_RECOMMENDATIONS,
+        )
+        self.assertEqual(row.book_ids, expected)
+
+        # Served without scoring while the user's inputs are unchanged
+        PrecomputedRecommendation.objects.filter(pk=row.pk).update(book_ids=list(reversed(expected)))
+        response = self.client.get("/api/books/recommended/", {"limit": 24}).json()
+        self.assertEqual([book["id"] for book in response], list(reversed(expected)))
+
+        # A new save changes the fingerprint, so the stored ranking is ignored
+        caches["recommendations"].clear()
+        self.user.refresh_from_db()
+        self.user.saved_book_ids = self.user.saved_book_ids + [expected[0]]
+        self.user.save()
+        response = self.client.get("/api/books/recommended/", {"limit": 24}).json()
+        self.assertNotIn(expected[0], [book["id"] for book in response])
+
+
+class SimilarBooksTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("similar@example.com", "pw", username="similar"))
+        self.books = {}
+        for isbn, title, description, genres in [
+            ("M1", "Dragon Keep", "knights ride dragons over the burning keep", ["Fantasy"]),
+            ("M2", "Dragon Riders", "young knights learn to ride dragons", ["Fantasy"]),
+            ("M3", "Kitchen Notes", "recipes for bread and soup", ["Cooking"]),
+            ("M4", "Keep Cooking", "more soup and bread recipes", ["Cooking"]),
+        ]:
+            self.books[isbn] = Book.objects.create(
+                isbn=isbn, title=title, description=description, genres=genres, author="Someone", rating=3.0,
+            )
+        notify_catalog_changed(rebuild=True)
+
+    def similar_isbns(self, isbn, **params):
+        response = self.client.get(f"/api/books/{self.books[isbn].id}/similar/", params)
+        self.assertEqual(response.status_code, 200)
+        return [book["isbn"] for book in response.json()]
+
+    def test_closest_book_comes_first(self):
+        self.assertEqual(self.similar_isbns("M1")[0], "M2")
+        self.assertEqual(self.similar_isbns("M3")[0], "M4")
+        self.assertNotIn("M1", self.similar_isbns("M1"))
+
+    def test_deleted_books_are_not_suggested(self):
+        self.similar_isbns("M1")
+        deleted = self.books["M2"]
+        deleted_id = deleted.id
+        deleted.delete()
+        notify_catalog_changed(deleted_ids=[deleted_id])
+        self.assertNotIn("M2", self.similar_isbns("M1"))
+
+    def test_unknown_book_is_404(self):
+        self.assertEqual(self.client.get("/api/books/999999/similar/").status_code, 404)
+
+
+class AnnIndexTests(TestCase):
+
+    GENRES = ["Fantasy", "Mystery", "Romance", "Horror", "Poetry", "Drama"]
+
+    def catalog(self, n=400, seed=0):
+        rng = random.Random(seed)
+        return recommender.CatalogArrays([
+            (i, rng.choice([f"Author {a}" for a in range(20)] + [""]), round(rng.uniform(0, 5), 1),
+             round(rng.uniform(0, 100)), rng.choice(["English", "French", ""]),
+             rng.sample(self.GENRES, rng.randint(1, 3)))
+            for i in range(1, n + 1)
+        ])
+
+    def test_probed_query_recalls_exact_neighbours(self):
+        index = ann.AnnIndex.build(self.catalog())
+        found = total = 0
+        for book_id in range(1, 401, 20):
+            vector = index.vector_of(book_id)
+            exact = {bid for bid, _ in index.exact(vector, 10, exclude_ids={book_id})}
+            approx = index.query(vector, 10, probes=1, exclude_ids={book_id})
+            self.assertNotIn(book_id, [bid for bid, _ in approx])
+            self.assertEqual([score for _, score in approx], sorted((score for _, score in approx), reverse=True))
+            found += len(exact & {bid for bid, _ in approx})
+            total += len(exact)
+        self.assertGreaterEqual(found / total, 0.8)
+
+    def test_saved_index_loads_with_identical_results(self):
+        index = ann.AnnIndex.build(self.catalog(n=100))
+        with tempfile.TemporaryDirectory() as path:
+            index.save(path)
+            loaded = ann.AnnIndex.load(path)
+            vector = index.vector_of(7)
+            np.testing.assert_allclose(loaded.vector_of(7), vector)
+            self.assertEqual(loaded.query(vector, 5, probes=1), index.query(vector, 5, probes=1))
+        self.assertIsNone(index.vector_of(1000))
+
+    def test_similar_endpoint_uses_the_index_and_falls_back(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("ann@example.com", "pw", username="ann"))
+        for isbn, author, genres in [("N1", "Ann Author", ["Horror"]), ("N2", "Ann Author", ["Horror"]),
+                                     ("N3", "Other", ["Poetry"])]:
+            Book.objects.create(isbn=isbn, title=isbn, author=author, genres=genres, rating=4.0, language="English")
+        notify_catalog_changed(rebuild=True)
+        first = Book.objects.order_by("id").first()
+        with tempfile.TemporaryDirectory() as path:
+            call_command("build_ann_index", output=path, stdout=io.StringIO())
+            with mock.patch.object(ann, "_index", None):
+                ann.load_index(path)
+                response = client.get(f"/api/books/{first.id}/similar/", {"method": "ann"})
+                self.assertEqual(response.json()[0]["isbn"], "N2")
+
+                late = Book.objects.create(isbn="N4", title="Late", author="Ann Author", genres=["Horror"])
+                notify_catalog_changed([late])
+                response = client.get(f"/api/books/{late.id}/similar/", {"method": "ann"})
+                # Not indexed yet: TF-IDF answers instead
+                self.assertIn("N1", [book["isbn"] for book in response.json()])
@@ -0,0 +1,62 @@
+"""
+Text normalization and compact postings shared by the in-memory text indexes.
+"""
+import re
+import unicodedata
+from array import array
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her his in into is it its
+of on or she that the their they this to was were which will with
+""".split())
+
+
+def normalize(text):
+    """Lowercase and strip accents so "Émile" and "emile" compare equal."""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    """Word tokens of ``text`` without stopwords or single characters (no stemming)."""
+    return [t for t in TOKEN_RE.findall(normalize(text)) if len(t) > 1 and t not in STOPWORDS]
+
+
+class Postings:
+    """Append-only term -> (rows, values) lists backed by typed arrays.
+
+    Each term keeps two ``array.array`` buffers that grow in place (8 + 4
+    bytes per entry instead of two boxed Python objects). Removed documents
+    are not taken out of the lists; callers filter them with their own alive
+    mask.
+    """
+
+    def __init__(self, value_type="f"):
+        self.value_type = value_type
+        self._rows = {}
+        self._values = {}
+
+    def add(self, term, row, value):
+        rows = self._rows.get(term)
+        if rows is None:
+            rows = self._rows[term] = array("q")
+            self._values[term] = array(self.value_type)
+        rows.append(row)
+        self._values[term].append(value)
+
+    def get(self, term):
+        rows = self._rows.get(term)
+        if rows is None or not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=self.value_type)
+        # Copies, so no buffer export outlives the call and blocks later appends
+        return (
+            np.frombuffer(rows, dtype=np.int64).copy(),
+            np.frombuffer(self._values[term], dtype=self.value_type).copy(),
+        )
+
+    def __contains__(self, term):
+        return term in self._rows
@@ -0,0 +1,169 @@
+"""
+Trending search queries from a fixed-size heavy-hitters sketch.
+
+``search_books`` feeds every submitted query (``record=1``, not the prefixes
+of search-as-you-type), normalized, into a Space-Saving sketch of
+``CAPACITY`` counters: a new query takes over the smallest counter (keeping
+its count as the new query's possible overestimate), so memory stays fixed
+however many distinct queries arrive while frequent ones are never evicted.
+Every ``FLUSH_INTERVAL`` seconds the guaranteed part of each tracked count
+(count minus overestimate) that has not been written yet is added to the
+day's ``SearchQueryCount`` bucket, so counts survive restarts and add up
+across workers without logging individual searches. Trending queries are
+ranked by their buckets of the last ``TRENDING_DAYS`` days, so old volume
+does not keep a query on top; older buckets are deleted.
+"""
+import datetime
+import heapq
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import SearchQueryCount
+from .text import normalize
+
+logger = logging.getLogger('books')
+
+CAPACITY = getattr(settings, 'TRENDING_SKETCH_CAPACITY', 256)
+FLUSH_INTERVAL = getattr(settings, 'TRENDING_FLUSH_INTERVAL', 5 * 60)
+TRENDING_DAYS = 7
+# Queries kept per day
+MAX_STORED = 2000
+MAX_QUERY_LENGTH = 100
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    return _SPACES.sub(" ", normalize(query)).strip()[:MAX_QUERY_LENGTH]
+
+
+class SpaceSaving:
+    """Space-Saving top-k counters over a stream of items."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, item, weight=1):
+        """Count ``item``; returns the item it evicted, if any."""
+        if item in self.counts:
+            self.counts[item] += weight
+            return None
+        evicted = None
+        floor = 0
+        if len(self.counts) >= self.capacity:
+            evicted = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(evicted)
+            del self.errors[evicted]
+        self.counts[item] = floor + weight
+        self.errors[item] = floor
+        return evicted
+
+    def guaranteed(self, item):
+        """Lower bound of the true count of a tracked item."""
+        return self.counts[item] - self.errors[item]
+
+
+class Tracker:
+    """Sketch plus the bookkeeping of what has already been flushed."""
+
+    def __init__(self, capacity=CAPACITY):
+        self.sketch = SpaceSaving(capacity)
+        self.flushed = {}
+        self.last_flush = time.monotonic()
+
+    def record(self, query):
+        evicted = self.sketch.add(query)
+        if evicted is not None:
+            self.flushed.pop(evicted, None)
+
+    def pending(self):
+        """Unflushed guaranteed counts per tracked query."""
+        deltas = {}
+        for query in self.sketch.counts:
+            delta = self.sketch.guaranteed(query) - self.flushed.get(query, 0)
+            if delta > 0:
+                deltas[query] = delta
+        return deltas
+
+    def mark_flushed(self, deltas):
+        for query, delta in deltas.items():
+            self.flushed[query] = self.flushed.get(query, 0) + delta
+        self.last_flush = time.monotonic()
+
+    def due(self):
+        return time.monotonic() - self.last_flush >= FLUSH_INTERVAL
+
+
+def _store(deltas):
+    """Add ``deltas`` to today's counts, keep MAX_STORED queries a day and drop old days."""
+    today = timezone.now().date()
+    buckets = SearchQueryCount.objects.filter(day=today)
+    existing = {row.query: row for row in buckets.filter(query__in=list(deltas))}
+    for row in existing.values():
+        row.count += deltas[row.query]
+    if existing:
+        SearchQueryCount.objects.bulk_update(list(existing.values()), ['count'])
+    SearchQueryCount.objects.bulk_create([
+        SearchQueryCount(query=query, day=today, count=delta)
+        for query, delta in deltas.items() if query not in existing
+    ])
+    stale = list(buckets.order_by('-count').values_list('id', flat=True)[MAX_STORED:])
+    if stale:
+        SearchQueryCount.objects.filter(id__in=stale).delete()
+    SearchQueryCount.objects.filter(day__lte=today - datetime.timedelta(days=TRENDING_DAYS)).delete()
+
+
+def _window_totals(since, limit):
+    """Query -> count summed over the buckets since ``since``, for the ``limit`` largest."""
+    buckets = SearchQueryCount.objects.filter(day__gte=since)
+    try:
+        rows = buckets.values('query').annotate(total=Sum('count')).order_by('-total')[:limit]
+        return {row['query']: row['total'] for row in rows}
+    except Exception:
+        # Djongo can fail to translate aggregates on filtered querysets
+        logger.warning("annotate() failed, summing buckets instead", exc_info=True)
+        totals = {}
+        for query, count in buckets.values_list('query', 'count').iterator():
+            totals[query] = totals.get(query, 0) + count
+        return dict(heapq.nlargest(limit, totals.items(), key=lambda kv: kv[1]))
+
+
+_tracker = Tracker()
+_tracker_lock = threading.Lock()
+
+
+def record_search(query):
+    """Count a search; flushes to the database when FLUSH_INTERVAL has passed."""
+    query = normalize_query(query)
+    if len(query) < 2:
+        return
+    with _tracker_lock:
+        _tracker.record(query)
+        if not _tracker.due():
+            return
+        deltas = _tracker.pending()
+        # Claim the deltas up front so concurrent requests don't flush them twice
+        _tracker.mark_flushed(deltas)
+    if deltas:
+        try:
+            _store(deltas)
+        except Exception:
+            logger.exception("Failed to flush trending searches")
+
+
+def trending(k=5):
+    """The ``k`` most searched queries of the last TRENDING_DAYS days, including unflushed counts."""
+    since = timezone.now().date() - datetime.timedelta(days=TRENDING_DAYS - 1)
+    totals = _window_totals(since, k + CAPACITY)
+    with _tracker_lock:
+        for query, delta in _tracker.pending().items():
+            totals[query] = totals.get(query, 0) + delta
+    return [query for query, _ in heapq.nlargest(k, totals.items(), key=lambda kv: (kv[1], kv[0]))]
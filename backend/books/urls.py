@@ -16,6 +16,8 @@ urlpatterns = [
     path('users/me/', current_user_view, name='current-user'),
     path('users/saved-books/', get_saved_books, name='get-saved-books'),
     path("books/<int:book_id>/toggle-save/", toggle_save_book, name="toggle-save-book"),
+    path("books/<int:book_id>/also-saved/", also_saved_books, name="also-saved-books"),
+    path("books/<int:book_id>/similar/", similar_books, name="similar-books"),
     path('books/search/', search_books, name='search-books'),
     path('books/explore/', explore_books, name='explore-books'),
     path('books/<int:book_id>/', book_detail, name='book-detail'),
@@ -23,9 +25,12 @@ urlpatterns = [
     path('books/<int:book_id>/delete/', delete_book, name='delete-book'),
     path('books/add/', add_book, name='add-book'),
     path('dashboard/', dashboard_stats, name='dashboard-stats'),
+    path('dashboard/timeseries/', dashboard_timeseries, name='dashboard-timeseries'),
     path('admin/users/', get_all_users, name='get-all-users'),
     path('admin/users/<int:user_id>/delete/', delete_user, name='delete-user'),
+    path('admin/users/export/', export_users, name='export-users'),
     path('admin/books/', get_all_books, name='get-all-books'),
+    path('admin/books/export/', export_books, name='export-books'),
     path('admin/genres/add/', add_genre, name='add-genre'),
     path('admin/books/import-csv/', upload_books_csv_pandas, name='upload-books-csv'),
     path('books/filter-options/', get_filter_options, name='filter-options'),
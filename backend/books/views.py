@@ -1,11 +1,12 @@
 from django.contrib.auth import authenticate
 import logging
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Q, Count, Avg, F
+from django.db.models import Q, Count, Avg, F, Prefetch
 from django.db.models.functions import ExtractYear
 from .models import *
 from .serializers import *
@@ -14,6 +15,8 @@ import traceback
 # Import the pandas-based CSV upload function
 from .pandas_utils import upload_books_csv_pandas
 from .utils import send_otp_email
+from .signals import notify_catalog_changed, notify_genres_changed
+from . import recommender, cooccurrence, similarity, ann, search, fulltext, fuzzy, trending, pagination, facets, seen, filter_options, genres, stats, timeseries, export
 
 logger = logging.getLogger('books')
 
@@ -119,6 +122,7 @@ def register_view(request):
         except Exception as e:
             return Response({"detail": "Failed to create user"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    stats.users_changed(1)
     tokens = get_tokens_for_user(user)
     serializer = UserDetailSerializer(user)
     return Response(
@@ -168,9 +172,29 @@ def update_user_preferences(request):
     serializer = UserGenrePreferenceSerializer(data=request.data)
     if serializer.is_valid():
         serializer.update(request.user, serializer.validated_data)
+        recommender.invalidate_user(request.user.id)
         return Response({"detail": "Preferences updated successfully."}, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def _rank_books(user, limit):
+    """Ids of the user's ``limit`` best books, scored live against the catalog snapshot."""
+    # Gather user signals
+    favorite_genres = set(user.favorite_genres.values_list('name', flat=True))
+    preferred_language = (user.preferred_language or '').strip().lower()
+
+    # Use JSON list to avoid Djongo ManyToMany SQL issues
+    saved_ids = set(user.saved_book_ids or [])
+
+    co_saved = cooccurrence.co_save_scores(saved_ids) if recommender.W_ALSO_SAVED and saved_ids else None
+
+    # Rank, fall back and fill from one pass over the precomputed catalog arrays
+    catalog = recommender.get_catalog()
+    ann_rows = ann.recommendation_candidates(catalog, favorite_genres, saved_ids, preferred_language)
+    return recommender.recommend(
+        catalog, favorite_genres, saved_ids, preferred_language, limit,
+        co_saved=co_saved, ann_rows=ann_rows,
+    )
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def recommended_books(request):
@@ -183,7 +207,14 @@ def recommended_books(request):
     - Book rating normalized (0.15)
     - Liked percentage normalized (0.05)
     - Language match with user preference (0.05)
+    - Optional: co-saved with user's saved books (RECOMMENDATION_ALSO_SAVED_WEIGHT, off by default)
     Excludes books already saved by the user. Returns top 12.
+
+    Cursor paging is opt-in: ``?cursor=`` (empty) ranks up to
+    RANKING_DEPTH books once and returns ``{"results": [...], "next_cursor": ...}``;
+    passing ``next_cursor`` back serves the next ``limit`` books from the
+    ranking carried in the cursor. Without ``cursor`` the plain list response
+    is unchanged.
     """
     user = request.user
 
@@ -192,93 +223,42 @@ def recommended_books(request):
         limit = int(request.GET.get('limit', 4))
     except (TypeError, ValueError):
         limit = 4
-    limit = max(1, min(limit, 24))  # clamp to a reasonable range
-
-    # Gather user signals
-    favorite_genres = set(user.favorite_genres.values_list('name', flat=True))
-    preferred_language = (user.preferred_language or '').strip().lower()
-
-    # Use JSON list to avoid Djongo ManyToMany SQL issues
-    saved_ids = set(user.saved_book_ids or [])
-    saved_books_list = list(Book.objects.filter(id__in=saved_ids)) if saved_ids else []
-    saved_authors = set(b.author for b in saved_books_list if getattr(b, 'author', None))
-    saved_genres_union = set()
-    for sb in saved_books_list:
-        try:
-            for g in (sb.genres or []):
-                if isinstance(g, str):
-                    saved_genres_union.add(g)
-        except Exception:
-            pass
-
-    # Helper functions
-    def jaccard(a: set, b: set) -> float:
-        if not a and not b:
-            return 0.0
-        inter = a.intersection(b)
-        union = a.union(b)
-        return len(inter) / len(union) if union else 0.0
-
-    def clamp01(x: float) -> float:
-        return 0.0 if x is None else max(0.0, min(1.0, float(x)))
-
-    # We will score all non-saved books; optionally prefilter to any overlapping genre if user has favorites
-    candidates_qs = Book.objects.exclude(id__in=saved_ids)
-    candidates = list(candidates_qs)
-
-    scored = []
-    for b in candidates:
-        try:
-            b_genres = set([g for g in (b.genres or []) if isinstance(g, str)])
-        except Exception:
-            b_genres = set()
-
-        # Signals
-        fav_genre_sim = jaccard(favorite_genres, b_genres) if favorite_genres else 0.0
-        saved_genre_sim = jaccard(saved_genres_union, b_genres) if saved_genres_union else 0.0
-        author_match = 1.0 if (b.author and b.author in saved_authors) else 0.0
-        rating_norm = clamp01((b.rating or 0.0) / 5.0)
-        liked_norm = clamp01((b.liked_percentage or 0.0) / 100.0)
-        lang_match = 1.0 if (preferred_language and (b.language or '').strip().lower() == preferred_language) else 0.0
-
-        # Weights
-        score = (
-            0.40 * fav_genre_sim +
-            0.20 * saved_genre_sim +
-            0.15 * author_match +
-            0.15 * rating_norm +
-            0.05 * liked_norm +
-            0.05 * lang_match
-        )
-        scored.append((score, b))
-
-    # If we have absolutely no signals (new user), fall back to top-rated
-    if not favorite_genres and not saved_ids:
-        fallback_candidates = list(Book.objects.exclude(id__in=saved_ids))
-        fallback_sorted = sorted(
-            fallback_candidates,
-            key=lambda b: ((b.rating or 0.0), (b.liked_percentage or 0.0)),
-            reverse=True
-        )
-        books = fallback_sorted[:limit]
-    else:
-        # Sort by score desc, break ties by rating
-        scored.sort(key=lambda t: (t[0], getattr(t[1], 'rating', 0.0)), reverse=True)
-        books = [b for _, b in scored[:limit]]
-
-        # if too few candidates (tiny dataset), fill with top-rated non-saved
-        if len(books) < limit:
-            needed = limit - len(books)
-            filler_candidates = list(Book.objects.exclude(id__in=saved_ids.union({bk.id for bk in books})))
-            filler_sorted = sorted(
-                filler_candidates,
-                key=lambda b: ((b.rating or 0.0), (b.liked_percentage or 0.0)),
-                reverse=True
-            )
-            books.extend(filler_sorted[:needed])
+    limit = max(1, min(limit, recommender.MAX_RECOMMENDATIONS))  # clamp to a reasonable range
+
+    if 'cursor' in request.GET:
+        cursor = request.GET.get('cursor')
+        if not cursor:
+            cursor = recommender.encode_cursor(user.id, _rank_books(user, recommender.RANKING_DEPTH))
+        page = recommender.ranking_page(user.id, cursor, limit)
+        if page is None:
+            return Response({"error": "Invalid or expired cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        page_ids, next_cursor = page
+        by_id = Book.objects.in_bulk(page_ids)
+        books = [by_id[bid] for bid in page_ids if bid in by_id]
+        serializer = BookSerializer(books, many=True)
+        return Response({"results": serializer.data, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
+
+    # Cached ranking (computed at the maximum page size) serves every limit
+    cached = recommender.get_cached_recommendations(user)
+    if cached is not None:
+        return Response(cached[:limit], status=status.HTTP_200_OK)
+
+    # Ranking from the nightly batch, when the user's inputs haven't changed since
+    books = None
+    top_ids = recommender.get_precomputed_recommendations(user)
+    if top_ids:
+        by_id = Book.objects.in_bulk(top_ids)
+        if len(by_id) == len(set(top_ids)):
+            books = [by_id[bid] for bid in top_ids]
+
+    if books is None:
+        top_ids = _rank_books(user, recommender.MAX_RECOMMENDATIONS)
+        by_id = Book.objects.in_bulk(top_ids)
+        books = [by_id[bid] for bid in top_ids if bid in by_id]
 
     serializer = BookSerializer(books, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    recommender.cache_recommendations(user, serializer.data)
+    return Response(serializer.data[:limit], status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -323,34 +303,129 @@ def toggle_save_book(request, book_id):
         saved_list = [bid for bid in saved_list if bid != book.id]
         user.saved_book_ids = saved_list
         user.save(update_fields=['saved_book_ids'])
+        recommender.invalidate_user(user.id)
+        cooccurrence.record_unsave(saved_list, book.id)
         return Response({"message": "Book removed from saved list", "saved_books": saved_list}, status=status.HTTP_200_OK)
     else:
+        cooccurrence.record_save(saved_list, book.id)
         saved_list.append(book.id)
         # ensure uniqueness just in case
         user.saved_book_ids = list(dict.fromkeys(saved_list))
         user.save(update_fields=['saved_book_ids'])
+        recommender.invalidate_user(user.id)
         return Response({"message": "Book added to saved list", "saved_books": user.saved_book_ids}, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def also_saved_books(request, book_id):
+    """Books most often saved by the users who also saved this one."""
+    if not Book.objects.filter(pk=book_id).exists():
+        return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        limit = int(request.GET.get('limit', 8))
+    except (TypeError, ValueError):
+        limit = 8
+    limit = max(1, min(limit, 24))
+
+    neighbours = cooccurrence.also_saved(book_id, limit, exclude={book_id})
+    by_id = Book.objects.in_bulk([bid for bid, _ in neighbours])
+    books = [by_id[bid] for bid, _ in neighbours if bid in by_id]
+    serializer = BookSerializer(books, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def similar_books(request, book_id):
+    """Books closest to this one by TF-IDF cosine over title, description, genres and author.
+
+    ``?method=ann`` ranks by the approximate feature-vector index instead
+    (genres, author, language, rating); books missing from it fall back to TF-IDF.
+    """
+    if not Book.objects.filter(pk=book_id).exists():
+        return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        limit = int(request.GET.get('limit', 8))
+    except (TypeError, ValueError):
+        limit = 8
+    limit = max(1, min(limit, 24))
+
+    neighbours = []
+    if request.GET.get('method') == 'ann':
+        neighbours = ann.similar(book_id, limit)
+    if not neighbours:
+        neighbours = similarity.similar(book_id, limit)
+    by_id = Book.objects.in_bulk([bid for bid, _ in neighbours])
+    books = [by_id[bid] for bid, _ in neighbours if bid in by_id]
+    serializer = BookSerializer(books, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def search_books(request):
+    """Books whose title or author starts with ``q`` (case and accent insensitive), best rated first.
+
+    ``?mode=fulltext`` instead ranks books by BM25 over title, author,
+    description, genres and publisher, so any word of those fields matches.
+    ``?mode=fuzzy`` matches titles and authors by trigram similarity, keeping
+    those sharing at least ``threshold`` (0.2-1) of the query's trigrams.
+    ``?suggest=1`` wraps the list as ``{"results": [...], "did_you_mean": ...}``,
+    where ``did_you_mean`` is the closest title or author when nothing matched.
+    ``?record=1`` counts the query towards trending searches; clients send it
+    for submitted queries only, not for every prefix typed on the way.
+    """
     query = request.GET.get('q', '')
+    mode = request.GET.get('mode', 'prefix')
+    if mode not in ('prefix', 'fulltext', 'fuzzy'):
+        return Response({"error": "mode must be 'prefix', 'fulltext' or 'fuzzy'"}, status=status.HTTP_400_BAD_REQUEST)
+    suggest = request.GET.get('suggest') in ('1', 'true')
     if not query:
-        return Response([], status=status.HTTP_200_OK)
+        return Response({"results": [], "did_you_mean": None} if suggest else [], status=status.HTTP_200_OK)
+    if request.GET.get('record') in ('1', 'true'):
+        trending.record_search(query)
 
-    books = Book.objects.filter(
-        Q(title__istartswith=query) | Q(author__istartswith=query)
-    )
+    try:
+        limit = int(request.GET.get('limit', 50))
+    except (TypeError, ValueError):
+        limit = 50
+    limit = max(1, min(limit, 200))
+    try:
+        threshold = float(request.GET.get('threshold', fuzzy.THRESHOLD))
+    except (TypeError, ValueError):
+        threshold = fuzzy.THRESHOLD
+    threshold = max(fuzzy.MIN_THRESHOLD, min(threshold, 1.0))
+
+    if mode == 'fulltext':
+        top_ids = [bid for bid, _ in fulltext.search(query, limit)]
+    elif mode == 'fuzzy':
+        top_ids = fuzzy.fuzzy_search(query, limit, threshold)
+    else:
+        top_ids = search.prefix_search(query, limit)
+    by_id = Book.objects.in_bulk(top_ids)
+    books = [by_id[bid] for bid in top_ids if bid in by_id]
     serializer = BookSerializer(books, many=True)
+    if suggest:
+        did_you_mean = fuzzy.did_you_mean(query, threshold) if not books else None
+        return Response({"results": serializer.data, "did_you_mean": did_you_mean}, status=status.HTTP_200_OK)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def explore_books(request):
-    # Get pagination parameters
-    offset = int(request.GET.get('offset', 0))
-    limit = int(request.GET.get('limit', 4))
-
+    """Filtered catalog browsing.
+
+    Filters are evaluated on the in-memory facet bitmaps (see ``facets``),
+    which also give ``total_count`` and the per-facet value counts under
+    ``facets``. ``genre`` matches a genre name exactly (case-insensitive);
+    the other text filters match substrings. Pass ``after=<next_after>``
+    from the previous page for keyset paging; ``offset`` still works.
+
+    For "load more" scrolling, ``seen=`` (empty, plus the ids already shown
+    in ``exclude_ids``) starts a seen set and the response's signed ``seen``
+    token is passed back instead of a growing ``exclude_ids``; the next page
+    starts after the last book served. An invalid or expired token is a 400.
+    """
     # Get filter parameters
     author_filter = request.GET.get('author', '').strip()
     isbn_filter = request.GET.get('isbn', '').strip()
@@ -368,45 +443,45 @@ def explore_books(request):
         except (ValueError, TypeError):
             pass
 
-    # Start with base queryset
-    books_qs = Book.objects.all()
-    
-    # Exclude specified book IDs
-    if exclude_ids:
-        books_qs = books_qs.exclude(id__in=exclude_ids)
-
-    # Apply filters if provided
-    if author_filter:
-        books_qs = books_qs.filter(Q(author__icontains=author_filter))
+    # Seen set: ``seen=`` (empty) starts one, ``seen=<token>`` continues after its mark
+    seen_after = None
+    if 'seen' in request.GET:
+        seen_token = request.GET.get('seen', '').strip() or None
+        state = seen.lookup(request.user.id, seen_token) if seen_token else (None, ())
+        if state is None:
+            return Response({"error": "Invalid or expired seen token"}, status=status.HTTP_400_BAD_REQUEST)
+        seen_after, seen_ids = state
+        exclude_ids = seen.merge(seen_ids, exclude_ids)
+
+    filters = {
+        'author': author_filter,
+        'genre': genre_filter,
+        'published_year': published_year_filter,
+        'publisher': publisher_filter,
+        'language': language_filter,
+    }
+    filters = {name: value for name, value in filters.items() if value}
+    # ISBN is not a facet: its matches are looked up once and intersected
+    only_ids = None
     if isbn_filter:
-        books_qs = books_qs.filter(Q(isbn__icontains=isbn_filter))
-    if genre_filter:
-        books_qs = books_qs.filter(Q(genres__icontains=genre_filter))
-    if published_year_filter:
-        books_qs = books_qs.filter(Q(publish_date__year=published_year_filter))
-    if publisher_filter:
-        books_qs = books_qs.filter(Q(publisher__icontains=publisher_filter))
-    if language_filter:
-        books_qs = books_qs.filter(Q(language__icontains=language_filter))
-
-    # To avoid Djongo issues with count() after filtering, materialize the full list
-    # Note: This approach works for reasonably sized datasets but may need pagination
-    # at the database level for very large datasets
-    all_matching_books = list(books_qs)
-    total_count = len(all_matching_books)
-    
-    # Apply pagination in Python
-    paginated_books = all_matching_books[offset:offset + limit]
-
-    # Serialize the paginated results
-    serializer = BookSerializer(paginated_books, many=True)
-    has_more = (offset + limit) < total_count
-
-    return Response({
-        'books': serializer.data,
+        only_ids = list(Book.objects.filter(isbn__icontains=isbn_filter).values_list('id', flat=True))
+
+    limit, after, offset = pagination.params(request, default_limit=4)
+    if seen_after is not None:
+        after = seen_after if after is None else max(after, seen_after)
+    ids, has_more, total, facet_counts = facets.explore(filters, exclude_ids, limit, after, offset, only_ids)
+    books_by_id = Book.objects.in_bulk(ids)
+    page_books = [books_by_id[i] for i in ids if i in books_by_id]
+    response = {
+        'books': BookSerializer(page_books, many=True).data,
         'has_more': has_more,
-        'total_count': total_count
-    }, status=status.HTTP_200_OK)
+        'next_after': ids[-1] if has_more else None,
+        'total_count': total,
+        'facets': facet_counts,
+    }
+    if 'seen' in request.GET:
+        response['seen'] = seen.store(request.user.id, ids[-1] if ids else after, exclude_ids)
+    return Response(response, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -421,96 +496,67 @@ def book_detail(request, book_id):
 @permission_classes([IsAuthenticated])
 def dashboard_stats(request):
     try:
-        # Fetch all books and users once
-        books = list(Book.objects.all())
-        users = list(User.objects.all())
-
-        # Total counts
-        total_books = len(books)
-        total_users = len(users)
-
-        # Books added today (filter in Python)
-        today = datetime.date.today()
-        books_added_today = 0
-        for book in books:
-            if hasattr(book, "created_at") and book.created_at:
-                if book.created_at.date() == today:
-                    books_added_today += 1
-
-        # Average rating (filter in Python)
-        ratings = [book.rating for book in books if hasattr(book, "rating") and book.rating is not None]
-        avg_rating = round(sum(ratings) / len(ratings), 1) if ratings else 0
-
-        # Most popular genres (Python dict counting)
-        genre_stats = {}
-        for book in books:
-            if hasattr(book, "genres") and book.genres:
-                for genre in book.genres:
-                    genre_stats[genre] = genre_stats.get(genre, 0) + 1
-        most_popular_genres = sorted(genre_stats.items(), key=lambda x: x[1], reverse=True)[:5]
-        most_popular_genres = [genre for genre, count in most_popular_genres]
-
-        # Mock recent searches
-        recent_searches = ["fantasy", "mystery", "sci-fi", "romance", "thriller"]
-
-        # Top rated books this month (filter in Python)
-        thirty_days_ago = datetime.date.today() - datetime.timedelta(days=30)
-        recent_books = []
-        for book in books:
-            if hasattr(book, "updated_at") and book.updated_at:
-                if book.updated_at.date() >= thirty_days_ago:
-                    recent_books.append(book)
-
-        # Sort by rating desc, then created_at desc
-        recent_books_sorted = sorted(
-            recent_books, 
-            key=lambda b: (
-                getattr(b, "rating", 0) or 0,
-                getattr(b, "created_at", datetime.datetime.min)
-            ), 
-            reverse=True
-        )
+        # Aggregates cached per catalog version (see stats); no scan of the books or users
+        totals = stats.catalog_totals()
 
-        # Take top 4
-        top_rated_books = recent_books_sorted[:4]
-
-        # Fallback: add latest books if less than 4
-        if len(top_rated_books) < 4:
-            top_ids = [b.id for b in top_rated_books]
-            other_books = [b for b in books if b.id not in top_ids]
-            other_books_sorted = sorted(
-                other_books, 
-                key=lambda b: getattr(b, "created_at", datetime.datetime.min), 
-                reverse=True
-            )
-            top_rated_books = top_rated_books + other_books_sorted[:4 - len(top_rated_books)]
+        # Most popular genres, from the facet index's per-genre book counts
+        most_popular_genres = [row['value'] for row in facets.value_counts('genre', 5)]
 
-        # Serialize final list
-        serializer = BookSerializer(top_rated_books, many=True)
+        # Most searched queries of the past week (heavy-hitters sketch + flushed counts)
+        recent_searches = trending.trending(5)
+
+        # Top rated books this month, latest books as a fallback
+        serializer = BookSerializer(stats.top_rated_recent(4), many=True)
 
         return Response({
-            'total_books': total_books,
-            'total_users': total_users,
-            'books_added_today': books_added_today,
-            'avg_rating': avg_rating,
+            'total_books': totals['total_books'],
+            'total_users': stats.user_count(),
+            'books_added_today': totals['books_added_today'],
+            'avg_rating': totals['avg_rating'],
             'most_popular_genres': most_popular_genres,
             'recent_searches': recent_searches,
-            'top_rated_books': serializer.data
+            'top_rated_books': serializer.data,
+            'search_cache': search.cache_stats(),
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
         logger.exception("Error computing dashboard stats")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dashboard_timeseries(request):
+    # Served from the DailyStats buckets written by rollup_daily_stats
+    try:
+        days = int(request.GET.get('days', timeseries.DEFAULT_DAYS))
+    except ValueError:
+        days = timeseries.DEFAULT_DAYS
+    days = max(1, min(days, timeseries.MAX_DAYS))
+    return Response({'days': days, 'series': timeseries.series(days)}, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_all_users(request):
     if not request.user.is_admin:
         return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
 
-    users = User.objects.all()
-    serializer = UserDetailSerializer(users, many=True)
-    return Response(serializer.data)
+    # One batched query each for the page's genres and legacy saved books
+    users_qs = User.objects.prefetch_related(
+        'favorite_genres', Prefetch('saved_books', queryset=Book.objects.only('id')),
+    )
+    search_query = request.GET.get('q', '').strip()
+    if search_query:
+        users_qs = users_qs.filter(Q(email__istartswith=search_query) | Q(username__istartswith=search_query))
+
+    # Legacy form: the whole list as an array, unless paging or search is asked for
+    if not any(name in request.GET for name in ('q', 'limit', 'offset', 'after')):
+        return Response(AdminUserSerializer(users_qs.order_by('id'), many=True).data)
+
+    page_users, has_more, meta = pagination.page(users_qs, request, default_limit=25)
+    response = {'users': AdminUserSerializer(page_users, many=True).data, 'has_more': has_more, **meta}
+    if 'offset' in meta or pagination.wants_total(request):
+        response['total_count'] = users_qs.count() if search_query else stats.user_count()
+    return Response(response)
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
@@ -521,6 +567,7 @@ def delete_user(request, user_id):
     try:
         user = User.objects.get(pk=user_id)
         user.delete()
+        stats.users_changed(-1)
         return Response({"message": "User deleted successfully"}, status=status.HTTP_200_OK)
     except User.DoesNotExist:
         return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -533,8 +580,6 @@ def get_all_books(request):
 
     # Get query parameters
     search_query = request.GET.get('q', '').strip()
-    offset = int(request.GET.get('offset', 0))
-    limit = int(request.GET.get('limit', 10))
 
     # Start with base queryset
     books_qs = Book.objects.all()
@@ -548,26 +593,40 @@ def get_all_books(request):
             Q(isbn__icontains=search_query)
         )
 
-    # To avoid Djongo issues with count() after filtering, materialize the full list
-    all_matching_books = list(books_qs)
-    total_count = len(all_matching_books)
-    
-    # Apply pagination in Python
-    paginated_books = all_matching_books[offset:offset + limit]
+    # Paged in the database (offset, or keyset with ?after=)
+    paginated_books, has_more, meta = pagination.page(books_qs, request, default_limit=10)
 
     # Serialize the paginated results
     serializer = BookSerializer(paginated_books, many=True)
 
-    # Check if there are more results
-    has_more = (offset + limit) < total_count
+    response = {'books': serializer.data, 'has_more': has_more, **meta}
+    if 'offset' in meta or pagination.wants_total(request):
+        response['total_count'] = pagination.cached_count(books_qs, ('admin-books', search_query))
+    return Response(response)
+
+def _export_response(request, kind):
+    # ?fmt= rather than ?format=, which DRF reserves for renderer selection
+    fmt = request.GET.get('fmt', 'csv').lower()
+    if fmt not in export.FORMATS:
+        return Response({"error": f"fmt must be one of: {', '.join(export.FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(export.stream(kind, fmt), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{kind}-{datetime.date.today():%Y%m%d}.{fmt}"'
+    return response
 
-    return Response({
-        'books': serializer.data,
-        'has_more': has_more,
-        'total_count': total_count,
-        'offset': offset,
-        'limit': limit
-    })
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_books(request):
+    if not request.user.is_admin:
+        return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
+    return _export_response(request, 'books')
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_users(request):
+    if not request.user.is_admin:
+        return Response({"error": "Admin access required"}, status=status.HTTP_403_FORBIDDEN)
+    return _export_response(request, 'users')
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -577,7 +636,8 @@ def add_book(request):
 
     serializer = BookSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save()
+        book = serializer.save(**genres.intern_genres(serializer.validated_data.get('genres', [])))
+        notify_catalog_changed(books=[book])
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -591,7 +651,8 @@ def edit_book(request, book_id):
         book = Book.objects.get(pk=book_id)
         serializer = BookSerializer(book, data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            book = serializer.save(**genres.intern_genres(serializer.validated_data.get('genres', [])))
+            notify_catalog_changed(books=[book])
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     except Book.DoesNotExist:
@@ -606,6 +667,7 @@ def delete_book(request, book_id):
     try:
         book = Book.objects.get(pk=book_id)
         book.delete()
+        notify_catalog_changed(deleted_ids=[book_id])
         return Response({"message": "Book deleted successfully"}, status=status.HTTP_200_OK)
     except Book.DoesNotExist:
         return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -636,6 +698,8 @@ def add_genre(request):
     for n in names:
         obj, was_created = Genre.objects.get_or_create(name=n.strip())
         (created if was_created else existing).append(obj.name)
+    if created:
+        notify_genres_changed()
 
     return Response({
         "created": created,
@@ -646,27 +710,21 @@ def add_genre(request):
 @permission_classes([IsAuthenticated])
 def get_filter_options(request):
     """
-    Get unique filter options for the book explorer
-    Returns unique authors, publishers, genres, and publication years
+    Get filter options for the book explorer: the most common authors and
+    publishers, all languages and publication years, the genres, and value
+    counts under ``counts``. Served from memory (see ``filter_options``) with
+    an ETag; a matching If-None-Match gets 304 Not Modified.
     """
     try:
-        # Get unique authors (limit to top 50 for performance)
-        authors = Book.objects.values_list('author', flat=True).distinct().order_by('author')[:50]
-        
-        # Get unique publishers (limit to top 50 for performance)
-        
-        # Get unique languages
-        languages = Book.objects.values_list('language', flat=True).distinct().order_by('language')
-        
-        # Get all genres
-        genre_objects = Genre.objects.all().order_by('name')
-        genres = [{"id": genre.id, "name": genre.name} for genre in genre_objects]
-        
-        return Response({
-            "authors": list(authors),
-            "genres": genres,
-            "languages": list(languages)
-        }, status=status.HTTP_200_OK)
+        if request.headers.get('If-None-Match') == filter_options.current_etag():
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = request.headers['If-None-Match']
+            return response
+        payload, etag = filter_options.summary()
+        response = Response(payload, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
@@ -8,12 +8,16 @@ import BookCard from '@/components/BookCard';
 import { apiService } from '@/services/services.api';
 import { Book, User } from '@/types/api';
 
+// Idle time after which the typed query counts as submitted
+const SETTLE_DELAY = 2000;
+
 const SearchPage = () => {
   const [query, setQuery] = useState('');
   const [results, setResults] = useState<Book[]>([]);
   const [isLoading, setIsLoading] = useState(false);
   const [hasSearched, setHasSearched] = useState(false);
   const [currentUser, setCurrentUser] = useState<User | null>(null);
+  const lastRecorded = useRef('');
 
   useEffect(() => {
     loadUserData();
@@ -28,16 +32,22 @@ const SearchPage = () => {
 
   // Debounced search function
   const performSearch = useCallback(
-    async (searchQuery: string) => {
+    async (searchQuery: string, record = false) => {
       if (!searchQuery.trim() || searchQuery.length < 2) {
         setResults([]);
         setIsLoading(false);
         return;
       }
 
+      // Record each submitted query once (Enter, then the settle timer)
+      if (record) {
+        record = lastRecorded.current !== searchQuery.trim();
+        lastRecorded.current = searchQuery.trim();
+      }
+
       setIsLoading(true);
       try {
-        const response = await apiService.searchBooks({ query: searchQuery.trim() });
+        const response = await apiService.searchBooks({ query: searchQuery.trim(), record });
         if (response.ok && response.data) {
           setResults(response.data);
         } else {
@@ -53,19 +63,32 @@ const SearchPage = () => {
     []
   );
 
-  // Effect to trigger search with debounce
+  // Effect to trigger search with debounce; a query left unchanged for
+  // SETTLE_DELAY counts as submitted and is recorded for trending searches
   useEffect(() => {
     const timeoutId = setTimeout(() => {
       performSearch(query);
     }, 300); // 300ms debounce
+    const settleId = setTimeout(() => {
+      if (lastRecorded.current !== query.trim()) performSearch(query, true);
+    }, SETTLE_DELAY);
 
-    return () => clearTimeout(timeoutId);
+    return () => {
+      clearTimeout(timeoutId);
+      clearTimeout(settleId);
+    };
   }, [query, performSearch]);
 
   const handleInputChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     setQuery(e.target.value);
   };
 
+  const handleKeyDown = (e: React.KeyboardEvent<HTMLInputElement>) => {
+    if (e.key === 'Enter') {
+      performSearch(query, true);
+    }
+  };
+
   const refreshUserData = async () => {
     try {
       const user = await apiService.getCurrentUserDetails();
@@ -108,6 +131,7 @@ const SearchPage = () => {
                   placeholder="Start typing to search books by title or author..."
                   value={query}
                   onChange={handleInputChange}
+                  onKeyDown={handleKeyDown}
                   className="h-12 pl-10 text-lg"
                 />
                 {query.length > 0 && query.length < 2 && (
@@ -15,6 +15,7 @@ const UserDashboard = () => {
   const [isLoading, setIsLoading] = useState(true);
   const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [currentUser, setCurrentUser] = useState<User | null>(null);
+  const [seenToken, setSeenToken] = useState<string | null>(null);
 
   useEffect(() => {
     loadDashboardData();
@@ -55,18 +56,25 @@ const UserDashboard = () => {
 
     setIsLoadingMore(true);
     try {
-      // Pass existing book IDs to backend to exclude them from results
-      const existingIds = recommendations.map(b => b.id);
-      
-      // Fetch 4 more unique books (backend will exclude the IDs we already have)
-      const response = await apiService.exploreBooks({ 
-        offset: 0, 
+      // The first request sends the ids already shown; later ones only the seen token
+      const request = (token: string | null) => apiService.exploreBooks({
+        offset: 0,
         limit: 4,
-        exclude_ids: existingIds 
+        ...(token
+          ? { seen: token }
+          : { exclude_ids: recommendations.map(b => b.id), seen: '' }),
       });
-      
+
+      let response = await request(seenToken);
+      if (!response.ok && seenToken && response.status === 400) {
+        // Expired or invalid seen token: start a new set from the shown ids
+        setSeenToken(null);
+        response = await request(null);
+      }
+
       if (response.ok && response.data && Array.isArray(response.data.books)) {
-        const data: { books: Book[] } = response.data;
+        const data: { books: Book[]; seen?: string } = response.data;
+        if (data.seen) setSeenToken(data.seen);
         setRecommendations(prevBooks => [...prevBooks, ...data.books]);
       }
     } catch (error) {
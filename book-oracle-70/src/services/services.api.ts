@@ -29,7 +29,7 @@ async function handleResponse(res: Response) {
   try {
     if (!res.ok) {
       const errorData = await res.json().catch(() => ({}));
-      return { ok: false, error: errorData.detail || errorData.error || res.statusText };
+      return { ok: false, status: res.status, error: errorData.detail || errorData.error || res.statusText };
     }
     const data = await res.json();
     return { ok: true, data };
@@ -157,8 +157,11 @@ export const apiService = {
   },
 
   // Books
-  async searchBooks(params: { query?: string }) {
-    const queryString = params.query ? `?q=${encodeURIComponent(params.query)}` : "";
+  // record: count the query towards trending searches (submitted queries only)
+  async searchBooks(params: { query?: string; record?: boolean }) {
+    const queryString = params.query
+      ? `?q=${encodeURIComponent(params.query)}${params.record ? "&record=1" : ""}`
+      : "";
     return authFetch(`${API_BASE}/books/search/${queryString}`);
   },
 
@@ -222,8 +225,9 @@ export const apiService = {
     publisher?: string;
     language?: string;
     exclude_ids?: number[];
+    seen?: string;
   }) {
-    const { offset, limit, author, isbn, genre, published_year, publisher, language, exclude_ids } = params;
+    const { offset, limit, author, isbn, genre, published_year, publisher, language, exclude_ids, seen } = params;
     
     let queryString = `?offset=${offset}&limit=${limit}`;
     if (author) queryString += `&author=${encodeURIComponent(author)}`;
@@ -235,6 +239,8 @@ export const apiService = {
     if (exclude_ids && exclude_ids.length > 0) {
       queryString += `&exclude_ids=${exclude_ids.join(',')}`;
     }
+    // Server-side seen set: "" starts one, the returned token continues it
+    if (seen !== undefined) queryString += `&seen=${encodeURIComponent(seen)}`;
     
     return authFetch(`${API_BASE}/books/explore/${queryString}`);
   },